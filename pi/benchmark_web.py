@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Web Interface Benchmark for EmmaPhone2 Pi
+
+Simulates several browser tabs against a running Pi web server: each client
+loads pages and polls the JSON API while a set of Socket.IO clients stay
+subscribed to the live topics. Reports request latency percentiles per
+endpoint, throughput, Socket.IO update rate and, when the server's PID is
+given (run on the Pi), its CPU usage over the run.
+
+Before the load it measures page-load bytes: each page plus the static files
+it links, fetched as a browser would on a first visit and again on a repeat
+visit (revalidating with If-None-Match, skipping immutable versioned URLs).
+
+Compare the two servers by running the app once with
+"web_server": {"server": "flask"} and once with {"server": "aiohttp"}:
+
+    python3 benchmark_web.py --url http://localhost:8080 --pid $(pgrep -f src/main.py)
+"""
+import argparse
+import asyncio
+import gzip
+import os
+import re
+import statistics
+import time
+from collections import defaultdict
+
+import aiohttp
+import socketio
+
+# Weighted mix of what the dashboard and status pages request
+REQUEST_MIX = [
+    ("GET", "/", 1),
+    ("GET", "/status", 1),
+    ("GET", "/config", 1),
+    ("GET", "/static/style.css", 1),
+    ("GET", "/api/status", 4),
+    ("GET", "/api/audio/level", 4),
+    ("GET", "/api/call/network", 2),
+    ("GET", "/api/metrics", 2),
+    ("GET", "/api/recordings", 1),
+]
+
+PAGES = ["/", "/setup", "/contacts", "/status", "/config"]
+
+BROWSER_HEADERS = {"Accept-Encoding": "gzip, deflate, br"}
+
+STATIC_LINK = re.compile(r'(?:href|src)="(/static/[^"]+)"')
+
+def _cpu_seconds(pid: int) -> float:
+    """User + system CPU time of a process, from /proc"""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+async def fetch_wire(session, url, cache):
+    """Fetch like a browser with an HTTP cache; returns bytes on the wire (headers excluded)"""
+    cached = cache.get(url)
+    if cached and "immutable" in cached["cache_control"]:
+        return 0, 0
+    headers = dict(BROWSER_HEADERS)
+    if cached and cached["etag"]:
+        headers["If-None-Match"] = cached["etag"]
+    async with session.get(url, headers=headers) as response:
+        body = await response.read()
+        if response.status == 200:
+            cache[url] = {"etag": response.headers.get("ETag"),
+                          "cache_control": response.headers.get("Cache-Control", ""),
+                          "body": body,
+                          "encoding": response.headers.get("Content-Encoding")}
+        return len(body), 1
+
+async def measure_page_loads(base_url):
+    """Wire bytes and requests per page on a first and a repeat visit"""
+    results = {}
+    # Raw bodies, so compressed responses are counted as sent
+    async with aiohttp.ClientSession(auto_decompress=False) as session:
+        for page in PAGES:
+            cache = {}
+            visits = []
+            for _ in range(2):
+                total_bytes, requests = await fetch_wire(session, base_url + page, cache)
+                entry = cache.get(base_url + page)
+                html = entry["body"] if entry else b""
+                if entry and entry["encoding"] == "gzip":
+                    html = gzip.decompress(html)
+                for link in sorted(set(STATIC_LINK.findall(html.decode("utf-8", "replace")))):
+                    size, count = await fetch_wire(session, base_url + link, cache)
+                    total_bytes += size
+                    requests += count
+                visits.append((total_bytes, requests))
+            results[page] = visits
+    return results
+
+async def http_client(session, base_url, deadline, latencies, errors):
+    """One browser tab issuing requests back to back"""
+    schedule = [(method, path) for method, path, weight in REQUEST_MIX for _ in range(weight)]
+    index = 0
+    while time.monotonic() < deadline:
+        method, path = schedule[index % len(schedule)]
+        index += 1
+        started = time.perf_counter()
+        try:
+            async with session.request(method, base_url + path) as response:
+                await response.read()
+                if response.status >= 500:
+                    errors[path] += 1
+        except Exception:
+            errors[path] += 1
+            continue
+        latencies[path].append((time.perf_counter() - started) * 1000.0)
+
+async def socket_client(base_url, deadline, updates):
+    """One tab subscribed to the live topics"""
+    client = socketio.AsyncClient()
+
+    @client.on('topic_update')
+    async def on_update(update):
+        updates[update["topic"]] += 1
+
+    await client.connect(base_url, transports=['websocket'])
+    await client.emit('subscribe', {'topics': ['call', 'user', 'wifi', 'levels', 'metrics']})
+    await asyncio.sleep(max(0.0, deadline - time.monotonic()))
+    await client.disconnect()
+
+async def run_benchmark(args):
+    """Run the load and print the results"""
+
+    print("🧪 EmmaPhone2 Pi Web Interface Benchmark")
+    print("=" * 50)
+    print(f"Target: {args.url}  clients: {args.clients}  sockets: {args.sockets}  duration: {args.duration}s")
+
+    page_loads = await measure_page_loads(args.url)
+    print(f"\n{'page':32} {'first visit':>16} {'repeat visit':>16}")
+    for page, ((first_bytes, first_requests), (repeat_bytes, repeat_requests)) in page_loads.items():
+        print(f"{page:32} {first_bytes:9d} B /{first_requests:2d} {repeat_bytes:9d} B /{repeat_requests:2d}")
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    updates = defaultdict(int)
+
+    cpu_before = _cpu_seconds(args.pid) if args.pid else None
+    started = time.monotonic()
+    deadline = started + args.duration
+
+    connector = aiohttp.TCPConnector(limit=args.clients)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        tasks = [http_client(session, args.url, deadline, latencies, errors) for _ in range(args.clients)]
+        tasks += [socket_client(args.url, deadline, updates) for _ in range(args.sockets)]
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    elapsed = time.monotonic() - started
+    total = sum(len(values) for values in latencies.values())
+
+    print(f"\n{'endpoint':32} {'count':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for _, path, _ in REQUEST_MIX:
+        values = latencies.get(path)
+        if not values:
+            print(f"{path:32} {0:7d} {'-':>8} {'-':>8} {'-':>8} {errors[path]:7d}")
+            continue
+        print(f"{path:32} {len(values):7d} {statistics.median(values):8.1f} "
+              f"{_percentile(values, 0.95):8.1f} {_percentile(values, 0.99):8.1f} {errors[path]:7d}")
+
+    print(f"\n📊 Throughput: {total / elapsed:.1f} requests/s")
+    if args.sockets:
+        print("📡 Socket.IO updates: " +
+              ", ".join(f"{topic} {count / elapsed / args.sockets:.1f}/s" for topic, count in sorted(updates.items())))
+    if args.pid:
+        cpu = (_cpu_seconds(args.pid) - cpu_before) / elapsed * 100.0
+        print(f"🖥️  Server CPU: {cpu:.1f}% of one core ({cpu / max(total / elapsed, 1e-9) * 10:.2f} ms CPU per request)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the EmmaPhone2 Pi web interface")
+    parser.add_argument("--url", default="http://localhost:8080")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent HTTP clients")
+    parser.add_argument("--sockets", type=int, default=4, help="concurrent Socket.IO subscribers")
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--pid", type=int, default=None, help="server process id for CPU measurement")
+    asyncio.run(run_benchmark(parser.parse_args()))
@@ -45,16 +45,12 @@ async def debug_session():
             
             # Now test a simple API call to check session
             print(f"\n🔍 Testing session with /api/auth/me...")
-            url = f"{user_manager.web_api.base_url}/api/auth/me"
-            
-            async with user_manager.web_api.session.get(url) as response:
-                print(f"Status: {response.status}")
-                if response.status == 200:
-                    me_data = await response.json()
-                    print(f"✅ Session working - /api/auth/me returned: {me_data}")
-                else:
-                    text = await response.text()
-                    print(f"❌ Session failed - /api/auth/me returned: {response.status} - {text}")
+            response = await user_manager.web_api.get_me()
+            print(f"Status: {response.status}")
+            if response.status == 200:
+                print(f"✅ Session working - /api/auth/me returned: {response.json()}")
+            else:
+                print(f"❌ Session failed - /api/auth/me returned: {response.status} - {response.text()}")
             
             # Now test the call initiation with debug
             print(f"\n📞 Testing call initiation with session debug...")
@@ -66,15 +62,12 @@ async def debug_session():
                     "toUser": toUser_value
                 }
                 
-                url = f"{user_manager.web_api.base_url}/api/initiate-call"
+                response = await user_manager.web_api.request("POST", "initiate-call", json=call_data)
+                print(f"Call API Status: {response.status}")
+                print(f"Call API Response: {response.text()}")
                 
-                async with user_manager.web_api.session.post(url, json=call_data) as response:
-                    print(f"Call API Status: {response.status}")
-                    result = await response.text()
-                    print(f"Call API Response: {result}")
-                    
-                    if response.status != 404:
-                        break  # Success, stop testing
+                if response.status != 404:
+                    break  # Success, stop testing
                 
         else:
             print("❌ User authentication failed")
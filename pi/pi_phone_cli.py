@@ -67,9 +67,9 @@ class PiPhoneCLI:
             if not success:
                 return False
         
-        # Authenticate user
+        # Authenticate user (reuses the saved session when it is still valid)
         print("🔐 Authenticating user...")
-        auth_result = await self.user_manager.authenticate_user()
+        auth_result = await self.user_manager.start_session()
         
         if auth_result:
             self.authenticated_user = auth_result
@@ -158,11 +158,15 @@ class PiPhoneCLI:
             web_config = self.settings.get_web_client_config()
             self.socket_manager = WebClientSocket(
                 web_config["url"], 
-                web_config["socket_endpoint"]
+                web_config["socket_endpoint"],
+                **web_config.get("socket", {})
             )
+            self.socket_manager.http = self.web_api.http
             
-            await self.socket_manager.initialize(self.authenticated_user["user_id"])
-            print("✅ Real-time connection established")
+            if await self.socket_manager.initialize(self.authenticated_user["user_id"]):
+                print("✅ Real-time connection established")
+            else:
+                print("⚠️ Real-time connection not available yet, retrying in background")
             
             # Start background task to monitor Socket.IO events
             asyncio.create_task(self.socket_event_handler())
@@ -181,16 +185,12 @@ class PiPhoneCLI:
     async def refresh_online_users(self):
         """Get list of online users from server"""
         try:
-            # For now, we'll get all users (in future, server could provide online status)
-            # This is a placeholder - we'd need server API for online users
-            response = await self.web_api.session.get(f"{self.web_api.base_url}/api/users/search?q=")
-            if response.status == 200:
-                all_users = await response.json()
-                # Filter out current user
-                self.online_users = [u for u in all_users if u['id'] != self.authenticated_user['user_id']]
-                self.last_refresh = datetime.now()
-            else:
-                print(f"⚠️ Failed to get user list: {response.status}")
+            # Everything the server will list plus our contacts, merged into the local index
+            await self.user_manager.user_search.refresh(self.web_api)
+            self.online_users = self.user_manager.user_search.all_users(
+                exclude=self.authenticated_user['user_id']
+            )
+            self.last_refresh = datetime.now()
                 
         except Exception as e:
             print(f"⚠️ Failed to refresh users: {e}")
@@ -210,7 +210,7 @@ class PiPhoneCLI:
         web_config = self.settings.get_web_client_config()
         print(f"🌐 Web Server: {web_config['url']}")
         
-        socket_status = "✅ Connected" if self.socket_manager else "❌ Disconnected"
+        socket_status = "✅ Connected" if self.socket_manager and self.socket_manager.connected else "❌ Disconnected"
         print(f"📡 Socket.IO: {socket_status}")
         
         if self.last_refresh:
@@ -305,8 +305,8 @@ class PiPhoneCLI:
         print("📋 Speed Dial Management")
         print("-" * 25)
         
-        # Show current speed dial contacts
-        contacts = self.settings.get_contacts()
+        # Show current speed dial contacts (local directory, no network)
+        contacts = self.user_manager.contacts.speed_dial_contacts()
         print("Current Speed Dial:")
         for pos in range(1, 5):
             contact = next((c for c in contacts if c.get('speed_dial') == pos), None)
@@ -348,7 +348,7 @@ class PiPhoneCLI:
         print("-" * 25)
         
         # Get available positions
-        contacts = self.settings.get_contacts()
+        contacts = self.user_manager.contacts.speed_dial_contacts()
         occupied_positions = [c.get('speed_dial') for c in contacts if c.get('speed_dial')]
         available_positions = [p for p in range(1, 5) if p not in occupied_positions]
         
@@ -365,21 +365,11 @@ class PiPhoneCLI:
             
             print("🔍 Searching for users...")
             
-            # Search users via API
-            response = await self.web_api.session.get(
-                f"{self.web_api.base_url}/api/users/search?q={search_term}"
+            # Ranked local matches; the server is only asked for what the index can't answer
+            users = await self.user_manager.user_search.search(
+                self.web_api, search_term, limit=20, exclude=self.authenticated_user['user_id']
             )
             
-            if response.status != 200:
-                print("❌ Failed to search users")
-                input("Press Enter to continue...")
-                return
-            
-            users = await response.json()
-            
-            # Filter out current user
-            users = [u for u in users if u['id'] != self.authenticated_user['user_id']]
-            
             if not users:
                 print(f"❌ No users found matching '{search_term}'")
                 input("Press Enter to continue...")
@@ -417,7 +407,7 @@ class PiPhoneCLI:
                 return
             
             # Add contact
-            self.settings.add_contact(display_name, user_id, position)
+            self.user_manager.contacts.add_contact(display_name, user_id, position)
             print(f"✅ Added {display_name} (ID: {user_id}) to speed dial position {position}")
             
         except (ValueError, KeyboardInterrupt):
@@ -432,7 +422,7 @@ class PiPhoneCLI:
         print("\n➖ Remove Speed Dial Contact")
         print("-" * 28)
         
-        contacts = self.settings.get_contacts()
+        contacts = self.user_manager.contacts.speed_dial_contacts()
         if not contacts:
             print("❌ No contacts to remove")
             input("Press Enter to continue...")
@@ -451,8 +441,8 @@ class PiPhoneCLI:
                 contact = contacts[choice]
                 contact_name = contact.get('name', 'Unknown')
                 
-                # Actually remove from settings
-                success = self.settings.remove_contact(contact_name=contact_name)
+                # Remove from the local contact directory
+                success = self.user_manager.contacts.remove_contact(user_id=contact['user_id'])
                 
                 if success:
                     print(f"✅ Removed {contact_name} from speed dial")
@@ -536,7 +526,7 @@ class PiPhoneCLI:
         
         # Test API connection
         try:
-            response = await self.web_api.session.get(f"{self.web_api.base_url}/api/auth/me")
+            response = await self.web_api.get_me()
             if response.status == 200:
                 print("   Status: ✅ Connected and authenticated")
             else:
@@ -545,7 +535,7 @@ class PiPhoneCLI:
             print(f"   Status: ❌ Connection failed ({e})")
         
         # Socket.IO status
-        socket_status = "✅ Connected" if self.socket_manager else "❌ Disconnected"
+        socket_status = "✅ Connected" if self.socket_manager and self.socket_manager.connected else "❌ Disconnected"
         print(f"\n📡 Socket.IO: {socket_status}")
         
         # LiveKit configuration
@@ -559,6 +549,7 @@ class PiPhoneCLI:
         """Refresh all data"""
         print("🔄 Refreshing data...")
         await self.refresh_online_users()
+        await self.user_manager.contacts.sync(self.web_api)
         print("✅ Data refreshed")
         await asyncio.sleep(1)
     
@@ -590,6 +581,7 @@ class PiPhoneCLI:
             
             # Initial data refresh
             await self.refresh_online_users()
+            await self.user_manager.contacts.sync(self.web_api)
             
             # Show main menu
             await self.show_main_menu()
@@ -1,16 +1,39 @@
 """
 Settings and Configuration for EmmaPhone2 Pi
 
-Manages application settings and configuration
+Manages application settings and configuration. Changes are grouped with
+transaction() and saves are debounced, so a burst of updates becomes one
+write; each write goes to a temp file that is fsynced and renamed over
+settings.json, so a power cut leaves either the old or the new file.
 """
+import atexit
+import copy
 import json
 import logging
 import os
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Callable, Optional
+
+from diagnostics.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
+_MISSING = object()
+
+def _flatten(settings: Dict, prefix: str = "") -> Dict[str, Any]:
+    """Nested settings as {dotted key: leaf value}; lists are leaves"""
+    flat = {}
+    for key, value in settings.items():
+        dotted = f"{prefix}{key}"
+        if isinstance(value, dict) and value:
+            flat.update(_flatten(value, dotted + "."))
+        else:
+            flat[dotted] = value
+    return flat
+
 class Settings:
     """Application settings manager"""
     
@@ -29,7 +52,10 @@ class Settings:
                 "sample_rate": 44100,
                 "channels": 2,
                 "chunk_size": 1024,
-                "device_index": 1
+                "device_index": 1,
+                "preroll_seconds": 20,
+                "recording_codec": "ima_adpcm",
+                "recording_channels": 1
             },
             "leds": {
                 "brightness": 255,
@@ -56,7 +82,9 @@ class Settings:
             "web_server": {
                 "port": 8080,
                 "host": "0.0.0.0",
-                "ssl_enabled": False
+                "ssl_enabled": False,
+                "server": "flask",
+                "level_hz": 10
             },
             "livekit": {
                 "url": "wss://emmaphone2-livekit-production.up.railway.app",
@@ -64,10 +92,49 @@ class Settings:
                 "api_secret": "emmaphone2_static_secret_key_64chars_long_for_proper_security",
                 "room_prefix": "emmaphone"
             },
+            "recordings": {
+                "directory": "~/.emmaphone/recordings",
+                "max_total_mb": 500,
+                "max_age_days": 30,
+                "retention_interval": 600
+            },
+            "uploads": {
+                "enabled": False,
+                "url": "",
+                "chunk_size_kb": 256,
+                "max_kbps": 256,
+                "token": ""
+            },
+            "sounds": {
+                "volume": 0.5,
+                "directory": "~/.emmaphone/sounds",
+                "prompts": {
+                    "ring": "ring.wav",
+                    "connect": "connect.wav",
+                    "hangup": "hangup.wav",
+                    "low_battery": "low_battery.wav"
+                }
+            },
+            "audio_publishing": {
+                "adaptive": True,
+                "initial_profile": "standard"
+            },
             "web_client": {
                 "url": "https://emmaphone2-production.up.railway.app",
                 "api_endpoint": "/api",
-                "socket_endpoint": "/socket.io"
+                "socket_endpoint": "/socket.io",
+                "contacts_sync_interval": 300,
+                "http": {
+                    "pool_size": 8,
+                    "keepalive_timeout": 4.0,
+                    "dns_cache_ttl": 300,
+                    "connect_timeout": 5.0
+                },
+                "socket": {
+                    "connect_timeout": 5.0,
+                    "reconnect_delay": 0.5,
+                    "reconnect_delay_max": 15.0
+                }
             },
             "user": {
                 "configured": False,
@@ -82,11 +149,51 @@ class Settings:
                 "id": "pi_001",
                 "name": "EmmaPhone Pi",
                 "type": "pi_zero_2w"
+            },
+            "diagnostics": {
+                "loop_monitor_enabled": True,
+                "loop_sample_interval": 0.01,
+                "slow_callback_threshold": 0.05
             }
         }
         
-        self.settings = self.defaults.copy()
+        self.settings = copy.deepcopy(self.defaults)
+        
+        # Change counter per top-level section, so caches built from
+        # settings (rendered pages) can tell when they are stale
+        self.section_versions: Dict[str, int] = {}
+        self.version = 0
+        
+        # Debounced persistence: saves within write_delay are coalesced,
+        # but a steady stream of changes is still written every max_write_delay
+        self.write_delay = 0.5
+        self.max_write_delay = 5.0
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        self._transaction_depth = 0
+        self._transaction_backup = None
+        self._transaction_owner = None
+        self._transaction_changes: Dict[str, tuple] = {}
+        self._dirty = False
+        self._dirty_since = None
+        self._save_timer = None
+        self._last_written = None
+        self._key_paths: Dict[str, tuple] = {}
+        self.writes = 0
+        self.coalesced_saves = 0
+        
+        # Called with {dotted key: (old, new)} after in-process changes
+        # (set by the settings watcher; may run on any thread)
+        self.on_change = None
+        
         self.load_settings()
+        
+        # Hot keys read on every status update and page render
+        self._user_configured = self.accessor("user.configured", False)
+        self._contacts = self.accessor("user.contacts", [])
+        self._speed_dial = self.accessor("user.speed_dial", {})
+        
+        atexit.register(self.flush)
     
     def load_settings(self):
         """Load settings from file"""
@@ -96,10 +203,14 @@ class Settings:
             
             if self.config_file.exists():
                 with open(self.config_file, 'r') as f:
-                    loaded_settings = json.load(f)
+                    raw_settings = f.read()
+                loaded_settings = json.loads(raw_settings)
                 
                 # Merge with defaults (recursive)
-                self.settings = self._merge_settings(self.defaults, loaded_settings)
+                with self._lock:
+                    self.settings = self._merge_settings(copy.deepcopy(self.defaults), loaded_settings)
+                    self._last_written = raw_settings
+                    self._touch()
                 
                 logger.info("✅ Settings loaded from file")
             else:
@@ -107,28 +218,162 @@ class Settings:
                 
         except Exception as e:
             logger.error(f"❌ Failed to load settings: {e}")
-            self.settings = self.defaults.copy()
+            with self._lock:
+                self.settings = copy.deepcopy(self.defaults)
+                self._touch()
     
     def save_settings(self):
-        """Save current settings to file"""
-        try:
-            self.config_dir.mkdir(parents=True, exist_ok=True)
-            
-            with open(self.config_file, 'w') as f:
-                json.dump(self.settings, f, indent=2)
+        """Request a save of the current settings
+        
+        The write happens write_delay seconds after the last request (at most
+        max_write_delay after the first unsaved change), or when the
+        outermost transaction ends; call flush() to write immediately.
+        """
+        with self._lock:
+            if self._dirty:
+                self.coalesced_saves += 1
+                metrics.increment("settings.saves_coalesced")
+            self._dirty = True
+            if self._dirty_since is None:
+                self._dirty_since = time.monotonic()
+            if self._transaction_depth:
+                return
+            self._schedule_write()
+    
+    def _schedule_write(self):
+        """(Re)arm the debounce timer; caller holds the lock"""
+        if self._save_timer:
+            self._save_timer.cancel()
+        deadline = self._dirty_since + self.max_write_delay
+        delay = max(0.0, min(self.write_delay, deadline - time.monotonic()))
+        self._save_timer = threading.Timer(delay, self.flush)
+        self._save_timer.daemon = True
+        self._save_timer.start()
+    
+    def flush(self) -> bool:
+        """Write pending changes to disk now; returns False if the write failed
+        
+        Never writes a transaction's half-applied state: inside a transaction
+        the write is left to its commit, and other threads wait for it to end.
+        """
+        if self._transaction_owner == threading.get_ident():
+            return True
+        with self._write_lock:
+            if not self._lock.acquire(timeout=self.max_write_delay):
+                # A transaction on another thread is still open (e.g. at exit);
+                # its commit schedules the write
+                logger.warning("⚠️ Settings busy in a transaction, not saved now")
+                return False
+            try:
+                if self._save_timer:
+                    self._save_timer.cancel()
+                    self._save_timer = None
+                if not self._dirty:
+                    return True
+                data = json.dumps(self.settings, indent=2)
+                self._dirty = False
+                self._dirty_since = None
+            finally:
+                self._lock.release()
             
-            logger.info("✅ Settings saved to file")
+            # Saving identical content would only wear the SD card
+            if data == self._last_written:
+                return True
             
-        except Exception as e:
-            logger.error(f"❌ Failed to save settings: {e}")
+            try:
+                self._write_atomic(data)
+                self._last_written = data
+                self.writes += 1
+                metrics.increment("settings.writes")
+                logger.info("✅ Settings saved to file")
+                return True
+            except Exception as e:
+                logger.error(f"❌ Failed to save settings: {e}")
+                with self._lock:
+                    self._dirty = True
+                    if self._dirty_since is None:
+                        self._dirty_since = time.monotonic()
+                return False
+    
+    def _write_atomic(self, data: str, path: Path = None, mode: int = 0o644):
+        """Write settings.json (or another config file) via fsynced temp file and rename"""
+        path = path or self.config_file
+        self.config_dir.mkdir(parents=True, exist_ok=True)
+        temp_file = path.with_suffix(".json.tmp")
+        fd = os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+        with open(fd, 'w') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, path)
+        
+        # Make the rename itself durable
+        dir_fd = os.open(self.config_dir, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    
+    @contextmanager
+    def transaction(self):
+        """Apply several changes as one: a single save, rolled back on error
+        
+            with settings.transaction():
+                settings.set("livekit.url", url)
+                settings.set("livekit.api_key", key)
+        
+        Transactions nest; only the outermost one saves or rolls back. The
+        lock is held throughout, so other threads' changes wait instead of
+        being interleaved with (or rolled back along with) this one. Change
+        events are published once, after the outermost transaction commits.
+        """
+        committed = {}
+        with self._lock:
+            if self._transaction_depth == 0:
+                self._transaction_backup = (copy.deepcopy(self.settings), self._dirty, self._dirty_since)
+                self._transaction_owner = threading.get_ident()
+            self._transaction_depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._transaction_depth -= 1
+                if self._transaction_depth == 0:
+                    self.settings, self._dirty, self._dirty_since = self._transaction_backup
+                    self._transaction_backup = None
+                    self._transaction_owner = None
+                    self._transaction_changes = {}
+                    self._touch()
+                    # Changes saved before the transaction still need writing
+                    if self._dirty:
+                        self._schedule_write()
+                    logger.warning("↩️ Settings transaction rolled back")
+                raise
+            else:
+                self._transaction_depth -= 1
+                if self._transaction_depth == 0:
+                    self._transaction_backup = None
+                    self._transaction_owner = None
+                    committed = {key: change for key, change in self._transaction_changes.items()
+                                 if change[0] != change[1]}
+                    self._transaction_changes = {}
+                    if self._dirty:
+                        self._schedule_write()
+        
+        if committed and self.on_change:
+            self.on_change(committed)
+    
+    def _key_path(self, key: str) -> tuple:
+        path = self._key_paths.get(key)
+        if path is None:
+            path = self._key_paths[key] = tuple(key.split('.'))
+        return path
     
     def get(self, key: str, default: Any = None) -> Any:
         """Get setting value using dot notation (e.g., 'audio.sample_rate')"""
         try:
-            keys = key.split('.')
             value = self.settings
             
-            for k in keys:
+            for k in self._key_path(key):
                 value = value[k]
             
             return value
@@ -136,26 +381,157 @@ class Settings:
         except (KeyError, TypeError):
             return default
     
+    def accessor(self, key: str, default: Any = None) -> Callable[[], Any]:
+        """Compiled getter for a hot key
+        
+        The value is looked up once and reused until any setting changes,
+        so a read is a version check. Keep the returned callable around.
+        """
+        path = self._key_path(key)
+        cache = [(-1, default)]
+        
+        def read():
+            version, value = cache[0]
+            if version == self.version:
+                return value
+            version = self.version
+            value = self.settings
+            try:
+                for k in path:
+                    value = value[k]
+            except (KeyError, TypeError):
+                value = default
+            cache[0] = (version, value)
+            return value
+        
+        return read
+    
     def set(self, key: str, value: Any):
         """Set setting value using dot notation"""
         try:
-            keys = key.split('.')
-            setting = self.settings
+            keys = self._key_path(key)
             
-            # Navigate to the parent of the target key
-            for k in keys[:-1]:
-                if k not in setting:
-                    setting[k] = {}
-                setting = setting[k]
+            with self._lock:
+                setting = self.settings
+                
+                # Navigate to the parent of the target key
+                for k in keys[:-1]:
+                    if k not in setting:
+                        setting[k] = {}
+                    setting = setting[k]
+                
+                # Set the final key
+                old_value = setting.get(keys[-1])
+                setting[keys[-1]] = value
+                self._touch(keys[0])
+                
+                # Inside a transaction: publish on commit, with the value from before it
+                buffered = self._transaction_depth > 0
+                if buffered:
+                    first_old = self._transaction_changes.get(key, (old_value,))[0]
+                    self._transaction_changes[key] = (first_old, value)
             
-            # Set the final key
-            setting[keys[-1]] = value
+            if self.on_change and not buffered and old_value != value:
+                self.on_change({key: (old_value, value)})
             
             logger.info(f"📝 Setting updated: {key} = {value}")
             
         except Exception as e:
             logger.error(f"❌ Failed to set {key}: {e}")
     
+    def _touch(self, section: Optional[str] = None):
+        """Record a change to one section (or to all of them when None)"""
+        self.version += 1
+        if section is None:
+            for name in set(self.settings) | set(self.section_versions):
+                self.section_versions[name] = self.section_versions.get(name, 0) + 1
+        else:
+            self.section_versions[section] = self.section_versions.get(section, 0) + 1
+    
+    def section_version(self, *sections: str) -> tuple:
+        """Change counters of the given top-level sections, usable as a cache key"""
+        return tuple(self.section_versions.get(section, 0) for section in sections)
+    
+    def reload_from_disk(self) -> Dict[str, tuple]:
+        """Apply changes another process wrote to settings.json
+        
+        Three-way merge: keys that changed in the file since we last read or
+        wrote it are applied on top of the in-memory settings, so unsaved
+        local changes to other keys survive. Returns {dotted key: (old, new)}
+        for every setting whose value changed.
+        """
+        try:
+            with open(self.config_file, 'r') as f:
+                raw_settings = f.read()
+            theirs = json.loads(raw_settings)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            # Probably caught mid-write by a non-atomic writer; the next event retries
+            logger.warning(f"⚠️ Could not reload settings: {e}")
+            return {}
+        
+        with self._lock:
+            if raw_settings == self._last_written:
+                return {}
+            
+            try:
+                base = json.loads(self._last_written) if self._last_written else {}
+            except ValueError:
+                base = {}
+            base = _flatten(self._merge_settings(copy.deepcopy(self.defaults), base))
+            theirs = _flatten(self._merge_settings(copy.deepcopy(self.defaults), theirs))
+            ours = _flatten(self.settings)
+            
+            changes = {}
+            for key, value in theirs.items():
+                if base.get(key, _MISSING) != value and ours.get(key, _MISSING) != value:
+                    changes[key] = (ours.get(key), value)
+            
+            removed = []
+            for key, value in base.items():
+                if key in theirs or ours.get(key, _MISSING) != value:
+                    continue
+                # Gone because a parent became a leaf (e.g. a dict emptied) is covered above
+                parts = key.split('.')
+                if any('.'.join(parts[:i]) in theirs for i in range(1, len(parts))):
+                    continue
+                changes[key] = (value, None)
+                removed.append(key)
+            
+            for key, (_, value) in changes.items():
+                if key in removed:
+                    self._unset_quietly(key)
+                else:
+                    self._set_quietly(key, value)
+            self._last_written = raw_settings
+        
+        if changes:
+            logger.info(f"🔄 Settings reloaded from file: {', '.join(sorted(changes))}")
+        return changes
+    
+    def _set_quietly(self, key: str, value: Any):
+        """set() without logging; caller holds the lock"""
+        keys = self._key_path(key)
+        setting = self.settings
+        for k in keys[:-1]:
+            if not isinstance(setting.get(k), dict):
+                setting[k] = {}
+            setting = setting[k]
+        setting[keys[-1]] = copy.deepcopy(value)
+        self._touch(keys[0])
+    
+    def _unset_quietly(self, key: str):
+        """Remove a key; caller holds the lock"""
+        keys = self._key_path(key)
+        setting = self.settings
+        for k in keys[:-1]:
+            setting = setting.get(k)
+            if not isinstance(setting, dict):
+                return
+        setting.pop(keys[-1], None)
+        self._touch(keys[0])
+    
     def _merge_settings(self, defaults: Dict, loaded: Dict) -> Dict:
         """Recursively merge loaded settings with defaults"""
         result = defaults.copy()
@@ -198,6 +574,10 @@ class Settings:
         """Get user configuration"""
         return self.get("user", {})
     
+    def get_diagnostics_config(self) -> Dict:
+        """Get diagnostics configuration"""
+        return self.get("diagnostics", {})
+    
     def set_user_name(self, name: str):
         """Set user name"""
         self.set("user.name", name)
@@ -210,17 +590,18 @@ class Settings:
     
     def is_user_configured(self) -> bool:
         """Check if user is configured"""
-        return self.get("user.configured", False)
+        return self._user_configured()
     
     def configure_user(self, username: str, display_name: str, password: str, user_id: str = ""):
         """Configure the Pi user"""
-        self.set("user.configured", True)
-        self.set("user.username", username)
-        self.set("user.display_name", display_name)
-        self.set("user.password", password)
-        if user_id:
-            self.set("user.user_id", user_id)
-        self.save_settings()
+        with self.transaction():
+            self.set("user.configured", True)
+            self.set("user.username", username)
+            self.set("user.display_name", display_name)
+            self.set("user.password", password)
+            if user_id:
+                self.set("user.user_id", user_id)
+            self.save_settings()
         logger.info(f"👤 User configured: {username}")
     
     def get_user_credentials(self) -> dict:
@@ -234,46 +615,74 @@ class Settings:
     
     def clear_user_config(self):
         """Clear user configuration"""
-        self.set("user.configured", False)
-        self.set("user.username", "")
-        self.set("user.display_name", "")
-        self.set("user.password", "")
-        self.set("user.user_id", "")
-        self.set("user.contacts", [])
-        self.set("user.speed_dial", {})
-        self.save_settings()
+        with self.transaction():
+            self.set("user.configured", False)
+            self.set("user.username", "")
+            self.set("user.display_name", "")
+            self.set("user.password", "")
+            self.set("user.user_id", "")
+            self.set("user.contacts", [])
+            self.set("user.speed_dial", {})
+            self.save_settings()
+        self.clear_auth()
         logger.info("👤 User configuration cleared")
     
+    def load_auth(self) -> Dict:
+        """Saved web client session from auth.json ({} if there is none)"""
+        try:
+            with open(self.auth_file) as f:
+                auth = json.load(f)
+            return auth if isinstance(auth, dict) else {}
+        except (OSError, ValueError):
+            return {}
+    
+    def save_auth(self, auth: Dict) -> bool:
+        """Persist the web client session (owner-readable only: it grants account access)"""
+        try:
+            self._write_atomic(json.dumps(auth, indent=2), self.auth_file, mode=0o600)
+            return True
+        except OSError as e:
+            logger.error(f"❌ Failed to save session: {e}")
+            return False
+    
+    def clear_auth(self):
+        """Forget the saved web client session"""
+        try:
+            self.auth_file.unlink()
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"❌ Failed to remove saved session: {e}")
+    
     def add_contact(self, name: str, user_id: str, speed_dial: Optional[int] = None):
         """Add contact to user's contact list"""
-        contacts = self.get("user.contacts", [])
-        
         contact = {
             "name": name,
             "user_id": user_id,
             "speed_dial": speed_dial
         }
         
-        contacts.append(contact)
-        self.set("user.contacts", contacts)
-        
-        # Update speed dial if specified
-        if speed_dial:
-            speed_dial_config = self.get("user.speed_dial", {})
-            speed_dial_config[str(speed_dial)] = user_id
-            self.set("user.speed_dial", speed_dial_config)
-        
-        self.save_settings()
+        with self.transaction():
+            # Build new containers so a rollback or a reader never sees a half update
+            self.set("user.contacts", self.get("user.contacts", []) + [contact])
+            
+            # Update speed dial if specified
+            if speed_dial:
+                speed_dial_config = dict(self.get("user.speed_dial", {}))
+                speed_dial_config[str(speed_dial)] = user_id
+                self.set("user.speed_dial", speed_dial_config)
+            
+            self.save_settings()
         logger.info(f"📱 Contact added: {name}")
     
     def get_contacts(self) -> list:
         """Get user's contacts"""
-        return self.get("user.contacts", [])
+        return self._contacts()
     
     def remove_contact(self, contact_name: str = None, user_id: str = None, speed_dial_position: int = None):
         """Remove contact from user's contact list"""
         contacts = self.get("user.contacts", [])
-        speed_dial_config = self.get("user.speed_dial", {})
+        speed_dial_config = dict(self.get("user.speed_dial", {}))
         
         # Find contact to remove by name, user_id, or speed_dial position
         contact_removed = False
@@ -299,9 +708,10 @@ class Settings:
                 contacts_to_keep.append(contact)
         
         if contact_removed:
-            self.set("user.contacts", contacts_to_keep)
-            self.set("user.speed_dial", speed_dial_config)
-            self.save_settings()
+            with self.transaction():
+                self.set("user.contacts", contacts_to_keep)
+                self.set("user.speed_dial", speed_dial_config)
+                self.save_settings()
             return True
         else:
             logger.warning("📱 Contact not found for removal")
@@ -309,15 +719,15 @@ class Settings:
     
     def get_speed_dial(self, position: int) -> Optional[str]:
         """Get speed dial contact for position"""
-        speed_dial_config = self.get("user.speed_dial", {})
-        return speed_dial_config.get(str(position))
+        return self._speed_dial().get(str(position))
     
     def set_livekit_credentials(self, url: str, api_key: str, api_secret: str):
         """Set LiveKit credentials"""
-        self.set("livekit.url", url)
-        self.set("livekit.api_key", api_key)
-        self.set("livekit.api_secret", api_secret)
-        self.save_settings()
+        with self.transaction():
+            self.set("livekit.url", url)
+            self.set("livekit.api_key", api_key)
+            self.set("livekit.api_secret", api_secret)
+            self.save_settings()
         logger.info("🔐 LiveKit credentials updated")
     
     def is_configured(self) -> bool:
@@ -335,6 +745,27 @@ class Settings:
     
     def reset_to_defaults(self):
         """Reset all settings to defaults"""
-        self.settings = self.defaults.copy()
+        with self._lock:
+            old_settings = _flatten(self.settings)
+            self.settings = copy.deepcopy(self.defaults)
+            self._touch()
         self.save_settings()
-        logger.info("🔄 Settings reset to defaults")
\ No newline at end of file
+        
+        if self.on_change:
+            new_settings = _flatten(self.settings)
+            changes = {key: (old_settings.get(key), new_settings.get(key))
+                       for key in set(old_settings) | set(new_settings)
+                       if old_settings.get(key, _MISSING) != new_settings.get(key, _MISSING)}
+            if changes:
+                self.on_change(changes)
+        logger.info("🔄 Settings reset to defaults")
+    
+    def get_stats(self) -> Dict:
+        """Persistence statistics"""
+        return {
+            "version": self.version,
+            "writes": self.writes,
+            "coalesced_saves": self.coalesced_saves,
+            "pending": self._dirty,
+            "in_transaction": self._transaction_depth > 0
+        }
\ No newline at end of file
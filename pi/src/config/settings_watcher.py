@@ -0,0 +1,200 @@
+"""
+Settings Watcher for EmmaPhone2 Pi
+
+Watches ~/.emmaphone with inotify so edits made by other processes
+(setup_user.py, configure_speed_dial.py, reset_settings.py, a text editor)
+are merged into the running Settings as soon as the file is written, and
+publishes {dotted key: (old, new)} change events to subscribers. Changes
+made in-process with Settings.set() go through the same subscribers.
+
+The inotify descriptor sits on the event loop (add_reader), so an idle
+device does not wake up for it. Where inotify is unavailable the watcher
+falls back to checking the file's mtime every few seconds.
+"""
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+from typing import Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# From <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+# struct inotify_event: wd, mask, cookie, len, then len bytes of name
+EVENT_HEADER = struct.Struct("iIII")
+
+def _inotify_watch(directory: str) -> int:
+    """inotify descriptor watching one directory (raises OSError if unsupported)"""
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    if not hasattr(libc, "inotify_init1"):
+        raise OSError("inotify not available")
+
+    fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    if fd < 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+
+    if libc.inotify_add_watch(fd, os.fsencode(directory), WATCH_MASK) < 0:
+        errno = ctypes.get_errno()
+        os.close(fd)
+        raise OSError(errno, os.strerror(errno))
+    return fd
+
+def _event_names(data: bytes) -> List[str]:
+    """File names from a buffer of inotify events"""
+    names = []
+    offset = 0
+    while offset + EVENT_HEADER.size <= len(data):
+        _, _, _, length = EVENT_HEADER.unpack_from(data, offset)
+        offset += EVENT_HEADER.size
+        names.append(data[offset:offset + length].rstrip(b"\0").decode(errors="replace"))
+        offset += length
+    return names
+
+class SettingsWatcher:
+    """Hot reload of settings.json with change events for subscribers"""
+
+    def __init__(self, settings, debounce: float = 0.1, poll_interval: float = 5.0):
+        self.settings = settings
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.subscribers: List[Tuple[str, Callable]] = []
+        self.loop = None
+        self.fd = None
+        self.running = False
+        self._reload_handle = None
+        self._poll_task = None
+        self.file_events = 0
+        self.reloads = 0
+        self.changes_published = 0
+
+    def subscribe(self, prefix: str, callback: Callable[[Dict[str, tuple]], None]):
+        """Call callback(changes) for keys equal to or below prefix ("" for all)
+
+        The callback runs on the event loop and may be a coroutine function.
+        """
+        self.subscribers.append((prefix, callback))
+
+    def unsubscribe(self, callback: Callable):
+        self.subscribers = [(prefix, cb) for prefix, cb in self.subscribers if cb is not callback]
+
+    async def start(self):
+        """Start watching the settings directory"""
+        if self.running:
+            return
+        self.loop = asyncio.get_running_loop()
+        self.running = True
+        self.settings.on_change = self._on_local_change
+
+        try:
+            self.fd = _inotify_watch(str(self.settings.config_dir))
+            self.loop.add_reader(self.fd, self._on_readable)
+            logger.info(f"👀 Watching {self.settings.config_dir} for settings changes")
+        except OSError as e:
+            logger.warning(f"⚠️ inotify unavailable ({e}), checking settings every {self.poll_interval:.0f}s")
+            self._poll_task = asyncio.create_task(self._poll_loop())
+
+    async def stop(self):
+        self.running = False
+        self.settings.on_change = None
+        if self._reload_handle:
+            self._reload_handle.cancel()
+            self._reload_handle = None
+        if self.fd is not None:
+            self.loop.remove_reader(self.fd)
+            os.close(self.fd)
+            self.fd = None
+        if self._poll_task:
+            self._poll_task.cancel()
+            try:
+                await self._poll_task
+            except asyncio.CancelledError:
+                pass
+            self._poll_task = None
+
+    def _on_readable(self):
+        try:
+            data = os.read(self.fd, 4096)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            logger.error(f"❌ Settings watcher read failed: {e}")
+            return
+
+        if self.settings.config_file.name in _event_names(data):
+            self.file_events += 1
+            # Editors and non-atomic writers produce bursts; reload once they settle
+            if self._reload_handle:
+                self._reload_handle.cancel()
+            self._reload_handle = self.loop.call_later(self.debounce, self.reload)
+
+    async def _poll_loop(self):
+        last_mtime = None
+        while self.running:
+            try:
+                mtime = self.settings.config_file.stat().st_mtime
+            except OSError:
+                mtime = None
+            if last_mtime is not None and mtime != last_mtime:
+                self.reload()
+            last_mtime = mtime
+            await asyncio.sleep(self.poll_interval)
+
+    def reload(self):
+        """Merge the file into the running settings and publish what changed"""
+        self._reload_handle = None
+        self.reloads += 1
+        changes = self.settings.reload_from_disk()
+        if changes:
+            self._publish(changes)
+
+    def _on_local_change(self, changes: Dict[str, tuple]):
+        """Settings.set() hook; may be called from any thread"""
+        if not self.running:
+            return
+        try:
+            self.loop.call_soon_threadsafe(self._publish, changes)
+        except RuntimeError:
+            pass  # Loop closed during shutdown
+
+    def _publish(self, changes: Dict[str, tuple]):
+        self.changes_published += len(changes)
+        for prefix, callback in list(self.subscribers):
+            if prefix:
+                matched = {key: change for key, change in changes.items()
+                           if key == prefix or key.startswith(prefix + ".") or prefix.startswith(key + ".")}
+            else:
+                matched = changes
+            if not matched:
+                continue
+            try:
+                result = callback(matched)
+                if asyncio.iscoroutine(result):
+                    self.loop.create_task(self._await_callback(result))
+            except Exception as e:
+                logger.error(f"❌ Settings subscriber for '{prefix}' failed: {e}")
+
+    async def _await_callback(self, coro):
+        try:
+            await coro
+        except Exception as e:
+            logger.error(f"❌ Settings subscriber failed: {e}")
+
+    def get_stats(self) -> Dict:
+        return {
+            "mode": "inotify" if self.fd is not None else "poll",
+            "subscribers": len(self.subscribers),
+            "file_events": self.file_events,
+            "reloads": self.reloads,
+            "changes_published": self.changes_published
+        }
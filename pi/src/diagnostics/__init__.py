@@ -0,0 +1,5 @@
+# Diagnostics package
+from .loop_monitor import LoopMonitor
+from .fast_logging import SampledLogger, setup_queue_logging
+from .flight_recorder import FlightRecorder
+from .metrics import metrics
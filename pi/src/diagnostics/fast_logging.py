@@ -0,0 +1,135 @@
+"""
+Low-overhead Logging for EmmaPhone2 Pi
+
+Queue-based logging so no thread ever blocks on stream I/O, plus a sampled,
+rate-limited logger for audio callbacks and other hot paths
+"""
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from typing import Dict, Optional
+
+DEFAULT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that leaves message formatting to the listener thread"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The stock QueueHandler merges msg % args in the calling thread so the
+        # record can be pickled. Records never leave this process, so hand them
+        # over untouched and let the listener do the formatting.
+        return record
+
+def setup_queue_logging(level: int = logging.INFO,
+                        fmt: str = DEFAULT_FORMAT,
+                        stream=None) -> logging.handlers.QueueListener:
+    """Route all logging through a queue drained by a background thread
+
+    Returns the started listener; call stop() on it at shutdown to flush.
+    """
+    log_queue = queue.SimpleQueue()
+
+    stream_handler = logging.StreamHandler(stream or sys.stderr)
+    stream_handler.setFormatter(logging.Formatter(fmt))
+
+    listener = logging.handlers.QueueListener(
+        log_queue, stream_handler, respect_handler_level=True
+    )
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    root.setLevel(level)
+
+    listener.start()
+    return listener
+
+class SampledLogger:
+    """Rate-limited, sampled logger for hot paths such as PortAudio callbacks
+
+    Each call site passes a key. The first ``first`` records for a key are
+    always emitted, after that only every ``every``-th record is considered,
+    and a per-key token bucket caps the emitted rate. Arguments are passed
+    through unformatted so nothing is formatted for records that are dropped.
+    """
+
+    def __init__(self,
+                 logger: logging.Logger,
+                 first: int = 5,
+                 every: int = 0,
+                 rate: float = 1.0,
+                 burst: int = 5):
+        self.logger = logger
+        self.first = first
+        self.every = every
+        self.rate = rate
+        self.burst = burst
+
+        # Per-key state: [count, tokens, last_refill, suppressed]
+        self._state: Dict[str, list] = {}
+
+    def _should_emit(self, key: str) -> bool:
+        """Decide whether a record for this key gets through"""
+        state = self._state.get(key)
+        if state is None:
+            state = self._state[key] = [0, float(self.burst), time.monotonic(), 0]
+
+        state[0] += 1
+        count = state[0]
+
+        if count <= self.first:
+            return True
+
+        if not self.every or count % self.every:
+            state[3] += 1
+            return False
+
+        # Token bucket refill
+        now = time.monotonic()
+        state[1] = min(float(self.burst), state[1] + (now - state[2]) * self.rate)
+        state[2] = now
+
+        if state[1] < 1.0:
+            state[3] += 1
+            return False
+
+        state[1] -= 1.0
+        return True
+
+    def log(self, level: int, key: str, msg: str, *args, **kwargs):
+        """Log a record for key if the level is enabled and the sampler allows it"""
+        if not self.logger.isEnabledFor(level):
+            return
+
+        if self._should_emit(key):
+            kwargs.setdefault('stacklevel', 3)
+            self.logger.log(level, msg, *args, **kwargs)
+
+    def debug(self, key: str, msg: str, *args, **kwargs):
+        self.log(logging.DEBUG, key, msg, *args, **kwargs)
+
+    def info(self, key: str, msg: str, *args, **kwargs):
+        self.log(logging.INFO, key, msg, *args, **kwargs)
+
+    def warning(self, key: str, msg: str, *args, **kwargs):
+        self.log(logging.WARNING, key, msg, *args, **kwargs)
+
+    def error(self, key: str, msg: str, *args, **kwargs):
+        self.log(logging.ERROR, key, msg, *args, **kwargs)
+
+    def reset(self, key: Optional[str] = None):
+        """Reset sampling state for one key or all keys (e.g. at call start)"""
+        if key is None:
+            self._state.clear()
+        else:
+            self._state.pop(key, None)
+
+    def get_stats(self) -> Dict[str, Dict]:
+        """Get per-key seen and suppressed record counts"""
+        return {
+            key: {"seen": state[0], "suppressed": state[3]}
+            for key, state in list(self._state.items())
+        }
@@ -0,0 +1,279 @@
+"""
+Audio Flight Recorder for EmmaPhone2 Pi
+
+Fixed-size, preallocated ring of per-callback timing events for the capture
+and playback paths, with a compact binary dump format and a timeline decoder.
+
+Usage (decode a dump):
+    python3 src/diagnostics/flight_recorder.py ~/.emmaphone/flight_recorder/<file>.epfr
+"""
+import io
+import itertools
+import logging
+import struct
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Event kinds
+KIND_CAPTURE = 0
+KIND_PLAYBACK = 1
+KIND_NAMES = {KIND_CAPTURE: "capture", KIND_PLAYBACK: "playback"}
+
+# PortAudio callback status flags (low byte) plus our own flags
+FLAG_INPUT_UNDERFLOW = 0x01
+FLAG_INPUT_OVERFLOW = 0x02
+FLAG_OUTPUT_UNDERFLOW = 0x04
+FLAG_OUTPUT_OVERFLOW = 0x08
+FLAG_PRIMING_OUTPUT = 0x10
+FLAG_BUFFER_UNDERRUN = 0x100  # Playback callback found the jitter buffer empty
+FLAG_CONCEALED = 0x200        # Part of the playback chunk was concealment audio
+FLAG_NAMES = {
+    FLAG_INPUT_UNDERFLOW: "in_underflow",
+    FLAG_INPUT_OVERFLOW: "in_overflow",
+    FLAG_OUTPUT_UNDERFLOW: "out_underflow",
+    FLAG_OUTPUT_OVERFLOW: "out_overflow",
+    FLAG_PRIMING_OUTPUT: "priming",
+    FLAG_BUFFER_UNDERRUN: "buffer_underrun",
+    FLAG_CONCEALED: "concealed",
+}
+GLITCH_FLAGS = (FLAG_INPUT_OVERFLOW | FLAG_OUTPUT_UNDERFLOW | FLAG_BUFFER_UNDERRUN)
+
+# VAD decision values
+VAD_UNKNOWN = -1
+VAD_SILENCE = 0
+VAD_SPEECH = 1
+
+# Packed, 44 bytes per event; dumps record the itemsize in their header
+EVENT_DTYPE = np.dtype([
+    ("t", "<f8"),             # time.monotonic() at callback entry
+    ("adc_time", "<f8"),      # time_info['input_buffer_adc_time']
+    ("current_time", "<f8"),  # time_info['current_time']
+    ("dac_time", "<f8"),      # time_info['output_buffer_dac_time']
+    ("duration_us", "<u4"),   # time spent inside the callback
+    ("flags", "<u2"),
+    ("frames", "<u2"),
+    ("depth", "<u2"),         # jitter/playback buffer depth in chunks
+    ("kind", "u1"),
+    ("vad", "i1"),
+])
+
+DUMP_MAGIC = b"EPFR"
+DUMP_VERSION = 1
+# magic, version, itemsize, count, wall clock at dump, monotonic at dump
+DUMP_HEADER = struct.Struct("<4sHHIdd")
+
+class FlightRecorder:
+    """Preallocated ring buffer of compact audio callback events"""
+
+    def __init__(self, capacity: int = 16384, dump_dir: Optional[str] = None):
+        self.capacity = capacity
+        self.events = np.zeros(capacity, dtype=EVENT_DTYPE)
+        self._counter = itertools.count()
+        self._written = 0
+
+        # Glitches since the last mark_call_start()
+        self.glitch_count = 0
+
+        if dump_dir is None:
+            dump_dir = Path.home() / ".emmaphone" / "flight_recorder"
+        self.dump_dir = Path(dump_dir)
+
+        # Called with the path of each written dump (e.g. by the uploader)
+        self.on_dump = None
+
+    def record(self, kind: int, started: float, time_info: Optional[Dict] = None,
+               status: int = 0, frames: int = 0, depth: int = 0, vad: int = VAD_UNKNOWN):
+        """Record one callback event (called from PortAudio threads)
+
+        ``started`` is the time.monotonic() value taken on callback entry;
+        the callback duration is derived from it.
+        """
+        now = time.monotonic()
+        # next() on itertools.count is atomic under the GIL, so capture and
+        # playback threads never get the same slot
+        index = next(self._counter)
+        event = self.events[index % self.capacity]
+
+        event["t"] = started
+        if time_info:
+            event["adc_time"] = time_info.get("input_buffer_adc_time", 0.0)
+            event["current_time"] = time_info.get("current_time", 0.0)
+            event["dac_time"] = time_info.get("output_buffer_dac_time", 0.0)
+        else:
+            event["adc_time"] = event["current_time"] = event["dac_time"] = 0.0
+        event["duration_us"] = min(int((now - started) * 1e6), 0xFFFFFFFF)
+        event["flags"] = status & 0xFFFF
+        event["frames"] = min(frames, 0xFFFF)
+        event["depth"] = min(depth, 0xFFFF)
+        event["kind"] = kind
+        event["vad"] = vad
+
+        self._written = index + 1
+        if status & GLITCH_FLAGS:
+            self.glitch_count += 1
+
+    def mark_call_start(self):
+        """Reset the glitch counter at the start of a call"""
+        self.glitch_count = 0
+
+    def snapshot(self) -> np.ndarray:
+        """Get a chronological copy of the recorded events"""
+        written = self._written
+        if written <= self.capacity:
+            return self.events[:written].copy()
+
+        start = written % self.capacity
+        return np.concatenate((self.events[start:], self.events[:start]))
+
+    def to_bytes(self, events: Optional[np.ndarray] = None) -> bytes:
+        """Serialize events into the compact dump format"""
+        if events is None:
+            events = self.snapshot()
+
+        header = DUMP_HEADER.pack(DUMP_MAGIC, DUMP_VERSION, EVENT_DTYPE.itemsize,
+                                  len(events), time.time(), time.monotonic())
+        return header + events.tobytes()
+
+    def dump(self, name: str = "manual", events: Optional[np.ndarray] = None) -> Optional[str]:
+        """Write a dump file and return its path"""
+        try:
+            self.dump_dir.mkdir(parents=True, exist_ok=True)
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            safe_name = "".join(c if c.isalnum() or c in "-_" else "_" for c in str(name))
+            path = self.dump_dir / f"flight_{timestamp}_{safe_name}.epfr"
+
+            with open(path, "wb") as f:
+                f.write(self.to_bytes(events))
+
+            logger.info(f"🛩️ Flight recorder dumped to {path}")
+            if self.on_dump:
+                self.on_dump(str(path))
+            return str(path)
+
+        except Exception as e:
+            logger.error(f"❌ Failed to dump flight recorder: {e}")
+            return None
+
+    def dump_if_glitched(self, name: str) -> Optional[str]:
+        """Dump the ring if any glitch was recorded since mark_call_start()"""
+        if not self.glitch_count:
+            return None
+
+        logger.info(f"🛩️ {self.glitch_count} audio glitches during call - dumping flight recorder")
+        return self.dump(name)
+
+    def get_summary(self) -> Dict:
+        """Get counters and callback timing summary for the current ring"""
+        events = self.snapshot()
+        summary = {
+            "capacity": self.capacity,
+            "recorded": self._written,
+            "glitches_since_call_start": self.glitch_count
+        }
+        summary.update(summarize(events))
+        return summary
+
+def load_dump(source: Union[str, Path, bytes]) -> Dict:
+    """Decode a dump file (or its bytes) into header fields and an event array"""
+    if isinstance(source, (bytes, bytearray)):
+        data = bytes(source)
+    else:
+        with open(source, "rb") as f:
+            data = f.read()
+
+    magic, version, itemsize, count, wall_time, mono_time = DUMP_HEADER.unpack_from(data)
+    if magic != DUMP_MAGIC:
+        raise ValueError("Not a flight recorder dump")
+    if version != DUMP_VERSION or itemsize != EVENT_DTYPE.itemsize:
+        raise ValueError(f"Unsupported dump version {version} (itemsize {itemsize})")
+
+    events = np.frombuffer(data, dtype=EVENT_DTYPE, count=count, offset=DUMP_HEADER.size)
+    return {"wall_time": wall_time, "mono_time": mono_time, "events": events}
+
+def summarize(events: np.ndarray) -> Dict:
+    """Summarize callback durations, intervals and glitches per event kind"""
+    summary = {}
+
+    for kind, kind_name in KIND_NAMES.items():
+        subset = events[events["kind"] == kind]
+        if not len(subset):
+            continue
+
+        intervals_ms = np.diff(subset["t"]) * 1000.0
+        summary[kind_name] = {
+            "events": int(len(subset)),
+            "glitches": int(np.count_nonzero(subset["flags"] & GLITCH_FLAGS)),
+            "duration_us_mean": float(subset["duration_us"].mean()),
+            "duration_us_max": int(subset["duration_us"].max()),
+            "interval_ms_max": float(intervals_ms.max()) if len(intervals_ms) else 0.0,
+            "depth_min": int(subset["depth"].min()),
+            "depth_max": int(subset["depth"].max())
+        }
+
+    return summary
+
+def format_flags(flags: int) -> str:
+    """Render a flags value as a readable list"""
+    names = [name for bit, name in FLAG_NAMES.items() if flags & bit]
+    return ",".join(names) if names else "-"
+
+def timeline(dump: Dict, limit: Optional[int] = None) -> List[Dict]:
+    """Convert decoded events into a timeline with wall-clock timestamps"""
+    events = dump["events"]
+    if limit:
+        events = events[-limit:]
+
+    # Map monotonic times onto the wall clock captured at dump time
+    offset = dump["wall_time"] - dump["mono_time"]
+    previous = {}
+    rows = []
+
+    for event in events:
+        kind = int(event["kind"])
+        t = float(event["t"])
+        last = previous.get(kind)
+        previous[kind] = t
+
+        rows.append({
+            "time": datetime.fromtimestamp(t + offset).strftime("%H:%M:%S.%f")[:-3],
+            "kind": KIND_NAMES.get(kind, str(kind)),
+            "interval_ms": round((t - last) * 1000.0, 2) if last is not None else None,
+            "duration_us": int(event["duration_us"]),
+            "frames": int(event["frames"]),
+            "depth": int(event["depth"]),
+            "vad": int(event["vad"]),
+            "flags": format_flags(int(event["flags"])),
+            "dac_latency_ms": round((float(event["dac_time"]) - float(event["current_time"])) * 1000.0, 2)
+                              if event["dac_time"] else None
+        })
+
+    return rows
+
+def format_timeline(dump: Dict, limit: Optional[int] = None) -> str:
+    """Render a decoded dump as a plain-text timeline"""
+    out = io.StringIO()
+    out.write(f"{'time':<13}{'kind':<10}{'intvl ms':>9}{'cb us':>8}{'frames':>8}"
+              f"{'depth':>7}{'vad':>5}  flags\n")
+
+    for row in timeline(dump, limit):
+        interval = f"{row['interval_ms']:.2f}" if row["interval_ms"] is not None else "-"
+        out.write(f"{row['time']:<13}{row['kind']:<10}{interval:>9}{row['duration_us']:>8}"
+                  f"{row['frames']:>8}{row['depth']:>7}{row['vad']:>5}  {row['flags']}\n")
+
+    return out.getvalue()
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    decoded = load_dump(sys.argv[1])
+    print(format_timeline(decoded))
+    print(summarize(decoded["events"]))
@@ -0,0 +1,208 @@
+"""
+Event Loop Monitor for EmmaPhone2 Pi
+
+Samples asyncio scheduling lag into a histogram and captures the stack of
+any callback that blocks the main loop for longer than a threshold
+"""
+import asyncio
+import bisect
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class LoopMonitor:
+    """Low-overhead lag histogram and slow-callback detector for the main loop"""
+
+    # Histogram bucket upper bounds in milliseconds (last bucket is open-ended)
+    BUCKET_BOUNDS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+
+    def __init__(self,
+                 sample_interval: float = 0.01,
+                 slow_callback_threshold: float = 0.05,
+                 max_slow_events: int = 20):
+        self.sample_interval = sample_interval
+        self.slow_callback_threshold = slow_callback_threshold
+
+        # Lag histogram (one extra bucket for everything above the last bound)
+        self.buckets = [0] * (len(self.BUCKET_BOUNDS_MS) + 1)
+        self.sample_count = 0
+        self.lag_total_ms = 0.0
+        self.lag_max_ms = 0.0
+
+        # Slow callback events with captured stacks
+        self.slow_events = deque(maxlen=max_slow_events)
+        self.slow_event_count = 0
+
+        # Heartbeat shared with the watchdog thread
+        self._heartbeat = 0.0
+        self._stall_event = None
+
+        self.loop = None
+        self.loop_thread_id = None
+        self.sampler_task = None
+        self.watchdog_thread = None
+        self.running = False
+        self.started_at = None
+
+    async def start(self):
+        """Start lag sampling and the stall watchdog on the running loop"""
+        if self.running:
+            return
+
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self.started_at = time.time()
+        self.running = True
+
+        self.sampler_task = asyncio.create_task(self._sample_lag())
+
+        self.watchdog_thread = threading.Thread(
+            target=self._watchdog,
+            name="loop-monitor-watchdog",
+            daemon=True
+        )
+        self.watchdog_thread.start()
+
+        logger.info(f"✅ Loop monitor started (interval {self.sample_interval * 1000:.0f}ms, "
+                    f"slow threshold {self.slow_callback_threshold * 1000:.0f}ms)")
+
+    async def stop(self):
+        """Stop sampling and the watchdog"""
+        if not self.running:
+            return
+
+        self.running = False
+
+        if self.sampler_task:
+            self.sampler_task.cancel()
+            try:
+                await self.sampler_task
+            except asyncio.CancelledError:
+                pass
+            self.sampler_task = None
+
+        logger.info("🛑 Loop monitor stopped")
+
+    async def _sample_lag(self):
+        """Sleep for a fixed interval and record how late the loop woke us up"""
+        interval = self.sample_interval
+        bounds = self.BUCKET_BOUNDS_MS
+        buckets = self.buckets
+
+        while self.running:
+            expected = time.monotonic() + interval
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            self._heartbeat = now
+
+            lag_ms = max(0.0, (now - expected) * 1000.0)
+            buckets[bisect.bisect_left(bounds, lag_ms)] += 1
+            self.sample_count += 1
+            self.lag_total_ms += lag_ms
+            if lag_ms > self.lag_max_ms:
+                self.lag_max_ms = lag_ms
+
+    def _watchdog(self):
+        """Capture the loop thread's stack when the heartbeat stops advancing"""
+        threshold = self.slow_callback_threshold
+        poll = max(threshold / 2, 0.005)
+
+        while self.running:
+            time.sleep(poll)
+
+            heartbeat = self._heartbeat
+            stalled_for = time.monotonic() - heartbeat - self.sample_interval
+
+            if stalled_for < threshold:
+                if self._stall_event is not None:
+                    self._close_stall_event()
+                continue
+
+            if self._stall_event is not None:
+                # Same stall still in progress, just track its duration
+                self._stall_event["blocked_ms"] = round(stalled_for * 1000.0, 1)
+                continue
+
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = traceback.format_stack(frame) if frame is not None else []
+
+            self._stall_event = {
+                "timestamp": time.time(),
+                "heartbeat": heartbeat,
+                "blocked_ms": round(stalled_for * 1000.0, 1),
+                "stack": [line.rstrip() for line in stack[-15:]]
+            }
+            self.slow_events.append(self._stall_event)
+            self.slow_event_count += 1
+
+    def _close_stall_event(self):
+        """Finalize the duration of a stall once the loop is responsive again"""
+        event = self._stall_event
+        self._stall_event = None
+
+        top = event["stack"][-1].strip() if event["stack"] else "unknown"
+        logger.warning(f"🐢 Event loop blocked for {event['blocked_ms']:.0f}ms at {top}")
+
+    def get_histogram(self) -> List[Dict]:
+        """Get lag histogram as a list of buckets"""
+        histogram = []
+        lower = 0
+
+        for bound, count in zip(self.BUCKET_BOUNDS_MS, self.buckets):
+            histogram.append({"le_ms": bound, "gt_ms": lower, "count": count})
+            lower = bound
+
+        histogram.append({"le_ms": None, "gt_ms": lower, "count": self.buckets[-1]})
+        return histogram
+
+    def get_percentile(self, percentile: float) -> Optional[float]:
+        """Estimate a lag percentile (upper bucket bound) in milliseconds"""
+        if not self.sample_count:
+            return None
+
+        target = self.sample_count * percentile / 100.0
+        cumulative = 0
+
+        for bound, count in zip(self.BUCKET_BOUNDS_MS, self.buckets):
+            cumulative += count
+            if cumulative >= target:
+                return float(bound)
+
+        return self.lag_max_ms
+
+    def get_stats(self, include_stacks: bool = True) -> Dict:
+        """Get a snapshot of loop lag statistics and slow callbacks"""
+        stats = {
+            "running": self.running,
+            "started_at": self.started_at,
+            "sample_interval_ms": self.sample_interval * 1000.0,
+            "slow_callback_threshold_ms": self.slow_callback_threshold * 1000.0,
+            "samples": self.sample_count,
+            "lag_mean_ms": round(self.lag_total_ms / self.sample_count, 3) if self.sample_count else None,
+            "lag_max_ms": round(self.lag_max_ms, 3),
+            "lag_p50_ms": self.get_percentile(50),
+            "lag_p99_ms": self.get_percentile(99),
+            "histogram": self.get_histogram(),
+            "slow_callbacks": self.slow_event_count
+        }
+
+        if include_stacks:
+            stats["slow_events"] = [dict(event) for event in self.slow_events]
+
+        return stats
+
+    def reset(self):
+        """Reset histogram and slow callback history"""
+        self.buckets[:] = [0] * len(self.buckets)
+        self.sample_count = 0
+        self.lag_total_ms = 0.0
+        self.lag_max_ms = 0.0
+        self.slow_events.clear()
+        self.slow_event_count = 0
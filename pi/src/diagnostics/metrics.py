@@ -0,0 +1,59 @@
+"""
+Metrics Registry for EmmaPhone2 Pi
+
+Process-wide counters, gauges and a bounded event log that subsystems
+record into and the web server exposes
+"""
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+class Metrics:
+    """Simple in-memory metrics registry"""
+
+    def __init__(self, max_events: int = 200):
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, Any] = {}
+        self.events = deque(maxlen=max_events)
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def increment(self, name: str, value: float = 1):
+        """Increment a counter"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: Any):
+        """Set a gauge to its current value"""
+        self.gauges[name] = value
+
+    def record_event(self, name: str, data: Optional[Dict] = None):
+        """Append a timestamped event to the event log"""
+        self.events.append({"time": time.time(), "event": name, "data": data or {}})
+
+    def get_counter(self, name: str, default: float = 0) -> float:
+        """Get a counter value"""
+        return self.counters.get(name, default)
+
+    def snapshot(self, events: int = 50) -> Dict:
+        """Get a JSON-serializable snapshot of all metrics"""
+        with self._lock:
+            counters = dict(self.counters)
+
+        return {
+            "uptime": round(time.time() - self.started_at, 1),
+            "counters": counters,
+            "gauges": dict(self.gauges),
+            "events": list(self.events)[-events:] if events else []
+        }
+
+    def reset(self):
+        """Clear all counters, gauges and events"""
+        with self._lock:
+            self.counters.clear()
+        self.gauges.clear()
+        self.events.clear()
+
+# Shared registry for the whole application
+metrics = Metrics()
@@ -0,0 +1,8 @@
+# DSP package
+from .mixer import AudioMixer
+from .concealment import PacketLossConcealer
+from .sound_bank import SoundBank
+from .preroll import PreRollBuffer
+from .codecs import RecordingWriter, read_recording
+from .audio_bus import AudioBus, BusTap
+from .level_meter import LevelMeter
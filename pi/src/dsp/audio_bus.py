@@ -0,0 +1,158 @@
+"""
+Audio Bus for EmmaPhone2 Pi
+
+A single-producer ring of interleaved int16 frames. The producer (a PortAudio
+callback) copies each block in once; any number of taps read zero-copy NumPy
+views of it at their own pace, each with its own cursor. A tap that falls
+more than the ring's capacity behind is moved forward to the oldest frame
+still held and the overrun is counted, so a slow consumer never stalls the
+producer or the other taps.
+
+Views alias the ring: they stay valid until the producer laps them. Taps
+that keep audio beyond the current read must copy it (e.g. ``.tobytes()``),
+and can use ``BusTap.intact()`` to check a view was not overwritten while
+it was being processed.
+"""
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+class BusTap:
+    """Independent read cursor on an AudioBus"""
+
+    def __init__(self, bus: "AudioBus", name: str):
+        self.bus = bus
+        self.name = name
+        self.position = bus.written
+        self.overruns = 0
+        self.dropped_frames = 0
+        self.frames_read = 0
+        self._last_start = self.position
+
+    def available(self) -> int:
+        """Frames written since this tap's cursor (capped at the ring capacity)"""
+        return min(self.bus.written - self.position, self.bus.capacity)
+
+    def read(self, max_frames: Optional[int] = None) -> np.ndarray:
+        """Get the next unread frames as a (frames, channels) view into the ring
+
+        Returns at most max_frames, and never crosses the end of the ring, so
+        call again (until an empty view) to drain everything.
+        """
+        bus = self.bus
+        written = bus.written
+        behind = written - self.position
+        if behind > bus.capacity:
+            # Lapped by the producer: skip to the oldest frame still in the ring
+            lost = behind - bus.capacity
+            self.overruns += 1
+            self.dropped_frames += lost
+            self.position += lost
+            behind = bus.capacity
+
+        start = self.position % bus.capacity
+        count = min(behind, bus.capacity - start)
+        if max_frames is not None:
+            count = min(count, max_frames)
+
+        self._last_start = self.position
+        self.position += count
+        self.frames_read += count
+        return bus.ring[start:start + count]
+
+    def intact(self) -> bool:
+        """Check the frames returned by the last read have not been overwritten since"""
+        return self.bus.written - self._last_start <= self.bus.capacity
+
+    def time_at_cursor(self) -> float:
+        """Estimated wall-clock time the frame at the cursor was captured"""
+        return self.bus.time_at(self.position)
+
+    def skip_to_end(self):
+        """Discard everything unread"""
+        self.position = self.bus.written
+
+    def get_stats(self) -> Dict:
+        return {
+            "name": self.name,
+            "lag_frames": self.bus.written - self.position,
+            "frames_read": self.frames_read,
+            "overruns": self.overruns,
+            "dropped_frames": self.dropped_frames
+        }
+
+class AudioBus:
+    """Write-once, multi-reader ring of interleaved int16 audio"""
+
+    def __init__(self, name: str, seconds: float = 2.0, sample_rate: int = 44100,
+                 channels: int = 2, block_frames: int = 1024):
+        self.name = name
+        self.sample_rate = sample_rate
+        self.channels = channels
+
+        # A whole number of blocks, so fixed-size writes never straddle the wrap
+        blocks = max(2, int(np.ceil(seconds * sample_rate / block_frames)))
+        self.capacity = blocks * block_frames
+        self.ring = np.zeros((self.capacity, channels), dtype=np.int16)
+
+        # Total frames ever written; only the producer advances it, after copying
+        self.written = 0
+        self.blocks_written = 0
+        self._write_time = time.time()
+        self.taps: Dict[str, BusTap] = {}
+
+    @property
+    def memory_bytes(self) -> int:
+        return self.ring.nbytes
+
+    def write(self, samples: np.ndarray) -> np.ndarray:
+        """Copy interleaved int16 samples into the ring
+
+        Returns a (frames, channels) view of the block as stored, for consumers
+        running inside the producer's callback. Only called from one thread.
+        """
+        frames = samples.reshape(-1, self.channels)
+        n = len(frames)
+        if n > self.capacity:
+            frames = frames[-self.capacity:]
+            self.written += n - self.capacity
+            n = self.capacity
+
+        start = self.written % self.capacity
+        first = min(n, self.capacity - start)
+        self.ring[start:start + first] = frames[:first]
+        if first < n:
+            self.ring[:n - first] = frames[first:]
+
+        self._write_time = time.time()
+        self.written += n
+        self.blocks_written += 1
+
+        if first < n:
+            # Odd-sized write wrapped; hand the caller the source block instead
+            return frames
+        return self.ring[start:start + n]
+
+    def tap(self, name: str) -> BusTap:
+        """Attach a reader starting at the current write position"""
+        tap = BusTap(self, name)
+        self.taps[name] = tap
+        return tap
+
+    def remove_tap(self, name: str):
+        self.taps.pop(name, None)
+
+    def time_at(self, position: int) -> float:
+        """Estimated wall-clock time of the frame at an absolute position"""
+        return self._write_time - (self.written - position) / self.sample_rate
+
+    def get_stats(self) -> Dict:
+        return {
+            "name": self.name,
+            "capacity_frames": self.capacity,
+            "memory_bytes": self.memory_bytes,
+            "frames_written": self.written,
+            "blocks_written": self.blocks_written,
+            "taps": [tap.get_stats() for tap in list(self.taps.values())]
+        }
@@ -0,0 +1,530 @@
+"""
+Recording Codecs for EmmaPhone2 Pi
+
+Streaming G.711 μ-law and IMA-ADPCM encoders/decoders plus a WAV container
+reader/writer for them. μ-law is a table lookup per sample; IMA-ADPCM is
+encoded in independent blocks (the WAV block header carries the predictor
+and step index), so all buffered blocks are processed side by side as
+NumPy vectors.
+
+Usage (encode throughput benchmark):
+    python3 src/dsp/codecs.py --benchmark [seconds]
+"""
+import io
+import logging
+import mmap
+import platform
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional, Tuple, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Feed size for encoding a finished recording: IMA-ADPCM encodes all
+# buffered blocks side by side, so large slices keep the vectors long while
+# bounding the temporary arrays
+ENCODE_SLICE_SECONDS = 120
+
+# WAV format tags
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_MULAW = 0x0007
+WAVE_FORMAT_IMA_ADPCM = 0x0011
+
+CODEC_PCM = "pcm"
+CODEC_MULAW = "mulaw"
+CODEC_IMA_ADPCM = "ima_adpcm"
+CODECS = (CODEC_PCM, CODEC_MULAW, CODEC_IMA_ADPCM)
+
+# --- G.711 μ-law ---------------------------------------------------------
+
+MULAW_BIAS = 0x84
+MULAW_CLIP = 32635
+
+def _build_mulaw_tables() -> Tuple[np.ndarray, np.ndarray]:
+    """Build the 64K-entry encode table (indexed by uint16 view) and 256-entry decode table"""
+    pcm = np.arange(65536, dtype=np.uint16).view(np.int16).astype(np.int32)
+    sign = np.where(pcm < 0, 0x80, 0)
+    magnitude = np.minimum(np.abs(pcm), MULAW_CLIP) + MULAW_BIAS
+    exponent = np.clip(np.frexp(magnitude)[1] - 8, 0, 7)
+    mantissa = (magnitude >> (exponent + 3)) & 0x0F
+    encode = (~(sign | (exponent << 4) | mantissa) & 0xFF).astype(np.uint8)
+
+    codes = ~np.arange(256, dtype=np.int32) & 0xFF
+    exponent = (codes >> 4) & 0x07
+    magnitude = (((codes & 0x0F) << 3) + MULAW_BIAS) << exponent
+    decode = np.where(codes & 0x80, MULAW_BIAS - magnitude, magnitude - MULAW_BIAS).astype(np.int16)
+    return encode, decode
+
+MULAW_ENCODE_TABLE, MULAW_DECODE_TABLE = _build_mulaw_tables()
+
+def mulaw_encode(pcm: np.ndarray) -> bytes:
+    """Encode int16 samples to μ-law bytes"""
+    return MULAW_ENCODE_TABLE[np.ascontiguousarray(pcm, dtype=np.int16).view(np.uint16)].tobytes()
+
+def mulaw_decode(data: bytes) -> np.ndarray:
+    """Decode μ-law bytes to int16 samples"""
+    return MULAW_DECODE_TABLE[np.frombuffer(data, dtype=np.uint8)]
+
+# --- IMA-ADPCM -----------------------------------------------------------
+
+IMA_INDEX_TABLE = np.array([-1, -1, -1, -1, 2, 4, 6, 8] * 2, dtype=np.int32)
+IMA_STEP_TABLE = np.array([
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45,
+    50, 55, 60, 66, 73, 80, 88, 97, 107, 118, 130, 143, 157, 173, 190, 209, 230,
+    253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724, 796, 876, 963,
+    1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327,
+    3660, 4026, 4428, 4871, 5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442,
+    11487, 12635, 13899, 15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794,
+    32767
+], dtype=np.int32)
+
+def ima_block_align(channels: int) -> int:
+    """Block size in bytes used for IMA-ADPCM recordings"""
+    return 512 * channels
+
+def ima_samples_per_block(block_align: int, channels: int) -> int:
+    """Frames per block: one in the header plus two per data byte per channel"""
+    return (block_align - 4 * channels) * 2 // channels + 1
+
+def _ima_encode_blocks(blocks: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Encode lanes of samples (lanes x samples_per_block) into nibbles
+
+    Returns (header predictor, header index, nibbles) per lane.
+    """
+    lanes, length = blocks.shape
+    predictor = blocks[:, 0].astype(np.int32)
+
+    # Each block starts from a step size matched to its own opening slope,
+    # which keeps blocks independent of each other
+    opening = np.abs(np.diff(blocks[:, :17].astype(np.int32), axis=1)).mean(axis=1)
+    index = np.clip(np.searchsorted(IMA_STEP_TABLE, opening), 0, 88).astype(np.int32)
+    header_index = index.copy()
+
+    nibbles = np.empty((lanes, length - 1), dtype=np.uint8)
+    for j in range(1, length):
+        step = IMA_STEP_TABLE[index]
+        diff = blocks[:, j] - predictor
+        sign = diff < 0
+        diff = np.abs(diff)
+
+        code = np.zeros(lanes, dtype=np.int32)
+        vpdiff = step >> 3
+        bit = diff >= step
+        code |= bit * 4
+        diff -= step * bit
+        vpdiff += step * bit
+        half = step >> 1
+        bit = diff >= half
+        code |= bit * 2
+        diff -= half * bit
+        vpdiff += half * bit
+        quarter = step >> 2
+        bit = diff >= quarter
+        code |= bit
+        vpdiff += quarter * bit
+
+        predictor = np.clip(np.where(sign, predictor - vpdiff, predictor + vpdiff), -32768, 32767)
+        index = np.clip(index + IMA_INDEX_TABLE[code], 0, 88)
+        nibbles[:, j - 1] = code | (sign * 8)
+
+    return predictor, header_index, nibbles
+
+def _ima_decode_blocks(first: np.ndarray, index: np.ndarray, nibbles: np.ndarray) -> np.ndarray:
+    """Decode lanes of nibbles back into samples (lanes x samples_per_block)"""
+    lanes, count = nibbles.shape
+    out = np.empty((lanes, count + 1), dtype=np.int16)
+    out[:, 0] = first
+    predictor = first.astype(np.int32)
+    index = np.clip(index.astype(np.int32), 0, 88)
+
+    for j in range(count):
+        code = nibbles[:, j].astype(np.int32)
+        step = IMA_STEP_TABLE[index]
+        vpdiff = (step >> 3) + (code & 4) // 4 * step + (code & 2) // 2 * (step >> 1) + (code & 1) * (step >> 2)
+        predictor = np.clip(np.where(code & 8, predictor - vpdiff, predictor + vpdiff), -32768, 32767)
+        index = np.clip(index + IMA_INDEX_TABLE[code & 7], 0, 88)
+        out[:, j + 1] = predictor
+
+    return out
+
+class ImaAdpcmEncoder:
+    """Streaming IMA-ADPCM encoder emitting complete WAV blocks"""
+
+    def __init__(self, channels: int = 1, block_align: Optional[int] = None):
+        self.channels = channels
+        self.block_align = block_align or ima_block_align(channels)
+        self.samples_per_block = ima_samples_per_block(self.block_align, channels)
+        self._pending = np.zeros((0, channels), dtype=np.int16)
+
+    def encode(self, pcm: np.ndarray) -> bytes:
+        """Buffer interleaved int16 samples and encode all complete blocks"""
+        frames = np.asarray(pcm, dtype=np.int16).reshape(-1, self.channels)
+        if len(self._pending):
+            frames = np.concatenate((self._pending, frames))
+
+        blocks = len(frames) // self.samples_per_block
+        self._pending = frames[blocks * self.samples_per_block:].copy()
+        if not blocks:
+            return b''
+        return self._encode_frames(frames[:blocks * self.samples_per_block], blocks)
+
+    def flush(self) -> bytes:
+        """Encode the remaining frames as a final, padded block"""
+        if not len(self._pending):
+            return b''
+        pad = self.samples_per_block - len(self._pending)
+        # Hold the last sample so the padding encodes cheaply
+        frames = np.concatenate((self._pending, np.repeat(self._pending[-1:], pad, axis=0)))
+        self._pending = np.zeros((0, self.channels), dtype=np.int16)
+        return self._encode_frames(frames, 1)
+
+    def _encode_frames(self, frames: np.ndarray, blocks: int) -> bytes:
+        channels = self.channels
+        spb = self.samples_per_block
+
+        # Lanes are (block, channel) pairs
+        lanes = frames.reshape(blocks, spb, channels).transpose(0, 2, 1).reshape(blocks * channels, spb)
+        _, header_index, nibbles = _ima_encode_blocks(lanes.astype(np.int32))
+
+        # Block header: predictor (int16), step index (uint8), reserved (uint8) per channel
+        header = np.zeros((blocks, channels, 4), dtype=np.uint8)
+        header[:, :, 0:2] = lanes[:, 0].astype("<i2").view(np.uint8).reshape(blocks, channels, 2)
+        header[:, :, 2] = header_index.reshape(blocks, channels)
+
+        # Data: per channel 4-byte groups (8 samples, low nibble first), channels interleaved
+        packed = (nibbles[:, 0::2] | (nibbles[:, 1::2] << 4)).astype(np.uint8)
+        groups = packed.reshape(blocks, channels, -1, 4).transpose(0, 2, 1, 3)
+        data = np.concatenate((header.reshape(blocks, -1), groups.reshape(blocks, -1)), axis=1)
+        return data.tobytes()
+
+def ima_adpcm_decode(data: bytes, channels: int, block_align: int) -> np.ndarray:
+    """Decode complete IMA-ADPCM WAV blocks into interleaved int16 samples"""
+    spb = ima_samples_per_block(block_align, channels)
+    blocks = len(data) // block_align
+    if not blocks:
+        return np.zeros(0, dtype=np.int16)
+
+    raw = np.frombuffer(data, dtype=np.uint8, count=blocks * block_align).reshape(blocks, block_align)
+    header = raw[:, :4 * channels].reshape(blocks, channels, 4)
+    first = header[:, :, 0:2].copy().view("<i2").reshape(blocks * channels)
+    index = header[:, :, 2].reshape(blocks * channels)
+
+    groups = raw[:, 4 * channels:].reshape(blocks, -1, channels, 4).transpose(0, 2, 1, 3)
+    packed = groups.reshape(blocks * channels, -1)
+    nibbles = np.empty((packed.shape[0], packed.shape[1] * 2), dtype=np.uint8)
+    nibbles[:, 0::2] = packed & 0x0F
+    nibbles[:, 1::2] = packed >> 4
+
+    lanes = _ima_decode_blocks(first, index, nibbles[:, :spb - 1])
+    return lanes.reshape(blocks, channels, spb).transpose(0, 2, 1).reshape(-1)
+
+# --- WAV container -------------------------------------------------------
+
+class RecordingWriter:
+    """Streaming WAV writer for PCM, μ-law or IMA-ADPCM audio
+
+    Sizes are patched into the header on close(), so the file is written
+    front to back as audio arrives.
+    """
+
+    def __init__(self, path: Union[str, Path], codec: str = CODEC_IMA_ADPCM,
+                 sample_rate: int = 44100, channels: int = 1, input_channels: Optional[int] = None):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec '{codec}'")
+
+        self.path = str(path)
+        self.codec = codec
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.input_channels = input_channels or channels
+        self.frames = 0
+        self.data_bytes = 0
+
+        self._encoder = ImaAdpcmEncoder(channels) if codec == CODEC_IMA_ADPCM else None
+        self._file: BinaryIO = open(self.path, "wb")
+        self._write_header()
+
+    def _format_chunk(self) -> bytes:
+        channels, rate = self.channels, self.sample_rate
+        if self.codec == CODEC_PCM:
+            return struct.pack("<HHIIHH", WAVE_FORMAT_PCM, channels, rate, rate * channels * 2, channels * 2, 16)
+        if self.codec == CODEC_MULAW:
+            return struct.pack("<HHIIHHH", WAVE_FORMAT_MULAW, channels, rate, rate * channels, channels, 8, 0)
+        encoder = self._encoder
+        byte_rate = rate * encoder.block_align // encoder.samples_per_block
+        return struct.pack("<HHIIHHHH", WAVE_FORMAT_IMA_ADPCM, channels, rate, byte_rate,
+                           encoder.block_align, 4, 2, encoder.samples_per_block)
+
+    def _write_header(self):
+        fmt = self._format_chunk()
+        header = b"RIFF" + struct.pack("<I", 0) + b"WAVE"
+        header += b"fmt " + struct.pack("<I", len(fmt)) + fmt
+        if self.codec != CODEC_PCM:
+            # Compressed formats carry the true frame count in a fact chunk
+            self._fact_offset = len(header) + 8
+            header += b"fact" + struct.pack("<II", 4, 0)
+        self._data_offset = len(header) + 8
+        header += b"data" + struct.pack("<I", 0)
+        self._file.write(header)
+
+    def write(self, pcm: np.ndarray):
+        """Append interleaved int16 samples in input_channels layout"""
+        pcm = np.asarray(pcm, dtype=np.int16)
+        if self.input_channels != self.channels:
+            frames = pcm.reshape(-1, self.input_channels)
+            if self.channels == 1:
+                pcm = frames.mean(axis=1).astype(np.int16)
+            else:
+                pcm = np.repeat(frames[:, :1], self.channels, axis=1).reshape(-1)
+
+        self.frames += len(pcm) // self.channels
+        if self.codec == CODEC_PCM:
+            data = pcm.astype("<i2").tobytes()
+        elif self.codec == CODEC_MULAW:
+            data = mulaw_encode(pcm)
+        else:
+            data = self._encoder.encode(pcm)
+
+        self._file.write(data)
+        self.data_bytes += len(data)
+
+    def close(self):
+        """Flush the encoder and finalize the header sizes"""
+        if self._file.closed:
+            return
+
+        if self._encoder:
+            data = self._encoder.flush()
+            self._file.write(data)
+            self.data_bytes += len(data)
+
+        if self.data_bytes % 2:
+            self._file.write(b"\x00")  # RIFF chunks are word aligned
+
+        end = self._file.tell()
+        self._file.seek(4)
+        self._file.write(struct.pack("<I", end - 8))
+        if self.codec != CODEC_PCM:
+            self._file.seek(self._fact_offset)
+            self._file.write(struct.pack("<I", self.frames))
+        self._file.seek(self._data_offset - 4)
+        self._file.write(struct.pack("<I", self.data_bytes))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _read_source(source: Union[str, Path, bytes]) -> bytes:
+    if isinstance(source, (bytes, bytearray, mmap.mmap)):
+        return source
+    return Path(source).read_bytes()
+
+def read_wav_info(source: Union[str, Path, bytes]) -> Dict:
+    """Parse a WAV file's format, frame count and data location"""
+    data = _read_source(source)
+    if data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise ValueError("Not a WAV file")
+
+    info = {"frames": None}
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id = data[offset:offset + 4]
+        size = struct.unpack_from("<I", data, offset + 4)[0]
+        body = offset + 8
+
+        if chunk_id == b"fmt ":
+            tag, channels, rate, _, block_align, bits = struct.unpack_from("<HHIIHH", data, body)
+            info.update(format_tag=tag, channels=channels, sample_rate=rate,
+                        block_align=block_align, bits=bits)
+        elif chunk_id == b"fact":
+            info["frames"] = struct.unpack_from("<I", data, body)[0]
+        elif chunk_id == b"data":
+            # Tolerate an unpatched (zero) size from an interrupted writer
+            info["data_offset"] = body
+            info["data_size"] = size if size else len(data) - body
+            break
+
+        offset = body + size + (size & 1)
+
+    if "format_tag" not in info or "data_offset" not in info:
+        raise ValueError("Missing fmt or data chunk")
+
+    info["codec"] = {
+        WAVE_FORMAT_PCM: CODEC_PCM,
+        WAVE_FORMAT_MULAW: CODEC_MULAW,
+        WAVE_FORMAT_IMA_ADPCM: CODEC_IMA_ADPCM
+    }.get(info["format_tag"])
+    return info
+
+def read_recording(source: Union[str, Path, bytes]) -> Tuple[np.ndarray, int, int]:
+    """Decode a PCM, μ-law or IMA-ADPCM WAV into (int16 samples, sample rate, channels)"""
+    data = _read_source(source)
+    info = read_wav_info(data)
+    payload = data[info["data_offset"]:info["data_offset"] + info["data_size"]]
+    channels = info["channels"]
+
+    if info["codec"] == CODEC_PCM and info["bits"] == 16:
+        pcm = np.frombuffer(payload[:len(payload) // 2 * 2], dtype="<i2").astype(np.int16)
+    elif info["codec"] == CODEC_MULAW:
+        pcm = mulaw_decode(payload)
+    elif info["codec"] == CODEC_IMA_ADPCM:
+        pcm = ima_adpcm_decode(payload, channels, info["block_align"])
+    else:
+        raise ValueError(f"Unsupported WAV format {info['format_tag']:#x} ({info['bits']} bits)")
+
+    if info["frames"] is not None:
+        pcm = pcm[:info["frames"] * channels]
+    return pcm, info["sample_rate"], channels
+
+def to_pcm_wav(source: Union[str, Path, bytes]) -> bytes:
+    """Decode any supported recording into 16-bit PCM WAV bytes (for browsers)"""
+    pcm, rate, channels = read_recording(source)
+    out = io.BytesIO()
+    body = pcm.astype("<i2").tobytes()
+    out.write(b"RIFF" + struct.pack("<I", 36 + len(body)) + b"WAVE")
+    out.write(b"fmt " + struct.pack("<IHHIIHH", 16, WAVE_FORMAT_PCM, channels, rate,
+                                    rate * channels * 2, channels * 2, 16))
+    out.write(b"data" + struct.pack("<I", len(body)) + body)
+    return out.getvalue()
+
+def _pcm_wav_header(frames: int, sample_rate: int, channels: int) -> bytes:
+    body = frames * channels * 2
+    return (b"RIFF" + struct.pack("<I", 36 + body) + b"WAVE" +
+            b"fmt " + struct.pack("<IHHIIHH", 16, WAVE_FORMAT_PCM, channels, sample_rate,
+                                  sample_rate * channels * 2, channels * 2, 16) +
+            b"data" + struct.pack("<I", body))
+
+class RecordingView:
+    """Random-access byte view of a recording backed by mmap
+
+    With ``decode=True`` the view presents the recording as a 16-bit PCM WAV
+    and decodes only the μ-law bytes or IMA-ADPCM blocks covering each read,
+    so byte ranges of long recordings can be served without loading them.
+    """
+
+    def __init__(self, path: Union[str, Path], decode: bool = True):
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.info = read_wav_info(self._map)
+        self.decode = decode and self.info["codec"] != CODEC_PCM
+
+        channels = self.info["channels"]
+        if self.info["codec"] not in (CODEC_PCM, CODEC_MULAW, CODEC_IMA_ADPCM):
+            self.decode = False
+        if self.decode:
+            frames = self.info["frames"]
+            if frames is None:
+                frames = self._encoded_frames()
+            self.frames = frames
+            self._header = _pcm_wav_header(frames, self.info["sample_rate"], channels)
+            self.size = len(self._header) + frames * channels * 2
+        else:
+            self.size = len(self._map)
+
+    def _encoded_frames(self) -> int:
+        info = self.info
+        if info["codec"] == CODEC_MULAW:
+            return info["data_size"] // info["channels"]
+        spb = ima_samples_per_block(info["block_align"], info["channels"])
+        return info["data_size"] // info["block_align"] * spb
+
+    def read(self, start: int, end: int) -> bytes:
+        """Read bytes [start, end) of the (possibly decoded) view"""
+        start, end = max(0, start), min(end, self.size)
+        if start >= end:
+            return b''
+        if not self.decode:
+            return self._map[start:end]
+
+        out = b''
+        header_size = len(self._header)
+        if start < header_size:
+            out = self._header[start:min(end, header_size)]
+            start = header_size
+            if start >= end:
+                return out
+
+        # Sample range covering the requested PCM bytes
+        first_sample = (start - header_size) // 2
+        last_sample = (end - header_size + 1) // 2
+        pcm = self._decode_samples(first_sample, last_sample)
+        offset = (start - header_size) - first_sample * 2
+        return out + pcm.astype("<i2").tobytes()[offset:offset + (end - start)]
+
+    def _decode_samples(self, first: int, last: int) -> np.ndarray:
+        info = self.info
+        channels = info["channels"]
+        data_offset = info["data_offset"]
+
+        if info["codec"] == CODEC_MULAW:
+            return mulaw_decode(self._map[data_offset + first:data_offset + last])
+
+        block_align = info["block_align"]
+        spb = ima_samples_per_block(block_align, channels)
+        first_block = first // channels // spb
+        last_block = -(-(last // channels + 1) // spb)
+        blocks = self._map[data_offset + first_block * block_align:data_offset + last_block * block_align]
+        pcm = ima_adpcm_decode(blocks, channels, block_align)
+        skip = first - first_block * spb * channels
+        return pcm[skip:skip + (last - first)]
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def benchmark(seconds: float = 10.0, sample_rate: int = 44100, channels: int = 1) -> Dict:
+    """Measure encode throughput as multiples of real time"""
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    voice = 6000 * np.sin(2 * np.pi * 180 * t) * (1 + np.sin(2 * np.pi * 3 * t)) / 2
+    noise = np.random.default_rng(0).normal(0, 300, len(t))
+    pcm = np.repeat((voice + noise).astype(np.int16)[:, None], channels, axis=1).reshape(-1)
+
+    results = {}
+    for codec in CODECS:
+        buffer = io.BytesIO()
+        started = time.perf_counter()
+        if codec == CODEC_MULAW:
+            encoded = mulaw_encode(pcm)
+        elif codec == CODEC_IMA_ADPCM:
+            encoder = ImaAdpcmEncoder(channels)
+            # Feed in slices, as the recorder does
+            step = ENCODE_SLICE_SECONDS * sample_rate * channels
+            encoded = b''.join(encoder.encode(pcm[i:i + step]) for i in range(0, len(pcm), step))
+            encoded += encoder.flush()
+        else:
+            encoded = pcm.tobytes()
+        elapsed = time.perf_counter() - started
+        buffer.write(encoded)
+
+        results[codec] = {
+            "realtime_x": round(seconds / elapsed, 1) if elapsed else None,
+            "ms_per_second": round(elapsed / seconds * 1000.0, 2),
+            "size_ratio": round(len(encoded) / (len(pcm) * 2), 3)
+        }
+    return results
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "--benchmark":
+        print(__doc__)
+        sys.exit(1)
+
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 10.0
+    print(f"{platform.machine()} ({platform.processor() or platform.platform()})")
+    for channel_count in (1, 2):
+        print(f"{channel_count} channel(s), {duration:.0f}s at 44.1 kHz:")
+        for name, result in benchmark(duration, channels=channel_count).items():
+            print(f"  {name:<10} {result['realtime_x']:>8}x realtime  "
+                  f"{result['ms_per_second']:>7} ms/s  size {result['size_ratio']:.3f}")
@@ -0,0 +1,240 @@
+"""
+Playback Concealment for EmmaPhone2 Pi
+
+Fills gaps in the received audio (jitter buffer underruns, lost packets)
+instead of playing hard digital silence. Short gaps repeat the last pitch
+period of the signal; longer gaps fade into comfort noise at the measured
+background level. All work on the audio is vectorized over the chunk.
+"""
+import logging
+from collections import deque
+from typing import Dict
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+logger = logging.getLogger(__name__)
+
+class PacketLossConcealer:
+    """Pitch-repetition concealment with a fade to comfort noise"""
+
+    def __init__(self,
+                 sample_rate: int = 44100,
+                 channels: int = 2,
+                 min_pitch_hz: float = 70.0,
+                 max_pitch_hz: float = 400.0,
+                 hold_ms: float = 20.0,
+                 fade_ms: float = 60.0,
+                 crossfade_ms: float = 4.0,
+                 noise_floor_min: float = 20.0,
+                 noise_window_s: float = 8.0,
+                 noise_rise_db_per_s: float = 3.0):
+        self.sample_rate = sample_rate
+        self.channels = channels
+
+        self.min_lag = int(sample_rate / max_pitch_hz)
+        self.max_lag = int(sample_rate / min_pitch_hz)
+        # Repeat at full level for hold, then fade over fade into comfort noise
+        self.hold_frames = int(sample_rate * hold_ms / 1000.0)
+        self.fade_frames = max(1, int(sample_rate * fade_ms / 1000.0))
+        self.crossfade_frames = max(1, int(sample_rate * crossfade_ms / 1000.0))
+        self.noise_floor_min = noise_floor_min
+
+        # Recent real audio (frames x channels); long enough for the pitch
+        # search window plus one maximum-length period and its seam
+        self.history_frames = 2 * self.max_lag + self.crossfade_frames
+        self.history = np.zeros((self.history_frames, channels), dtype=np.float32)
+        self.history_filled = 0
+
+        # One second of unit-RMS, lightly low-passed noise read cyclically
+        rng = np.random.default_rng()
+        noise = rng.standard_normal(sample_rate + 1).astype(np.float32)
+        noise = (noise[1:] + noise[:-1]) * 0.5
+        self.noise = noise / np.sqrt(np.mean(noise ** 2))
+        self.noise_pos = 0
+
+        # Ramps reused for crossfades
+        self._ramp_up = np.linspace(0.0, 1.0, self.crossfade_frames, dtype=np.float32)[:, None]
+
+        # Minimum statistics: the background level is the quietest chunk in
+        # the last noise_window_s, kept as per-second minima. Speech rarely
+        # goes that long without a pause, and the floor may only rise slowly.
+        self.noise_floor = noise_floor_min
+        self.noise_rise_db_per_s = noise_rise_db_per_s
+        self._minima = deque(maxlen=max(1, int(round(noise_window_s))))
+        self._subwindow_frames = int(sample_rate * noise_window_s / self._minima.maxlen)
+        self._subwindow_min = float("inf")
+        self._subwindow_filled = 0
+        self._cycle = None
+        self._gap_pos = 0
+
+        # Counters
+        self.concealed_frames = 0
+        self.comfort_noise_frames = 0
+        self.concealment_events = 0
+        self.longest_gap_frames = 0
+
+    @property
+    def concealing(self) -> bool:
+        return self._cycle is not None
+
+    def process(self, chunk: np.ndarray, valid_frames: int) -> np.ndarray:
+        """Conceal everything after ``valid_frames`` in an interleaved int16 chunk
+
+        Returns the chunk to play (a new array when anything was modified).
+        """
+        frame_count = len(chunk) // self.channels
+        valid_frames = max(0, min(valid_frames, frame_count))
+
+        if valid_frames == frame_count and not self.concealing:
+            # Fast path: real audio only
+            frames = chunk.reshape(frame_count, self.channels).astype(np.float32)
+            self._update_history(frames)
+            return chunk
+
+        frames = chunk.reshape(frame_count, self.channels).astype(np.float32)
+
+        if valid_frames:
+            if self.concealing:
+                self._end_gap(frames[:valid_frames])
+            self._update_history(frames[:valid_frames])
+
+        missing = frame_count - valid_frames
+        if missing:
+            if not self.concealing:
+                self._start_gap()
+            start = self._gap_pos
+            frames[valid_frames:] = self._synthesize(missing)
+
+            # Frames past hold + fade are pure comfort noise
+            noise_start = self.hold_frames + self.fade_frames
+            self.concealed_frames += missing
+            self.comfort_noise_frames += max(0, self._gap_pos - max(start, noise_start))
+
+        np.clip(frames, -32768.0, 32767.0, out=frames)
+        return frames.astype(np.int16).reshape(-1)
+
+    def _update_history(self, frames: np.ndarray):
+        """Append real audio to the history and track the background level"""
+        n = len(frames)
+        if n >= self.history_frames:
+            self.history[:] = frames[-self.history_frames:]
+        else:
+            self.history[:-n] = self.history[n:]
+            self.history[-n:] = frames
+        self.history_filled = min(self.history_filled + n, self.history_frames)
+
+        rms = float(np.sqrt(np.mean(frames * frames)))
+        self._subwindow_min = min(self._subwindow_min, rms)
+        self._subwindow_filled += n
+        if self._subwindow_filled >= self._subwindow_frames:
+            self._minima.append(self._subwindow_min)
+            self._subwindow_min = float("inf")
+            self._subwindow_filled = 0
+
+        # Follow the windowed minimum down at once, up by at most the rise rate
+        target = max(min(self._subwindow_min, min(self._minima, default=float("inf"))), self.noise_floor_min)
+        if target < self.noise_floor:
+            self.noise_floor = target
+        else:
+            rise = 10.0 ** (self.noise_rise_db_per_s * n / self.sample_rate / 20.0)
+            self.noise_floor = min(target, self.noise_floor * rise)
+
+    def _estimate_period(self) -> int:
+        """Find the pitch period (frames) by normalized autocorrelation"""
+        mono = self.history[-(self.max_lag + self.max_lag):].mean(axis=1)
+        window = self.max_lag
+        target = mono[-window:]
+        target_energy = float(np.dot(target, target))
+        if target_energy <= 0.0:
+            return self.min_lag
+
+        # Row i of the view starts i frames into the search region, so the
+        # window ending lag frames before the end is row (max_lag - lag)
+        segments = sliding_window_view(mono[:-1], window)[-self.max_lag:]
+        correlation = segments @ target
+        energy = np.einsum("ij,ij->i", segments, segments)
+        normalized = correlation / np.sqrt(energy * target_energy + 1e-9)
+
+        lags = self.max_lag - np.arange(len(segments))
+        candidates = lags >= self.min_lag
+        best = np.argmax(np.where(candidates, normalized, -np.inf))
+        return int(lags[best])
+
+    def _start_gap(self):
+        """Prepare one pitch cycle to repeat through the gap"""
+        if self.history_filled < self.history_frames:
+            period = self.min_lag
+        else:
+            period = self._estimate_period()
+
+        # Blend the end of the cycle into the frames that preceded it in the
+        # real signal so the seam between repetitions is continuous
+        cycle = self.history[-period:].copy()
+        overlap = min(self.crossfade_frames, period)
+        ramp = self._ramp_up[-overlap:] if overlap < self.crossfade_frames else self._ramp_up
+        before = self.history[-period - overlap:-period]
+        cycle[-overlap:] = cycle[-overlap:] * (1.0 - ramp) + before * ramp
+
+        self._cycle = cycle
+        self._gap_pos = 0
+        self.concealment_events += 1
+
+    def _synthesize(self, n: int) -> np.ndarray:
+        """Generate the next n frames of concealment audio"""
+        position = self._gap_pos + np.arange(n)
+        cycle = self._cycle
+
+        # Pitch repetition envelope: hold, then linear fade to zero
+        envelope = np.clip(1.0 - (position - self.hold_frames) / self.fade_frames, 0.0, 1.0)
+        envelope = envelope.astype(np.float32)[:, None]
+
+        repeated = cycle[position % len(cycle)]
+        noise_index = (self.noise_pos + np.arange(n)) % len(self.noise)
+        noise = (self.noise[noise_index] * self.noise_floor)[:, None]
+        output = repeated * envelope + noise * (1.0 - envelope)
+
+        self.noise_pos = int((self.noise_pos + n) % len(self.noise))
+        self._gap_pos += n
+        return output
+
+    def _end_gap(self, frames: np.ndarray):
+        """Cross-fade from the concealment signal back into real audio (in place)"""
+        gap_frames = self._gap_pos
+        overlap = min(self.crossfade_frames, len(frames))
+        tail = self._synthesize(overlap)
+
+        ramp = self._ramp_up[:overlap] if overlap == self.crossfade_frames else \
+            np.linspace(0.0, 1.0, overlap, dtype=np.float32)[:, None]
+        frames[:overlap] = tail * (1.0 - ramp) + frames[:overlap] * ramp
+
+        self.longest_gap_frames = max(self.longest_gap_frames, gap_frames)
+        self._cycle = None
+        self._gap_pos = 0
+
+    def reset(self):
+        """Forget history and counters (e.g. for a new call)"""
+        self.history[:] = 0.0
+        self.history_filled = 0
+        self.noise_floor = self.noise_floor_min
+        self._minima.clear()
+        self._subwindow_min = float("inf")
+        self._subwindow_filled = 0
+        self._cycle = None
+        self._gap_pos = 0
+        self.concealed_frames = 0
+        self.comfort_noise_frames = 0
+        self.concealment_events = 0
+        self.longest_gap_frames = 0
+
+    def get_stats(self) -> Dict:
+        """Get how much audio was concealed"""
+        to_ms = 1000.0 / self.sample_rate
+        return {
+            "concealing": self.concealing,
+            "concealment_events": self.concealment_events,
+            "concealed_ms": round(self.concealed_frames * to_ms, 1),
+            "comfort_noise_ms": round(self.comfort_noise_frames * to_ms, 1),
+            "longest_gap_ms": round(self.longest_gap_frames * to_ms, 1),
+            "noise_floor": round(self.noise_floor, 1)
+        }
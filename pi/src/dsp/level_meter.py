@@ -0,0 +1,110 @@
+"""
+Level Meter for EmmaPhone2 Pi
+
+Updated from the capture callback with each block: per-channel RMS and peak
+are computed in one vectorized pass and smoothed with exponential moving
+averages (RMS follows a time constant, peak jumps up instantly and falls
+back slowly). The values live in a small preallocated array guarded by a
+sequence counter, so readers on any thread take a consistent snapshot
+without locks and without touching the audio stream.
+"""
+import math
+import time
+from typing import Dict
+
+import numpy as np
+
+# Rows of the shared values array
+RMS = 0
+RMS_SMOOTHED = 1
+PEAK = 2
+PEAK_HOLD = 3
+
+FULL_SCALE = 32768.0
+
+def _to_db(level: float) -> float:
+    return round(20.0 * math.log10(level), 1) if level > 1e-6 else -120.0
+
+class LevelMeter:
+    """Single-writer, lock-free RMS/peak meter for interleaved int16 blocks"""
+
+    def __init__(self, channels: int = 2, sample_rate: int = 44100,
+                 rms_time_constant: float = 0.3, peak_fall_db_per_second: float = 20.0):
+        self.channels = channels
+        self.sample_rate = sample_rate
+        self.rms_time_constant = rms_time_constant
+        self.peak_fall_db_per_second = peak_fall_db_per_second
+
+        # Normalized 0..1 levels, one column per channel
+        self.values = np.zeros((4, channels), dtype=np.float64)
+        self.blocks = 0
+        self.updated = 0.0
+        # Odd while the writer is mid-update
+        self._sequence = 0
+
+        self._coefficients = {}
+
+    def _block_coefficients(self, frames: int):
+        """EMA weight and peak decay for a block length (cached, blocks are fixed-size)"""
+        coefficients = self._coefficients.get(frames)
+        if coefficients is None:
+            duration = frames / self.sample_rate
+            alpha = 1.0 - math.exp(-duration / self.rms_time_constant)
+            decay = 10.0 ** (-self.peak_fall_db_per_second * duration / 20.0)
+            coefficients = self._coefficients[frames] = (alpha, decay)
+        return coefficients
+
+    def update(self, block: np.ndarray):
+        """Fold one captured block into the meter (called from the capture callback)"""
+        frames = block.reshape(-1, self.channels)
+        if not len(frames):
+            return
+        alpha, decay = self._block_coefficients(len(frames))
+
+        scaled = frames.astype(np.float32)
+        scaled *= 1.0 / FULL_SCALE
+        rms = np.sqrt(np.einsum("ij,ij->j", scaled, scaled) / len(frames))
+        peak = np.abs(scaled).max(axis=0)
+
+        values = self.values
+        self._sequence += 1
+        values[RMS] = rms
+        values[RMS_SMOOTHED] += alpha * (rms - values[RMS_SMOOTHED])
+        values[PEAK] = peak
+        np.maximum(peak, values[PEAK_HOLD] * decay, out=values[PEAK_HOLD])
+        self.blocks += 1
+        self.updated = time.monotonic()
+        self._sequence += 1
+
+    def snapshot(self) -> np.ndarray:
+        """Get a consistent copy of the values array (retries if it raced the writer)"""
+        for _ in range(8):
+            sequence = self._sequence
+            if sequence % 2 == 0:
+                values = self.values.copy()
+                if self._sequence == sequence:
+                    return values
+        return self.values.copy()
+
+    def level(self) -> float:
+        """Smoothed RMS of the loudest channel, 0..1"""
+        return float(self.snapshot()[RMS_SMOOTHED].max())
+
+    def reset(self):
+        self._sequence += 1
+        self.values[:] = 0.0
+        self._sequence += 1
+
+    def get_levels(self) -> Dict:
+        """Get the current levels, per channel and overall, with dBFS equivalents"""
+        values = self.snapshot()
+        rms, peak = float(values[RMS_SMOOTHED].max()), float(values[PEAK_HOLD].max())
+        return {
+            "level": round(rms, 4),
+            "peak": round(peak, 4),
+            "rms_db": _to_db(rms),
+            "peak_db": _to_db(peak),
+            "instant_rms": [round(float(v), 4) for v in values[RMS]],
+            "channels": [round(float(v), 4) for v in values[RMS_SMOOTHED]],
+            "age_ms": round((time.monotonic() - self.updated) * 1000.0, 1) if self.blocks else None
+        }
@@ -0,0 +1,211 @@
+"""
+N-way Audio Mixer for EmmaPhone2 Pi
+
+Sums remote participants' audio into one output stream. Every participant
+gets a row in a preallocated ring matrix and each output chunk is produced
+with a single gather/sum over all rows, so the cost per chunk does not
+depend on how many people are talking.
+"""
+import logging
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+def soft_clip(samples: np.ndarray, knee: float = 0.8) -> np.ndarray:
+    """Soft-clip float samples in [-inf, inf] into (-1, 1) above a knee (in place)"""
+    magnitude = np.abs(samples)
+    over = magnitude > knee
+    if over.any():
+        span = 1.0 - knee
+        compressed = knee + span * np.tanh((magnitude[over] - knee) / span)
+        samples[over] = np.copysign(compressed, samples[over])
+    return samples
+
+class AudioMixer:
+    """Per-participant input rings mixed with headroom and a soft clipper"""
+
+    def __init__(self,
+                 channels: int = 2,
+                 max_inputs: int = 8,
+                 capacity_frames: int = 44100,
+                 headroom_db: float = -3.0,
+                 silence_threshold: int = 64,
+                 stall_timeout: float = 0.5,
+                 max_latency_frames: Optional[int] = None):
+        self.channels = channels
+        self.max_inputs = max_inputs
+        self.capacity = capacity_frames * channels  # samples per ring
+        self.gain = 10 ** (headroom_db / 20.0)
+        self.silence_threshold = silence_threshold
+        self.stall_timeout = stall_timeout
+        # Drop the oldest audio once an input is buffered beyond this
+        self.max_latency = (max_latency_frames or capacity_frames // 2) * channels
+
+        # Ring matrix (one row per input) and per-row state
+        self.rings = np.zeros((max_inputs, self.capacity), dtype=np.float32)
+        self.read_pos = np.zeros(max_inputs, dtype=np.int64)
+        self.available = np.zeros(max_inputs, dtype=np.int64)
+        self.active = np.zeros(max_inputs, dtype=bool)
+        self.silent = np.zeros(max_inputs, dtype=bool)
+        self.last_push = np.zeros(max_inputs, dtype=np.float64)
+
+        self.inputs: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+        # Scratch buffers reused by mix() (resized on chunk size change)
+        self._offsets = np.arange(0, dtype=np.int64)
+
+        # Counters
+        self.chunks_mixed = 0
+        self.underruns = 0
+        self.dropped_samples = 0
+        self.last_mix_underrun = False
+        self.last_mix_frames = 0
+
+    def add_input(self, input_id: str) -> bool:
+        """Register an input (participant); returns False if all rows are taken"""
+        with self._lock:
+            if input_id in self.inputs:
+                return True
+
+            free = np.flatnonzero(~self.active)
+            if not len(free):
+                logger.warning(f"⚠️ Mixer full, ignoring input {input_id}")
+                return False
+
+            row = int(free[0])
+            self.inputs[input_id] = row
+            self.active[row] = True
+            self.silent[row] = True
+            self.read_pos[row] = 0
+            self.available[row] = 0
+            self.last_push[row] = time.monotonic()
+
+        logger.info(f"🎚️ Mixer input added: {input_id} (row {row})")
+        return True
+
+    def remove_input(self, input_id: str):
+        """Unregister an input and release its row"""
+        with self._lock:
+            row = self.inputs.pop(input_id, None)
+            if row is None:
+                return
+            self.active[row] = False
+            self.available[row] = 0
+
+        logger.info(f"🎚️ Mixer input removed: {input_id}")
+
+    def push(self, input_id: str, pcm: np.ndarray):
+        """Append interleaved int16 samples for an input"""
+        row = self.inputs.get(input_id)
+        if row is None:
+            return
+
+        n = len(pcm)
+        if n == 0:
+            return
+        if n > self.capacity:
+            pcm = pcm[-self.capacity:]
+            n = self.capacity
+
+        peak = int(np.max(np.abs(pcm)))
+
+        with self._lock:
+            if not self.active[row]:
+                return
+
+            write = (self.read_pos[row] + self.available[row]) % self.capacity
+            first = min(n, self.capacity - write)
+            self.rings[row, write:write + first] = pcm[:first]
+            if first < n:
+                self.rings[row, :n - first] = pcm[first:]
+
+            available = self.available[row] + n
+            if available > self.max_latency:
+                # Too far behind real time: skip ahead to bound latency
+                excess = available - self.max_latency
+                self.read_pos[row] = (self.read_pos[row] + excess) % self.capacity
+                available -= excess
+                self.dropped_samples += int(excess)
+            self.available[row] = available
+
+            self.silent[row] = peak < self.silence_threshold
+            self.last_push[row] = time.monotonic()
+
+    def mix(self, frame_count: int) -> Tuple[np.ndarray, int]:
+        """Produce one interleaved int16 output chunk
+
+        Returns the chunk and the number of inputs that contributed audio.
+        ``last_mix_frames`` is set to how many leading frames hold real audio.
+        """
+        n = frame_count * self.channels
+        if len(self._offsets) != n:
+            self._offsets = np.arange(n, dtype=np.int64)
+        offsets = self._offsets
+
+        with self._lock:
+            # Drop stalled inputs' stale audio; they rejoin on the next push
+            stalled = self.active & (time.monotonic() - self.last_push > self.stall_timeout)
+            self.available[stalled] = 0
+
+            take = np.minimum(self.available, n)
+            contributing = self.active & ~self.silent & (take > 0)
+            waiting = self.active & ~stalled & (self.available < n)
+            # Frames of real (possibly silent) audio in this chunk
+            live = self.active & ~stalled
+            valid = int(take[live].max()) // self.channels if live.any() else 0
+
+            # One gather across every row, masked to the samples each row has
+            index = (self.read_pos[:, None] + offsets[None, :]) % self.capacity
+            block = np.take_along_axis(self.rings, index, axis=1)
+            mask = (offsets[None, :] < take[:, None]) & contributing[:, None]
+            mixed = np.sum(block * mask, axis=0)
+
+            self.read_pos = (self.read_pos + take) % self.capacity
+            self.available -= take
+
+        mixed *= self.gain * (1.0 / 32768.0)
+        soft_clip(mixed)
+        output = (mixed * 32767.0).astype(np.int16)
+
+        active_count = int(np.count_nonzero(contributing))
+        self.chunks_mixed += 1
+        self.last_mix_underrun = bool(waiting.any())
+        self.last_mix_frames = valid
+        if self.last_mix_underrun:
+            self.underruns += 1
+
+        return output, active_count
+
+    def buffered_frames(self) -> int:
+        """Get the deepest input buffer in frames (jitter buffer depth)"""
+        with self._lock:
+            if not self.active.any():
+                return 0
+            return int(self.available[self.active].max()) // self.channels
+
+    def has_inputs(self) -> bool:
+        """Check if any input is registered"""
+        return bool(self.inputs)
+
+    def reset(self):
+        """Remove all inputs and clear the rings"""
+        with self._lock:
+            self.inputs.clear()
+            self.active[:] = False
+            self.available[:] = 0
+            self.read_pos[:] = 0
+
+    def get_stats(self) -> Dict:
+        """Get mixer counters"""
+        return {
+            "inputs": list(self.inputs.keys()),
+            "chunks_mixed": self.chunks_mixed,
+            "underruns": self.underruns,
+            "dropped_samples": self.dropped_samples,
+            "buffered_frames": self.buffered_frames()
+        }
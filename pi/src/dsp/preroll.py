@@ -0,0 +1,98 @@
+"""
+Pre-roll Buffer for EmmaPhone2 Pi
+
+Fixed-size rings that always hold the last few seconds of microphone and
+remote audio during a call, so a call recording started after the fact
+can include what happened just before it was requested.
+"""
+import threading
+from typing import Dict
+
+import numpy as np
+
+# Ring rows
+MICROPHONE = 0
+INCOMING = 1
+
+class PreRollBuffer:
+    """Constant-memory rings of recent interleaved int16 PCM per source"""
+
+    def __init__(self, seconds: float = 20.0, sample_rate: int = 44100, channels: int = 2):
+        self.seconds = seconds
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.capacity = max(1, int(seconds * sample_rate)) * channels
+
+        self.rings = np.zeros((2, self.capacity), dtype=np.int16)
+        # Total samples ever written per ring (write position = written % capacity)
+        self.written = [0, 0]
+        self._lock = threading.Lock()
+
+    @property
+    def memory_bytes(self) -> int:
+        return self.rings.nbytes
+
+    def write(self, source: int, samples: np.ndarray):
+        """Append interleaved int16 samples to a source's ring"""
+        n = len(samples)
+        if n == 0:
+            return
+        if n > self.capacity:
+            samples = samples[-self.capacity:]
+            skipped = n - self.capacity
+            n = self.capacity
+        else:
+            skipped = 0
+
+        ring = self.rings[source]
+        with self._lock:
+            start = (self.written[source] + skipped) % self.capacity
+            first = min(n, self.capacity - start)
+            ring[start:start + first] = samples[:first]
+            if first < n:
+                ring[:n - first] = samples[first:]
+            self.written[source] += skipped + n
+
+    def read(self, source: int) -> np.ndarray:
+        """Get a chronological copy of a source's buffered samples"""
+        with self._lock:
+            written = self.written[source]
+            ring = self.rings[source]
+            if written <= self.capacity:
+                return ring[:written].copy()
+            start = written % self.capacity
+            return np.concatenate((ring[start:], ring[:start]))
+
+    def mixed(self) -> bytes:
+        """Mix both sources, aligned at their most recent sample"""
+        mic, incoming = self.read(MICROPHONE), self.read(INCOMING)
+        length = max(len(mic), len(incoming))
+        length -= length % self.channels
+        if not length:
+            return b''
+
+        # Sources that started later are padded with leading silence
+        mixed = np.zeros(length, dtype=np.int32)
+        for pcm in (mic, incoming):
+            pcm = pcm[len(pcm) - min(len(pcm), length):]
+            mixed[length - len(pcm):] += pcm
+        # Same halving as the live call recording mix
+        mixed //= 2
+        return mixed.astype(np.int16).tobytes()
+
+    def buffered_seconds(self) -> float:
+        """Get how much audio the fuller ring currently holds"""
+        samples = min(max(self.written), self.capacity)
+        return samples / self.channels / self.sample_rate
+
+    def clear(self):
+        """Forget buffered audio"""
+        with self._lock:
+            self.written = [0, 0]
+
+    def get_status(self) -> Dict:
+        return {
+            "seconds": self.seconds,
+            "buffered_seconds": round(self.buffered_seconds(), 2),
+            "memory_bytes": self.memory_bytes
+        }
@@ -0,0 +1,208 @@
+"""
+Sound Bank for EmmaPhone2 Pi
+
+Decodes and resamples WAV prompts (ring, connect, hang-up, low battery...)
+into the output device's format once at startup and mixes them into the
+live output stream from memory, so starting a prompt never touches the disk.
+"""
+import logging
+import threading
+import wave
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .codecs import read_recording
+
+logger = logging.getLogger(__name__)
+
+# Tones synthesized when a prompt's WAV file is missing:
+# (frequencies in Hz, on ms, off ms, repeats)
+BUILTIN_TONES = {
+    "ring": ((440.0, 480.0), 1000, 2000, 1),
+    "connect": ((660.0, 880.0), 120, 40, 2),
+    "hangup": ((480.0, 620.0), 250, 250, 3),
+    "low_battery": ((880.0,), 150, 150, 3),
+}
+
+def decode_wav(path: str, sample_rate: int, channels: int) -> np.ndarray:
+    """Decode a PCM WAV file into float32 frames x channels at the given rate"""
+    try:
+        with wave.open(str(path), "rb") as wf:
+            width = wf.getsampwidth()
+            source_channels = wf.getnchannels()
+            source_rate = wf.getframerate()
+            raw = wf.readframes(wf.getnframes())
+    except wave.Error:
+        # Compressed recordings (μ-law, IMA-ADPCM) that the wave module rejects
+        pcm, source_rate, source_channels = read_recording(path)
+        raw, width = pcm.astype("<i2").tobytes(), 2
+
+    if width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif width == 2:
+        samples = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0
+    elif width == 3:
+        # Sign-extend packed 24-bit samples into int32
+        packed = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        values = packed[:, 0] | (packed[:, 1] << 8) | (packed[:, 2] << 16)
+        values = np.where(values & 0x800000, values - 0x1000000, values)
+        samples = values.astype(np.float32) / 8388608.0
+    elif width == 4:
+        samples = np.frombuffer(raw, dtype="<i4").astype(np.float32) / 2147483648.0
+    else:
+        raise ValueError(f"Unsupported sample width {width}")
+
+    frames = samples.reshape(-1, source_channels)
+
+    # Channel layout: downmix by averaging, upmix by repeating the first channel
+    if source_channels != channels:
+        if channels == 1:
+            frames = frames.mean(axis=1, keepdims=True)
+        else:
+            mono = frames.mean(axis=1, keepdims=True) if source_channels > 1 else frames
+            frames = np.repeat(mono, channels, axis=1)
+
+    # Linear-interpolation resampling (prompts are short and band-limited)
+    if source_rate != sample_rate and len(frames):
+        target_length = int(round(len(frames) * sample_rate / source_rate))
+        positions = np.arange(target_length) * (source_rate / sample_rate)
+        source_positions = np.arange(len(frames))
+        frames = np.stack([np.interp(positions, source_positions, frames[:, c])
+                           for c in range(frames.shape[1])], axis=1)
+
+    return np.ascontiguousarray(frames, dtype=np.float32)
+
+def synthesize_tone(frequencies, on_ms: int, off_ms: int, repeats: int,
+                    sample_rate: int, channels: int, level: float = 0.3) -> np.ndarray:
+    """Generate an on/off multi-frequency tone as float32 frames x channels"""
+    on = int(sample_rate * on_ms / 1000)
+    off = int(sample_rate * off_ms / 1000)
+    t = np.arange(on) / sample_rate
+    burst = sum(np.sin(2 * np.pi * f * t) for f in frequencies) * (level / len(frequencies))
+
+    # Short raised-cosine ramps so bursts start and end without clicks
+    ramp = min(on // 2, int(sample_rate * 0.005))
+    if ramp:
+        window = 0.5 - 0.5 * np.cos(np.linspace(0, np.pi, ramp))
+        burst[:ramp] *= window
+        burst[-ramp:] *= window[::-1]
+
+    cycle = np.concatenate((burst, np.zeros(off)))
+    mono = np.tile(cycle, repeats).astype(np.float32)
+    return np.repeat(mono[:, None], channels, axis=1)
+
+class SoundBank:
+    """In-memory prompts plus the voices currently mixed into the output"""
+
+    def __init__(self, sample_rate: int = 44100, channels: int = 2,
+                 volume: float = 0.5, max_voices: int = 4):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.volume = volume
+        self.max_voices = max_voices
+
+        self.sounds: Dict[str, np.ndarray] = {}
+        # Active voices: [name, samples, position, loop, gain]
+        self.voices: List[list] = []
+        self._lock = threading.Lock()
+
+    def load(self, prompts: Dict[str, Optional[str]], directory: Optional[str] = None) -> int:
+        """Decode the configured prompts; missing files fall back to built-in tones
+
+        Returns the number of prompts loaded.
+        """
+        base = Path(directory).expanduser() if directory else None
+        names = set(prompts) | set(BUILTIN_TONES)
+
+        for name in sorted(names):
+            filename = prompts.get(name)
+            path = None
+            if filename:
+                path = Path(filename).expanduser()
+                if base and not path.is_absolute():
+                    path = base / path
+
+            try:
+                if path and path.exists():
+                    self.sounds[name] = decode_wav(path, self.sample_rate, self.channels)
+                    logger.info(f"🔔 Loaded prompt '{name}' from {path}")
+                elif name in BUILTIN_TONES:
+                    self.sounds[name] = synthesize_tone(*BUILTIN_TONES[name],
+                                                        sample_rate=self.sample_rate,
+                                                        channels=self.channels)
+                    if path:
+                        logger.info(f"🔔 Prompt file {path} not found, using built-in '{name}' tone")
+                else:
+                    logger.warning(f"⚠️ Prompt file for '{name}' not found: {path}")
+            except Exception as e:
+                logger.error(f"❌ Failed to load prompt '{name}': {e}")
+
+        return len(self.sounds)
+
+    def play(self, name: str, loop: bool = False, gain: float = 1.0) -> bool:
+        """Start mixing a prompt into the output"""
+        samples = self.sounds.get(name)
+        if samples is None:
+            logger.warning(f"⚠️ Unknown prompt '{name}'")
+            return False
+
+        with self._lock:
+            # Restart rather than stack the same prompt
+            self.voices = [v for v in self.voices if v[0] != name]
+            if len(self.voices) >= self.max_voices:
+                self.voices.pop(0)
+            self.voices.append([name, samples, 0, loop, gain * self.volume])
+
+        return True
+
+    def stop(self, name: Optional[str] = None):
+        """Stop one prompt, or all of them"""
+        with self._lock:
+            self.voices = [v for v in self.voices if name is not None and v[0] != name]
+
+    def is_playing(self, name: Optional[str] = None) -> bool:
+        """Check whether a prompt (or any prompt) is playing"""
+        voices = self.voices
+        return any(v[0] == name for v in voices) if name else bool(voices)
+
+    def mix_into(self, data: bytes, frame_count: int) -> bytes:
+        """Mix active voices into an interleaved int16 output chunk"""
+        with self._lock:
+            if not self.voices:
+                return data
+
+            out = np.zeros((frame_count, self.channels), dtype=np.float32)
+            pcm = np.frombuffer(data, dtype=np.int16)
+            frames = min(len(pcm) // self.channels, frame_count)
+            out[:frames] = pcm[:frames * self.channels].reshape(frames, self.channels) * (1.0 / 32768.0)
+
+            finished = False
+            for voice in self.voices:
+                _, samples, position, loop, gain = voice
+                length = len(samples)
+                if loop:
+                    index = (position + np.arange(frame_count)) % length
+                    out += samples[index] * gain
+                    voice[2] = (position + frame_count) % length
+                else:
+                    count = min(frame_count, length - position)
+                    out[:count] += samples[position:position + count] * gain
+                    voice[2] = position + count
+                    finished = finished or voice[2] >= length
+
+            if finished:
+                self.voices = [v for v in self.voices if v[3] or v[2] < len(v[1])]
+
+        np.clip(out, -1.0, 32767.0 / 32768.0, out=out)
+        return (out * 32768.0).astype(np.int16).tobytes()
+
+    def get_status(self) -> Dict:
+        """Get loaded prompts and what is playing"""
+        return {
+            "volume": self.volume,
+            "prompts": {name: round(len(samples) / self.sample_rate, 2)
+                        for name, samples in self.sounds.items()},
+            "playing": [v[0] for v in self.voices]
+        }
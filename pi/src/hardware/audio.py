@@ -11,8 +11,19 @@ import pyaudio
 import numpy as np
 from typing import Optional, Callable
 
+from diagnostics.fast_logging import SampledLogger
+from diagnostics.flight_recorder import FlightRecorder, KIND_CAPTURE
+from dsp.sound_bank import SoundBank, decode_wav
+from dsp.preroll import PreRollBuffer, MICROPHONE, INCOMING
+from dsp.codecs import RecordingWriter, CODECS, CODEC_IMA_ADPCM, ENCODE_SLICE_SECONDS
+from dsp.audio_bus import AudioBus
+from dsp.level_meter import LevelMeter
+
 logger = logging.getLogger(__name__)
 
+# Sampled logger for PortAudio callback errors
+hot_log = SampledLogger(logger, first=5, every=100, rate=0.5, burst=2)
+
 class AudioManager:
     """Manages audio recording and playback for ReSpeaker HAT"""
     
@@ -22,6 +33,9 @@ class AudioManager:
     CHANNELS = 2  # Stereo from dual microphones
     FORMAT = pyaudio.paInt16
     
+    # Gain applied to the microphone before publishing and recording (prevents clipping)
+    CAPTURE_GAIN = 0.25
+    
     # Device configuration (auto-detect ReSpeaker HAT)
     DEVICE_INDEX = None  # Will be auto-detected
     
@@ -33,10 +47,37 @@ class AudioManager:
         self.playing = False
         self.audio_callback = None
         
+        # Output source callback; prompts from the sound bank are mixed on top
+        self.playback_source = None
+        self.prompt_stream_only = False
+        self.sound_bank = SoundBank(self.SAMPLE_RATE, self.CHANNELS)
+        self._prompt_idle_task = None
+        
         # Call recording - mixed audio (both participants)
         self.call_recording_frames = []
         self.call_recording_filename = None
         self.call_recording_active = False
+        self.call_recording_preroll = b''
+        self.recording_codec = CODEC_IMA_ADPCM
+        self.recording_channels = 1
+        
+        # Last few seconds of call audio, kept so recordings can start retroactively
+        self.preroll = PreRollBuffer(seconds=20.0, sample_rate=self.SAMPLE_RATE, channels=self.CHANNELS)
+        self.preroll_active = False
+        
+        # Per-callback timing events for post-mortem glitch analysis
+        self.flight_recorder = FlightRecorder()
+        
+        # Each captured / received block is written once; consumers read through taps
+        self.capture_bus = AudioBus("capture", seconds=2.0, sample_rate=self.SAMPLE_RATE,
+                                    channels=self.CHANNELS, block_frames=self.CHUNK_SIZE)
+        self.incoming_bus = AudioBus("incoming", seconds=2.0, sample_rate=self.SAMPLE_RATE,
+                                     channels=self.CHANNELS, block_frames=self.CHUNK_SIZE)
+        self._recording_taps = None
+        self._recording_tap_task = None
+        
+        # Input levels kept up to date by the capture callback
+        self.level_meter = LevelMeter(channels=self.CHANNELS, sample_rate=self.SAMPLE_RATE)
         
     async def initialize(self):
         """Initialize PyAudio"""
@@ -153,15 +194,24 @@ class AudioManager:
             self.input_stream.close()
             self.input_stream = None
         
+        self.level_meter.reset()
         logger.info("🛑 Recording stopped")
     
     async def start_playback(self, callback: Optional[Callable] = None):
         """Start audio playback"""
         if self.playing:
+            if self.prompt_stream_only and callback:
+                # Stream is open only for prompts: hand it the new source
+                self.playback_source = callback
+                self.prompt_stream_only = False
+                logger.info("🔊 Playback attached to open prompt stream")
+                return
             logger.warning("⚠️  Already playing")
             return
         
         try:
+            self.playback_source = callback
+            self.prompt_stream_only = False
             self.output_stream = self.pyaudio_instance.open(
                 format=self.FORMAT,
                 channels=self.CHANNELS,
@@ -169,7 +219,7 @@ class AudioManager:
                 output=True,
                 output_device_index=self.DEVICE_INDEX,
                 frames_per_buffer=self.CHUNK_SIZE,
-                stream_callback=callback if callback else None
+                stream_callback=self._playback_callback if callback else None
             )
             
             self.playing = True
@@ -185,6 +235,8 @@ class AudioManager:
             return
         
         self.playing = False
+        self.playback_source = None
+        self.prompt_stream_only = False
         
         if self.output_stream:
             self.output_stream.stop_stream()
@@ -193,12 +245,76 @@ class AudioManager:
         
         logger.info("🛑 Playback stopped")
     
+    def _playback_callback(self, in_data, frame_count, time_info, status):
+        """Output stream callback: source audio with sound bank prompts mixed in"""
+        source = self.playback_source
+        if source:
+            data, flag = source(in_data, frame_count, time_info, status)
+        else:
+            data, flag = b'\x00' * (frame_count * self.CHANNELS * 2), pyaudio.paContinue
+        
+        if self.sound_bank.voices:
+            try:
+                data = self.sound_bank.mix_into(data, frame_count)
+            except Exception as e:
+                hot_log.error("prompt_mix_error", "❌ Prompt mix error: %s", e)
+        
+        return (data, flag)
+    
+    async def load_sounds(self, config: dict) -> int:
+        """Decode the configured prompts into memory (off the event loop)"""
+        self.sound_bank.volume = config.get("volume", self.sound_bank.volume)
+        loop = asyncio.get_running_loop()
+        count = await loop.run_in_executor(
+            None, self.sound_bank.load, config.get("prompts", {}), config.get("directory")
+        )
+        logger.info(f"🔔 Sound bank ready with {count} prompts")
+        return count
+    
+    async def play_sound(self, name: str, loop: bool = False) -> bool:
+        """Mix a preloaded prompt into the output, opening the stream if needed"""
+        if not self.sound_bank.play(name, loop=loop):
+            return False
+        
+        if not self.playing and self.pyaudio_instance:
+            try:
+                await self.start_playback(self._silence_source)
+                self.prompt_stream_only = True
+                self._prompt_idle_task = asyncio.create_task(self._close_prompt_stream_when_idle())
+            except Exception as e:
+                logger.error(f"❌ Failed to open prompt stream: {e}")
+                self.sound_bank.stop(name)
+                return False
+        
+        return True
+    
+    def stop_sound(self, name: Optional[str] = None):
+        """Stop a prompt (or all prompts)"""
+        self.sound_bank.stop(name)
+    
+    def _silence_source(self, in_data, frame_count, time_info, status):
+        return (b'\x00' * (frame_count * self.CHANNELS * 2), pyaudio.paContinue)
+    
+    async def _close_prompt_stream_when_idle(self):
+        """Close a prompt-only output stream once its prompts have finished"""
+        while self.playing and self.prompt_stream_only:
+            if not self.sound_bank.is_playing():
+                # Let the device drain the last buffer before closing
+                await asyncio.sleep(self.CHUNK_SIZE / self.SAMPLE_RATE * 2)
+                if self.prompt_stream_only and not self.sound_bank.is_playing():
+                    await self.stop_playback()
+                break
+            await asyncio.sleep(0.1)
+    
     def _audio_callback(self, in_data, frame_count, time_info, status):
         """Audio stream callback"""
+        started = time.monotonic()
+        
         if self.audio_callback:
             try:
-                # Convert bytes to numpy array
-                audio_data = np.frombuffer(in_data, dtype=np.int16)
+                # Single copy into the capture bus; the callback gets a view of it
+                audio_data = self.capture_bus.write(np.frombuffer(in_data, dtype=np.int16)).reshape(-1)
+                self.level_meter.update(audio_data)
                 
                 # Call user callback
                 if asyncio.iscoroutinefunction(self.audio_callback):
@@ -208,8 +324,9 @@ class AudioManager:
                     self.audio_callback(audio_data)
                     
             except Exception as e:
-                logger.error(f"❌ Audio callback error: {e}")
+                hot_log.error("audio_callback_error", "❌ Audio callback error: %s", e)
         
+        self.flight_recorder.record(KIND_CAPTURE, started, time_info, status, frame_count)
         return (in_data, pyaudio.paContinue)
     
     async def record_to_file(self, filename: str, duration: float):
@@ -239,18 +356,26 @@ class AudioManager:
         logger.info(f"🎵 Playing {filename}")
         
         try:
-            with wave.open(filename, 'rb') as wf:
-                def play_callback(in_data, frame_count, time_info, status):
-                    data = wf.readframes(frame_count)
-                    return (data, pyaudio.paContinue if data else pyaudio.paComplete)
-                
-                await self.start_playback(play_callback)
-                
-                # Wait for playback to complete
-                while self.output_stream.is_active():
-                    await asyncio.sleep(0.1)
-                
-                await self.stop_playback()
+            # Decode up front so the callback never waits on the SD card
+            loop = asyncio.get_running_loop()
+            frames = await loop.run_in_executor(None, decode_wav, filename, self.SAMPLE_RATE, self.CHANNELS)
+            pcm = (np.clip(frames, -1.0, 32767.0 / 32768.0) * 32768.0).astype(np.int16).tobytes()
+            frame_bytes = self.CHANNELS * 2
+            position = 0
+            
+            def play_callback(in_data, frame_count, time_info, status):
+                nonlocal position
+                data = pcm[position:position + frame_count * frame_bytes]
+                position += len(data)
+                return (data, pyaudio.paContinue if data else pyaudio.paComplete)
+            
+            await self.start_playback(play_callback)
+            
+            # Wait for playback to complete
+            while self.output_stream and self.output_stream.is_active():
+                await asyncio.sleep(0.1)
+            
+            await self.stop_playback()
                 
         except Exception as e:
             logger.error(f"❌ Failed to play file {filename}: {e}")
@@ -285,34 +410,11 @@ class AudioManager:
         
         logger.info("✅ Audio loopback test complete")
     
-    async def get_audio_level(self) -> float:
-        """Get current audio input level (0.0 to 1.0)"""
+    def get_audio_level(self) -> float:
+        """Get current audio input level (0.0 to 1.0) from the level meter"""
         if not self.recording:
             return 0.0
-        
-        try:
-            # Skip level reading if stream is being used for file recording
-            if hasattr(self, 'recording_frames') and self.recording_frames is not None:
-                return 0.0  # Return 0 during file recording to avoid conflicts
-            
-            # Read a chunk of audio data
-            data = self.input_stream.read(self.CHUNK_SIZE, exception_on_overflow=False)
-            audio_data = np.frombuffer(data, dtype=np.int16)
-            
-            # Calculate RMS level
-            rms = np.sqrt(np.mean(audio_data.astype(np.float32) ** 2))
-            
-            # Normalize to 0-1 range
-            level = min(rms / 32768.0, 1.0)
-            
-            return level
-            
-        except Exception as e:
-            # Silently return 0 for stream conflicts during call recording
-            if "callback stream" in str(e) or "Stream closed" in str(e):
-                return 0.0
-            logger.error(f"❌ Error getting audio level: {e}")
-            return 0.0
+        return self.level_meter.level()
     
     async def record_audio(self, duration: float = 3.0) -> Optional[bytes]:
         """Record audio for specified duration and return raw audio data"""
@@ -450,8 +552,7 @@ class AudioManager:
             def file_record_callback(audio_data):
                 """Callback to collect audio data for file recording"""
                 self.recording_frames.append(audio_data.tobytes())
-                if len(self.recording_frames) % 100 == 0:  # Log every ~2.3 seconds
-                    logger.info(f"📹 Recording: {len(self.recording_frames)} chunks collected")
+                hot_log.info("file_record", "📹 Recording: %d chunks collected", len(self.recording_frames))
             
             await self.start_recording(file_record_callback)
             logger.info(f"📹 File recording started successfully: {filename}")
@@ -503,13 +604,104 @@ class AudioManager:
         
         logger.info("🛑 Audio manager stopped")
     
+    def set_preroll_seconds(self, seconds: float):
+        """Resize the pre-roll ring (memory is allocated once, up front)"""
+        if seconds != self.preroll.seconds:
+            self.preroll = PreRollBuffer(seconds=seconds, sample_rate=self.SAMPLE_RATE, channels=self.CHANNELS)
+        logger.info(f"⏪ Pre-roll buffer: {seconds}s ({self.preroll.memory_bytes // 1024} KB)")
+    
+    def set_recording_format(self, codec: str, channels: int):
+        """Choose the codec and channel count call recordings are written with"""
+        if codec not in CODECS:
+            logger.warning(f"⚠️ Unknown recording codec '{codec}', keeping {self.recording_codec}")
+        else:
+            self.recording_codec = codec
+        self.recording_channels = max(1, min(channels, self.CHANNELS))
+        logger.info(f"📹 Call recordings: {self.recording_codec}, {self.recording_channels} channel(s)")
+    
+    def start_preroll(self):
+        """Start keeping call audio in the pre-roll ring"""
+        self.preroll.clear()
+        self.preroll_active = self.preroll.seconds > 0
+        if self.preroll_active:
+            self._start_recording_taps()
+    
+    def stop_preroll(self):
+        """Stop feeding the pre-roll ring and drop its contents"""
+        self.preroll_active = False
+        self.preroll.clear()
+        if not self.call_recording_active:
+            self._stop_recording_taps()
+    
+    def _start_recording_taps(self):
+        """Attach the recorder to both buses and drain them from the event loop"""
+        if self._recording_taps:
+            return
+        self._recording_taps = (self.capture_bus.tap("recorder"), self.incoming_bus.tap("recorder"))
+        self._recording_tap_task = asyncio.get_running_loop().create_task(self._recording_tap_loop())
+    
+    def _stop_recording_taps(self):
+        if self._recording_tap_task:
+            self._recording_tap_task.cancel()
+            self._recording_tap_task = None
+        if self._recording_taps:
+            self.capture_bus.remove_tap("recorder")
+            self.incoming_bus.remove_tap("recorder")
+            self._recording_taps = None
+    
+    async def _recording_tap_loop(self):
+        """Feed the pre-roll and call recording off the audio callbacks"""
+        while True:
+            try:
+                self._drain_recording_taps()
+            except Exception as e:
+                hot_log.error("recording_tap_error", "❌ Recording tap error: %s", e)
+            await asyncio.sleep(0.1)
+    
+    def _drain_recording_taps(self):
+        """Pass everything buffered since the last drain to the recorder, block by block"""
+        if not self._recording_taps:
+            return
+        mic_tap, incoming_tap = self._recording_taps
+        
+        for tap, add in ((mic_tap, self._add_microphone_block), (incoming_tap, self.add_incoming_to_recording)):
+            overruns = tap.overruns
+            while True:
+                timestamp = tap.time_at_cursor()
+                block = tap.read(self.CHUNK_SIZE)
+                if not len(block):
+                    break
+                add(block.reshape(-1), timestamp)
+            if tap.overruns > overruns:
+                hot_log.warning("recording_tap_overrun", "⚠️ Recorder fell behind the %s bus, %d frames lost",
+                                tap.bus.name, tap.dropped_frames)
+    
+    def _add_microphone_block(self, audio_data: np.ndarray, timestamp: float):
+        """Record the microphone at the same gain it is published with"""
+        pcm = (audio_data.astype(np.float32) * self.CAPTURE_GAIN).astype(np.int16)
+        self.add_microphone_to_recording(pcm, timestamp)
+    
+    def get_bus_stats(self) -> dict:
+        """Get write counters and per-tap lag/overruns for both audio buses"""
+        return {
+            "capture": self.capture_bus.get_stats(),
+            "incoming": self.incoming_bus.get_stats()
+        }
+    
     async def start_call_recording_mixed(self, filename: str) -> bool:
         """Start mixed call recording (both microphone and incoming audio)"""
         try:
+            # Flush the pre-roll first so the recording starts before the request
+            self.call_recording_preroll = self.preroll.mixed() if self.preroll_active else b''
+            
             self.call_recording_frames = []
             self.call_recording_filename = filename
             self.call_recording_active = True
+            self._start_recording_taps()
             
+            if self.call_recording_preroll:
+                preroll_seconds = len(self.call_recording_preroll) / (self.CHANNELS * 2 * self.SAMPLE_RATE)
+                logger.info(f"⏪ Flushed {preroll_seconds:.1f}s of pre-roll into the recording")
             logger.info(f"📹 Started mixed call recording: {filename}")
             logger.info("📹 Recording will capture both microphone input and incoming audio")
             return True
@@ -518,24 +710,28 @@ class AudioManager:
             logger.error(f"❌ Failed to start mixed call recording: {e}")
             return False
     
-    def add_microphone_to_recording(self, audio_data: np.ndarray):
+    def add_microphone_to_recording(self, audio_data: np.ndarray, timestamp: Optional[float] = None):
         """Add microphone audio to call recording"""
+        if self.preroll_active:
+            self.preroll.write(MICROPHONE, audio_data)
         if self.call_recording_active:
             # Store with channel identifier (0 = microphone)
             self.call_recording_frames.append({
                 'source': 'microphone',
                 'data': audio_data.tobytes(),
-                'timestamp': time.time()
+                'timestamp': timestamp or time.time()
             })
     
-    def add_incoming_to_recording(self, audio_data: bytes):
+    def add_incoming_to_recording(self, audio_data: np.ndarray, timestamp: Optional[float] = None):
         """Add incoming audio (from LiveKit) to call recording"""
+        if self.preroll_active:
+            self.preroll.write(INCOMING, audio_data)
         if self.call_recording_active:
             # Store with channel identifier (1 = incoming)
             self.call_recording_frames.append({
                 'source': 'incoming',
-                'data': audio_data,
-                'timestamp': time.time()
+                'data': audio_data.tobytes(),
+                'timestamp': timestamp or time.time()
             })
     
     async def stop_call_recording_mixed(self) -> Optional[str]:
@@ -545,9 +741,15 @@ class AudioManager:
                 logger.warning("⚠️ No active mixed call recording to stop")
                 return None
             
+            # Collect what the taps have not delivered yet
+            self._drain_recording_taps()
             self.call_recording_active = False
+            if not self.preroll_active:
+                self._stop_recording_taps()
+            preroll = self.call_recording_preroll
+            self.call_recording_preroll = b''
             
-            if not self.call_recording_frames:
+            if not self.call_recording_frames and not preroll:
                 logger.warning("⚠️ No audio data recorded")
                 return None
             
@@ -555,14 +757,14 @@ class AudioManager:
             self.call_recording_frames.sort(key=lambda x: x['timestamp'])
             
             # Mix the audio streams
-            mixed_audio = self._mix_audio_streams()
+            mixed_audio = self._mix_audio_streams() if self.call_recording_frames else b''
             
-            # Save to WAV file
-            with wave.open(self.call_recording_filename, 'wb') as wf:
-                wf.setnchannels(self.CHANNELS)
-                wf.setsampwidth(self.pyaudio_instance.get_sample_size(self.FORMAT))
-                wf.setframerate(self.SAMPLE_RATE)
-                wf.writeframes(mixed_audio)
+            # Encode and save off the event loop, pre-roll first
+            loop = asyncio.get_running_loop()
+            size = await loop.run_in_executor(
+                None, self._write_call_recording, self.call_recording_filename, [preroll, mixed_audio]
+            )
+            logger.info(f"📹 Encoded as {self.recording_codec}: {size // 1024} KB")
             
             logger.info(f"📹 Mixed call recording saved: {self.call_recording_filename}")
             logger.info(f"📹 Recorded {len(self.call_recording_frames)} audio chunks")
@@ -579,6 +781,18 @@ class AudioManager:
             logger.error(f"❌ Failed to stop mixed call recording: {e}")
             return None
     
+    def _write_call_recording(self, filename: str, parts: list) -> int:
+        """Encode PCM parts into a recording file; returns the file size"""
+        writer = RecordingWriter(filename, codec=self.recording_codec, sample_rate=self.SAMPLE_RATE,
+                                 channels=self.recording_channels, input_channels=self.CHANNELS)
+        with writer:
+            # Large slices: the encoder vectorizes across every buffered block
+            step = ENCODE_SLICE_SECONDS * self.SAMPLE_RATE * self.CHANNELS * 2
+            for part in parts:
+                for offset in range(0, len(part), step):
+                    writer.write(np.frombuffer(part[offset:offset + step], dtype=np.int16))
+        return writer.data_bytes
+    
     def _mix_audio_streams(self) -> bytes:
         """Mix microphone and incoming audio streams into single audio track"""
         try:
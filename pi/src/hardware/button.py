@@ -40,6 +40,9 @@ class ButtonHandler:
         self.press_count = 0
         self.keyboard_task = None
         
+        # Called on every raw press, before the press type is known
+        self.on_press = None
+        
     async def initialize(self):
         """Initialize button handler"""
         if GPIO_AVAILABLE and not self.use_keyboard:
@@ -88,6 +91,12 @@ class ButtonHandler:
         """Handle button press logic"""
         current_time = asyncio.get_event_loop().time()
         
+        if self.on_press:
+            try:
+                self.on_press()
+            except Exception as e:
+                logger.error(f"❌ Button press hook error: {e}")
+        
         # Reset press count if too much time has passed
         if current_time - self.last_press_time > self.TRIPLE_PRESS_TIME:
             self.press_count = 0
@@ -18,16 +18,16 @@ from hardware.audio import AudioManager
 from hardware.button import ButtonHandler, ButtonAction
 from services.wifi_manager import WiFiManager
 from services.livekit_client import LiveKitClient
-from services.call_manager_v2 import CallManagerV2
+from services.call_manager_v2 import CallManagerV2, CallState
 from services.user_manager import UserManager
+from services.recording_store import RecordingStore
+from services.upload_queue import UploadQueue
 from config.settings import Settings
+from config.settings_watcher import SettingsWatcher
+from diagnostics.fast_logging import setup_queue_logging
+from diagnostics.loop_monitor import LoopMonitor
 from web.server import PiWebServer
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
 class EmmaPhoneApp:
@@ -35,6 +35,7 @@ class EmmaPhoneApp:
     
     def __init__(self):
         self.settings = Settings()
+        self.settings_watcher = SettingsWatcher(self.settings)
         self.led_controller = LEDController()
         self.audio_manager = AudioManager()
         self.button_handler = ButtonHandler()
@@ -43,20 +44,40 @@ class EmmaPhoneApp:
         # Calling system components
         self.livekit_client = None
         self.user_manager = None
+        self.session_task = None
         self.call_manager = None
+        self.recording_store = None
+        self.upload_queue = None
         
         # Web interface
         self.web_server = None
         
+        # Diagnostics
+        self.loop_monitor = None
+        
         self.running = False
         
     async def initialize(self):
         """Initialize all hardware and services"""
         logger.info("🚀 Starting EmmaPhone2 Pi Application")
         
+        # Start event loop monitoring before anything can block the loop
+        await self.start_loop_monitor()
+        
+        # Apply settings changes from other processes as they are written
+        await self.start_settings_watcher()
+        
+        # Authenticate while the hardware comes up (a saved session needs no round trip)
+        if self.settings.is_user_configured():
+            self.start_session()
+        
         # Initialize hardware
         await self.led_controller.initialize()
         await self.audio_manager.initialize()
+        await self.audio_manager.load_sounds(self.settings.get("sounds", {}))
+        self.audio_manager.set_preroll_seconds(self.settings.get("audio.preroll_seconds", 20))
+        self.audio_manager.set_recording_format(self.settings.get("audio.recording_codec", "ima_adpcm"),
+                                                self.settings.get("audio.recording_channels", 1))
         await self.button_handler.initialize()
         
         # Show startup LED pattern
@@ -96,15 +117,22 @@ class EmmaPhoneApp:
                 await self.led_controller.set_status("setup_needed")
                 return
             
-            self.livekit_client = LiveKitClient(server_url, api_key, api_secret)
+            self.livekit_client = LiveKitClient(
+                server_url, api_key, api_secret,
+                publish_config=self.settings.get("audio_publishing", {})
+            )
             
             # Get device identity
             device_id = f"pi_{self.settings.get('device.id', 'unknown')}"
             await self.livekit_client.initialize(device_id)
             
-            # Initialize user manager
-            self.user_manager = UserManager(self.settings)
-            await self.user_manager.initialize()
+            # Wait for the session started during hardware bring-up
+            self.start_session()
+            await self.session_task
+            
+            # Indexed call recordings with background retention
+            self.recording_store = RecordingStore(**self.settings.get("recordings", {}))
+            await self.recording_store.start()
             
             # Initialize call manager with user management
             self.call_manager = CallManagerV2(
@@ -113,11 +141,19 @@ class EmmaPhoneApp:
                 led_controller=self.led_controller,
                 button_handler=self.button_handler,
                 user_manager=self.user_manager,
-                device_id=device_id
+                device_id=device_id,
+                recording_store=self.recording_store
             )
             
             await self.call_manager.initialize()
             
+            # Contacts are read locally; keep them in sync in the background
+            await self.user_manager.start_contact_sync(self.settings.get("web_client.contacts_sync_interval", 300))
+            
+            # Background upload of recordings and flight dumps
+            if self.settings.get("uploads.enabled", False):
+                await self.start_upload_queue()
+            
             logger.info("✅ Calling system initialized")
             
             # Initialize web server
@@ -138,6 +174,13 @@ class EmmaPhoneApp:
             await self.led_controller.set_status("error")
             return
         
+    def start_session(self):
+        """Create the user manager and authenticate in the background (once)"""
+        if self.session_task:
+            return
+        self.user_manager = UserManager(self.settings)
+        self.session_task = asyncio.create_task(self.user_manager.start_session())
+    
     async def start_setup_mode(self):
         """Start WiFi setup mode"""
         logger.info("🔧 Starting WiFi setup mode")
@@ -162,42 +205,147 @@ class EmmaPhoneApp:
         logger.info("Please run the following command to set up your user:")
         logger.info("python3 setup_user.py")
         logger.info("")
-        logger.info("After setup, restart the Pi application:")
-        logger.info("python3 src/main.py")
+        logger.info("The Pi application continues automatically once setup_user.py finishes")
         logger.info("=" * 50)
         
-        # Keep showing setup needed status
-        while not self.settings.is_user_configured():
-            await asyncio.sleep(5)
-            await self.led_controller.set_status("setup_needed")
+        # Sleep until setup_user.py (or the web UI) configures the user
+        configured = asyncio.Event()
+        
+        def on_user_configured(changes):
+            if self.settings.is_user_configured():
+                configured.set()
+        
+        self.settings_watcher.subscribe("user.configured", on_user_configured)
+        try:
+            if not self.settings.is_user_configured():
+                await configured.wait()
+        finally:
+            self.settings_watcher.unsubscribe(on_user_configured)
         
         logger.info("✅ User configuration detected - restarting application")
         await self.start_main_app()
     
+    async def start_settings_watcher(self):
+        """Watch settings.json and route changes to the subsystems they affect"""
+        watcher = self.settings_watcher
+        
+        async def on_led_change(changes):
+            brightness = self.settings.get("leds.brightness")
+            if brightness is not None:
+                await self.led_controller.set_brightness(int(brightness))
+        
+        async def on_sounds_change(changes):
+            await self.audio_manager.load_sounds(self.settings.get("sounds", {}))
+        
+        def on_audio_change(changes):
+            self.audio_manager.set_preroll_seconds(self.settings.get("audio.preroll_seconds", 20))
+            self.audio_manager.set_recording_format(self.settings.get("audio.recording_codec", "ima_adpcm"),
+                                                    self.settings.get("audio.recording_channels", 1))
+        
+        def on_contacts_change(changes):
+            if self.user_manager:
+                self.user_manager.contacts.import_settings(self.settings)
+        
+        def on_calling_change(changes):
+            if self.call_manager:
+                self.call_manager.on_settings_changed(changes)
+        
+        def on_web_change(changes):
+            if self.web_server:
+                self.web_server.on_settings_changed(changes)
+        
+        watcher.subscribe("leds.brightness", on_led_change)
+        watcher.subscribe("sounds", on_sounds_change)
+        watcher.subscribe("audio", on_audio_change)
+        watcher.subscribe("user.contacts", on_contacts_change)
+        watcher.subscribe("user.speed_dial", on_contacts_change)
+        watcher.subscribe("audio_publishing", on_calling_change)
+        watcher.subscribe("livekit", on_calling_change)
+        watcher.subscribe("web_client", on_calling_change)
+        watcher.subscribe("", on_web_change)
+        
+        try:
+            await watcher.start()
+        except Exception as e:
+            logger.error(f"❌ Failed to start settings watcher: {e}")
+    
+    async def start_loop_monitor(self):
+        """Start the event loop lag monitor if enabled"""
+        diagnostics_config = self.settings.get_diagnostics_config()
+        if not diagnostics_config.get("loop_monitor_enabled", True):
+            return
+        
+        try:
+            self.loop_monitor = LoopMonitor(
+                sample_interval=diagnostics_config.get("loop_sample_interval", 0.01),
+                slow_callback_threshold=diagnostics_config.get("slow_callback_threshold", 0.05)
+            )
+            await self.loop_monitor.start()
+        except Exception as e:
+            logger.error(f"❌ Failed to start loop monitor: {e}")
+            self.loop_monitor = None
+    
+    async def start_upload_queue(self):
+        """Start uploading finished recordings and flight dumps"""
+        upload_config = self.settings.get("uploads", {})
+        if not upload_config.get("url"):
+            logger.warning("⚠️ Uploads enabled but no upload URL configured")
+            return
+        
+        self.upload_queue = UploadQueue(
+            web_api=self.user_manager.web_api,
+            url=upload_config["url"],
+            chunk_size_kb=upload_config.get("chunk_size_kb", 256),
+            max_kbps=upload_config.get("max_kbps", 256),
+            token=upload_config.get("token", ""),
+            is_busy=lambda: self.call_manager.call_state != CallState.IDLE
+        )
+        await self.upload_queue.start()
+        
+        # Both hooks fire from executor threads
+        self.recording_store.on_recording_added = lambda entry: self.upload_queue.enqueue_threadsafe(
+            str(self.recording_store.directory / entry["filename"]), "recording", entry
+        )
+        self.audio_manager.flight_recorder.on_dump = lambda path: self.upload_queue.enqueue_threadsafe(
+            path, "flight_dump", {"device_id": self.call_manager.device_id}
+        )
+        self.call_manager.upload_queue = self.upload_queue
+        
     async def start_web_server(self):
         """Start the web interface server"""
         try:
             web_port = self.settings.get('web_server.port', 8080)
+            use_async_server = self.settings.get('web_server.server', 'flask') == 'aiohttp'
             
             # Initialize web server
-            self.web_server = PiWebServer(self.settings, port=web_port)
+            if use_async_server:
+                from web.async_server import AsyncPiWebServer
+                self.web_server = AsyncPiWebServer(self.settings, port=web_port)
+            else:
+                self.web_server = PiWebServer(self.settings, port=web_port)
             
             # Set manager references for status monitoring
             self.web_server.set_managers(
                 call_manager=self.call_manager,
                 user_manager=self.user_manager,
                 audio_manager=self.audio_manager,
-                led_controller=self.led_controller
+                led_controller=self.led_controller,
+                loop_monitor=self.loop_monitor,
+                wifi_manager=self.wifi_manager
             )
             
-            # Start web server in background thread
-            import threading
-            web_thread = threading.Thread(
-                target=self.web_server.run, 
-                kwargs={'host': '0.0.0.0', 'debug': False},
-                daemon=True
-            )
-            web_thread.start()
+            if use_async_server:
+                # Serve from the main event loop
+                await self.web_server.start(host='0.0.0.0')
+            else:
+                # Start web server in background thread
+                import threading
+                web_thread = threading.Thread(
+                    target=self.web_server.run, 
+                    kwargs={'host': '0.0.0.0', 'debug': False},
+                    daemon=True
+                )
+                web_thread.start()
             
             logger.info(f"✅ Web interface started on http://0.0.0.0:{web_port}")
             logger.info(f"💻 Access from browser: http://pi.local:{web_port} or http://<pi-ip>:{web_port}")
@@ -214,7 +362,7 @@ class EmmaPhoneApp:
                 return
             
             # Get speed dial user ID
-            user_id = self.settings.get_speed_dial(1)
+            user_id = self.user_manager.contacts.get_speed_dial(1)
             if not user_id:
                 logger.warning("⚠️ No speed dial contact configured for position 1")
                 await self.led_controller.set_status("error")
@@ -236,7 +384,7 @@ class EmmaPhoneApp:
                 return
             
             # Get speed dial user ID
-            user_id = self.settings.get_speed_dial(2)
+            user_id = self.user_manager.contacts.get_speed_dial(2)
             if not user_id:
                 logger.warning("⚠️ No speed dial contact configured for position 2")
                 await self.led_controller.set_status("error")
@@ -259,7 +407,10 @@ class EmmaPhoneApp:
         
         # Stop web server
         if self.web_server:
-            self.web_server.stop()
+            if asyncio.iscoroutinefunction(self.web_server.stop):
+                await self.web_server.stop()
+            else:
+                self.web_server.stop()
         
         # Stop calling system
         if self.call_manager:
@@ -274,6 +425,20 @@ class EmmaPhoneApp:
         await self.button_handler.stop()
         await self.led_controller.stop()
         
+        if self.upload_queue:
+            await self.upload_queue.stop()
+        
+        # Stop diagnostics
+        if self.recording_store:
+            await self.recording_store.stop()
+        
+        if self.loop_monitor:
+            await self.loop_monitor.stop()
+        
+        # Write any debounced settings changes
+        await self.settings_watcher.stop()
+        self.settings.flush()
+        
         logger.info("✅ Shutdown complete")
 
 def signal_handler(signum, frame):
@@ -283,6 +448,9 @@ def signal_handler(signum, frame):
 
 async def main():
     """Main entry point"""
+    # Configure logging (records are written by a background thread)
+    log_listener = setup_queue_logging(level=logging.INFO)
+    
     # Setup signal handlers
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
@@ -303,6 +471,7 @@ async def main():
         logger.error(f"Application error: {e}")
     finally:
         await app.shutdown()
+        log_listener.stop()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,166 @@
+"""
+Network-adaptive Audio Publishing for EmmaPhone2 Pi
+
+Switches the published audio profile (Opus bitrate, DTX, RED, channel count)
+based on live loss and RTT statistics, with hysteresis so calls do not
+flap between profiles
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional
+
+from diagnostics.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class PublishProfile:
+    """Audio publishing profile plus the network limits it tolerates"""
+    name: str
+    max_bitrate: int          # Opus max bitrate in bits per second
+    dtx: bool                 # Discontinuous transmission (no packets during silence)
+    red: bool                 # Redundant audio encoding (previous frame piggybacks on each packet)
+    stereo: bool
+    # Step down when outbound loss or RTT exceed these
+    degrade_loss_pct: float
+    degrade_rtt_ms: float
+    # Step back up from the next lower profile when both are below these
+    upgrade_loss_pct: float
+    upgrade_rtt_ms: float
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+# Ordered best to most robust
+PUBLISH_PROFILES: List[PublishProfile] = [
+    PublishProfile("high", 64000, dtx=False, red=False, stereo=True,
+                   degrade_loss_pct=2.0, degrade_rtt_ms=250, upgrade_loss_pct=0.0, upgrade_rtt_ms=0),
+    PublishProfile("standard", 32000, dtx=True, red=False, stereo=False,
+                   degrade_loss_pct=5.0, degrade_rtt_ms=400, upgrade_loss_pct=0.5, upgrade_rtt_ms=150),
+    PublishProfile("low", 20000, dtx=True, red=True, stereo=False,
+                   degrade_loss_pct=10.0, degrade_rtt_ms=600, upgrade_loss_pct=2.0, upgrade_rtt_ms=250),
+    PublishProfile("minimal", 12000, dtx=True, red=True, stereo=False,
+                   degrade_loss_pct=100.0, degrade_rtt_ms=1e9, upgrade_loss_pct=5.0, upgrade_rtt_ms=400),
+]
+
+def get_profile(name: str) -> Optional[PublishProfile]:
+    """Look up a publishing profile by name"""
+    return next((p for p in PUBLISH_PROFILES if p.name == name), None)
+
+class AdaptivePublishController:
+    """Chooses the publishing profile from network samples with hysteresis
+
+    A step down needs ``degrade_samples`` consecutive bad samples, a step up
+    needs ``upgrade_samples`` consecutive good ones, and no switch happens
+    within ``min_dwell`` seconds of the previous one.
+    """
+
+    def __init__(self,
+                 livekit_client,
+                 initial_profile: str = "standard",
+                 enabled: bool = True,
+                 degrade_samples: int = 2,
+                 upgrade_samples: int = 5,
+                 min_dwell: float = 15.0):
+        self.livekit_client = livekit_client
+        self.enabled = enabled
+        self.degrade_samples = degrade_samples
+        self.upgrade_samples = upgrade_samples
+        self.min_dwell = min_dwell
+
+        self.initial_index = self._index_of(initial_profile)
+        self.index = self.initial_index
+        self._bad_streak = 0
+        self._good_streak = 0
+        self._last_switch = 0.0
+        self._switch_task = None
+
+    @staticmethod
+    def _index_of(name: str) -> int:
+        for i, profile in enumerate(PUBLISH_PROFILES):
+            if profile.name == name:
+                return i
+        logger.warning(f"⚠️ Unknown publish profile '{name}', using 'standard'")
+        return 1
+
+    @property
+    def profile(self) -> PublishProfile:
+        return PUBLISH_PROFILES[self.index]
+
+    def reset(self):
+        """Return to the initial profile for a new call"""
+        self.index = self.initial_index
+        self._bad_streak = 0
+        self._good_streak = 0
+        self._last_switch = time.monotonic()
+        metrics.set_gauge("publish.profile", self.profile.name)
+
+    def on_sample(self, sample):
+        """Evaluate a NetworkSample and switch profiles if warranted"""
+        if not self.enabled:
+            return
+
+        loss = sample.outbound_loss_pct
+        rtt = sample.rtt_ms
+        if loss is None and rtt is None:
+            return
+        loss = loss or 0.0
+        rtt = rtt or 0.0
+
+        current = self.profile
+        bad = loss > current.degrade_loss_pct or rtt > current.degrade_rtt_ms
+
+        good = False
+        if self.index > 0:
+            # Upgrade thresholds live on the profile we would step up from
+            good = loss < current.upgrade_loss_pct and rtt < current.upgrade_rtt_ms
+
+        self._bad_streak = self._bad_streak + 1 if bad else 0
+        self._good_streak = self._good_streak + 1 if good else 0
+
+        if time.monotonic() - self._last_switch < self.min_dwell:
+            return
+
+        if self._bad_streak >= self.degrade_samples and self.index < len(PUBLISH_PROFILES) - 1:
+            self._switch(self.index + 1, f"loss {loss:.1f}% rtt {rtt:.0f}ms")
+        elif self._good_streak >= self.upgrade_samples:
+            self._switch(self.index - 1, f"loss {loss:.1f}% rtt {rtt:.0f}ms")
+
+    def _switch(self, new_index: int, reason: str):
+        """Apply a new profile on the event loop"""
+        if self._switch_task and not self._switch_task.done():
+            return
+
+        old_profile = self.profile
+        self.index = new_index
+        self._bad_streak = 0
+        self._good_streak = 0
+        self._last_switch = time.monotonic()
+        new_profile = self.profile
+
+        direction = "down" if new_index > PUBLISH_PROFILES.index(old_profile) else "up"
+        logger.info(f"📶 Publish profile {old_profile.name} → {new_profile.name} ({reason})")
+
+        metrics.increment("publish.profile_changes")
+        metrics.increment(f"publish.profile_changes.{direction}")
+        metrics.set_gauge("publish.profile", new_profile.name)
+        metrics.record_event("publish_profile_change", {
+            "from": old_profile.name,
+            "to": new_profile.name,
+            "reason": reason
+        })
+
+        self._switch_task = asyncio.create_task(
+            self.livekit_client.apply_publish_profile(new_profile)
+        )
+
+    def get_status(self) -> Dict:
+        """Get controller state for diagnostics"""
+        return {
+            "enabled": self.enabled,
+            "profile": self.profile.to_dict(),
+            "bad_streak": self._bad_streak,
+            "good_streak": self._good_streak
+        }
@@ -5,6 +5,7 @@ Manages call state using web client API for user-based calling instead of direct
 """
 import asyncio
 import logging
+import os
 import time
 from enum import Enum
 from typing import Optional, Dict, Any, Callable
@@ -13,9 +14,11 @@ from dataclasses import dataclass
 from .livekit_client import LiveKitClient
 from .web_client import WebClientAPI, WebClientSocket
 from .user_manager import UserManager
+from .recording_store import RecordingStore
 from hardware.audio import AudioManager
 from hardware.leds import LEDController
 from hardware.button import ButtonHandler, ButtonAction
+from diagnostics.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -40,6 +43,7 @@ class CallInfo:
     start_time: Optional[float] = None
     end_time: Optional[float] = None
     livekit_token: Optional[str] = None
+    network_stats: Optional[Dict] = None
 
 class CallManagerV2:
     """Enhanced call manager with web client API integration"""
@@ -50,7 +54,8 @@ class CallManagerV2:
                  led_controller: LEDController,
                  button_handler: ButtonHandler,
                  user_manager: UserManager,
-                 device_id: str):
+                 device_id: str,
+                 recording_store: Optional[RecordingStore] = None):
         
         self.device_id = device_id
         
@@ -73,6 +78,9 @@ class CallManagerV2:
         # Call recording
         self.call_recording_enabled = False
         self.call_recording_filename = None
+        self.last_call_recording_file = None
+        self.recording_store = recording_store
+        self.upload_queue = None  # Set by main when uploads are enabled
         
         # Callbacks
         self.on_call_state_changed = None
@@ -86,8 +94,8 @@ class CallManagerV2:
             if not self.user_manager.is_user_configured():
                 raise Exception("User not configured. Please run setup_user.py first.")
             
-            # Authenticate user
-            pi_user = await self.user_manager.authenticate_user()
+            # Authenticate user (main.py usually did this during hardware bring-up)
+            pi_user = self.user_manager.get_authenticated_user() or await self.user_manager.start_session()
             if not pi_user:
                 raise Exception("Failed to authenticate user with web client")
             
@@ -97,18 +105,26 @@ class CallManagerV2:
             # Get web API from user manager
             self.web_api = self.user_manager.web_api
             
+            # A press may be a call; open a connection while the press type is still being decided
+            self.button_handler.on_press = self.web_api.prewarm
+            
             # Initialize Socket.IO connection
             web_config = self.user_manager.settings.get_web_client_config()
             self.web_socket = WebClientSocket(
                 web_config.get("url", ""),
-                web_config.get("socket_endpoint", "/socket.io")
+                web_config.get("socket_endpoint", "/socket.io"),
+                **web_config.get("socket", {})
             )
+            self.web_socket.cache = self.web_api.cache
+            self.web_socket.http = self.web_api.http
             
-            await self.web_socket.initialize(pi_user["user_id"])
-            
-            # Set up Socket.IO callbacks
+            # Set up Socket.IO callbacks (before connecting, so no event is missed)
             self.web_socket.on_incoming_call = self._on_incoming_call
             self.web_socket.on_call_ended = self._on_call_ended
+            self.web_socket.on_reconnected = self._on_socket_reconnected
+            
+            # Not reachable yet is not fatal: the socket keeps retrying
+            await self.web_socket.initialize(pi_user["user_id"])
             
             # Set up LiveKit callbacks
             self.livekit_client.on_connected = self._on_livekit_connected
@@ -322,6 +338,19 @@ class CallManagerV2:
         elif new_state == CallState.ERROR:
             await self.led_controller.set_status("error")
         
+        # Start a fresh glitch count for the flight recorder
+        if new_state == CallState.CONNECTED and old_state != CallState.CONNECTED:
+            self.audio_manager.flight_recorder.mark_call_start()
+            self.audio_manager.start_preroll()
+        
+        # Call progress prompts from the preloaded sound bank
+        if new_state == CallState.INCOMING and old_state != CallState.INCOMING:
+            await self.audio_manager.play_sound("ring", loop=True)
+        elif old_state == CallState.INCOMING and new_state != CallState.INCOMING:
+            self.audio_manager.stop_sound("ring")
+        if new_state == CallState.CONNECTED and old_state != CallState.CONNECTED:
+            await self.audio_manager.play_sound("connect")
+        
         logger.info(f"📱 Call state: {old_state.value} → {new_state.value}")
         
         # Trigger callback
@@ -364,16 +393,46 @@ class CallManagerV2:
             
             # Stop audio
             try:
+                self.audio_manager.stop_preroll()
                 await self.audio_manager.stop_recording()
                 await self.audio_manager.stop_playback()
                 logger.info("📞 Audio stopped")
             except Exception as e:
                 logger.error(f"❌ Failed to stop audio: {e}")
             
+            # Hang-up tone for calls that were connected
+            if self.call_state == CallState.CONNECTED:
+                await self.audio_manager.play_sound("hangup")
+            
+            # Keep the flight recorder timeline if the call had audio glitches
+            try:
+                call_name = self.current_call.call_id if self.current_call else "call"
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(
+                    None, self.audio_manager.flight_recorder.dump_if_glitched, call_name
+                )
+            except Exception as e:
+                logger.error(f"❌ Failed to dump flight recorder: {e}")
+            
             # Update call end time
             if self.current_call:
                 self.current_call.end_time = time.time()
                 
+                # Attach network quality summary if the call got connected
+                if self.call_state == CallState.CONNECTED:
+                    summary = self.livekit_client.network_stats.get_summary()
+                    concealer = self.livekit_client.concealer
+                    if concealer:
+                        # Gaps we filled locally after the jitter buffer ran dry
+                        summary["playback_concealment"] = concealer.get_stats()
+                        metrics.increment("playback.concealment_events", concealer.concealment_events)
+                        metrics.increment("playback.concealed_ms", summary["playback_concealment"]["concealed_ms"])
+                    self.current_call.network_stats = summary
+                    logger.info(f"📶 Call network summary: rtt {summary['rtt_ms_mean']}ms, "
+                                f"jitter {summary['jitter_ms_mean']}ms, "
+                                f"loss in/out {summary['inbound_loss_pct']}%/{summary['outbound_loss_pct']}%, "
+                                f"concealed {summary['concealed_pct']}%")
+                
                 # Trigger callback
                 if self.on_call_ended:
                     try:
@@ -417,6 +476,11 @@ class CallManagerV2:
                 logger.error(f"❌ Invalid incoming call data - missing fields: from_user={from_user}, room_name={room_name}, token={bool(token)}, call_id={call_id}")
                 return
             
+            # The server repeats a pending invitation when the Pi re-registers
+            if self.current_call and str(self.current_call.call_id) == str(call_id):
+                logger.info(f"📞 Call {call_id} already known, ignoring repeated invitation")
+                return
+            
             # Create call info
             self.current_call = CallInfo(
                 call_id=call_id,
@@ -446,6 +510,30 @@ class CallManagerV2:
         except Exception as e:
             logger.error(f"❌ Failed to handle call end: {e}")
     
+    async def _on_socket_reconnected(self, data):
+        """Reconcile call state with the server after the socket was down
+        
+        data is the 'user-registered' reply; pendingCall is the invitation the
+        server still holds for this Pi (and re-sends), if any.
+        """
+        try:
+            if self.call_state == CallState.INCOMING and self.current_call and "pendingCall" in data:
+                pending = data.get("pendingCall")
+                if pending is None or str(pending) != str(self.current_call.call_id):
+                    logger.info("📴 Incoming call was withdrawn while offline")
+                    await self._end_call()
+            elif self.call_state == CallState.CONNECTED and not self.livekit_client.is_connected():
+                logger.info("📴 Call room was lost while offline")
+                await self._end_call()
+            
+            # Contacts may have changed meanwhile; a call may follow right away
+            self.user_manager.contacts.request_sync()
+            self.user_manager.user_search.invalidate()
+            self.web_api.prewarm()
+            
+        except Exception as e:
+            logger.error(f"❌ Failed to resync after reconnect: {e}")
+    
     # LiveKit event handlers
     def _on_livekit_connected(self):
         """Handle LiveKit connection"""
@@ -552,16 +640,34 @@ class CallManagerV2:
         """Check if connected to web client"""
         return self.web_socket.connected
     
+    def on_settings_changed(self, changes: Dict):
+        """Apply settings edited while running (from the settings watcher)"""
+        controller = self.livekit_client.publish_controller
+        for key, (_, value) in changes.items():
+            if key == "audio_publishing.adaptive":
+                controller.enabled = bool(value)
+                logger.info(f"📶 Adaptive publishing {'enabled' if value else 'disabled'}")
+            elif key == "audio_publishing.initial_profile":
+                # Takes effect from the next call (reset() on call start)
+                controller.initial_index = controller._index_of(value)
+            elif key.startswith(("livekit.", "web_client.url")):
+                logger.warning(f"⚠️ {key} changed - restart the app to reconnect with the new server")
+    
     async def get_contacts(self) -> Optional[list]:
-        """Get contacts from web client"""
-        return await self.web_api.get_user_contacts()
+        """Get contacts from the local directory, refreshing it in the background"""
+        self.user_manager.contacts.request_sync(max_age=30.0)
+        return self.user_manager.contacts.list_contacts()
     
     def enable_call_recording(self) -> bool:
         """Enable call recording for debugging"""
         try:
             import datetime
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            self.call_recording_filename = f"/tmp/call_recording_{timestamp}.wav"
+            if self.recording_store:
+                call_id = self.current_call.call_id if self.current_call else ""
+                self.call_recording_filename = self.recording_store.new_path(call_id)
+            else:
+                timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+                self.call_recording_filename = f"/tmp/call_recording_{timestamp}.wav"
             self.call_recording_enabled = True
             logger.info(f"📹 Call recording enabled: {self.call_recording_filename}")
             return True
@@ -575,6 +681,10 @@ class CallManagerV2:
         self.call_recording_filename = None
         logger.info("📹 Call recording disabled")
     
+    def get_last_call_recording_file(self) -> Optional[str]:
+        """Get the most recently finished call recording"""
+        return self.last_call_recording_file
+    
     def get_call_recording_file(self) -> Optional[str]:
         """Get the current call recording filename"""
         return self.call_recording_filename if self.call_recording_enabled else None
@@ -633,8 +743,19 @@ class CallManagerV2:
             if not recording_file:
                 recording_file = self.call_recording_filename
             
+            self.last_call_recording_file = recording_file
             self.disable_call_recording()
             
+            # Index the finished recording (retention runs in the background)
+            if self.recording_store and recording_file and os.path.exists(recording_file):
+                call = self.current_call
+                participants = [name for name in (call.caller_name, call.callee_name) if name] if call else []
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(
+                    None, self.recording_store.add, recording_file,
+                    call.call_id if call else "", participants, call.start_time if call else None
+                )
+            
             logger.info(f"📹 Call recording stopped: {recording_file}")
             return recording_file
             
@@ -0,0 +1,463 @@
+"""
+Contact Directory for EmmaPhone2 Pi
+
+Local SQLite copy of the user's contacts, indexed by user id, name and
+speed-dial slot. The web UI, the CLI and the speed-dial buttons read it
+directly, so a lookup never waits on the network. Contacts from the web
+client are merged in by a background sync that sends the last ETag /
+Last-Modified (and a version cursor when the server provides one), so an
+unchanged contact list costs a 304.
+
+Speed-dial slots belong to the Pi: a sync never moves or clears them.
+Contacts and slots that older tools keep in settings.json are imported,
+and later edits made there are applied as they happen.
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from diagnostics.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS contacts (
+    user_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    username TEXT,
+    speed_dial INTEGER,
+    local INTEGER NOT NULL DEFAULT 0,
+    synced INTEGER NOT NULL DEFAULT 0,
+    data TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS contacts_name ON contacts (name COLLATE NOCASE);
+CREATE UNIQUE INDEX IF NOT EXISTS contacts_speed_dial ON contacts (speed_dial) WHERE speed_dial IS NOT NULL;
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+COLUMNS = "user_id, name, username, speed_dial, local, synced"
+
+def _row_to_contact(row) -> Dict:
+    return {
+        "user_id": row[0],
+        "name": row[1],
+        "username": row[2],
+        "speed_dial": row[3],
+        "local": bool(row[4]),
+        "synced": bool(row[5])
+    }
+
+def _server_contact(entry: Dict) -> Optional[Dict]:
+    """Normalise a contact from the web client's /api/contacts"""
+    user_id = entry.get("contact_user_id", entry.get("user_id"))
+    if user_id is None:
+        return None
+    return {
+        "user_id": str(user_id),
+        "name": entry.get("display_name") or entry.get("username") or f"User {user_id}",
+        "username": entry.get("username"),
+        "data": json.dumps(entry)
+    }
+
+class ContactDirectory:
+    """SQLite-backed contacts with incremental sync from the web client"""
+
+    _instances: Dict[Path, "ContactDirectory"] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # One connection shared by the event loop, executor and web threads
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._db.commit()
+
+        # Bumped on every change made here; see version for other processes
+        self._local_version = 0
+        self._contacts_cache = (None, [])
+
+        self.sync_interval = 300.0
+        self.task = None
+        self.running = False
+        self._sync_requested = None
+        self.last_sync = None
+        self.last_sync_error = None
+        self.syncs = 0
+        self.not_modified = 0
+
+    @classmethod
+    def for_settings(cls, settings) -> "ContactDirectory":
+        """Shared directory in the settings directory, importing legacy contacts"""
+        db_path = Path(settings.config_dir) / "contacts.db"
+        with cls._instances_lock:
+            directory = cls._instances.get(db_path)
+            if directory is None:
+                directory = cls._instances[db_path] = cls(db_path)
+        directory.import_settings(settings)
+        return directory
+
+    # Reads
+
+    def list_contacts(self) -> List[Dict]:
+        """All contacts, speed-dial slots first then by name"""
+        cached_version, contacts = self._contacts_cache
+        version = self.version
+        if cached_version == version:
+            return contacts
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {COLUMNS} FROM contacts "
+                "ORDER BY speed_dial IS NULL, speed_dial, name COLLATE NOCASE"
+            ).fetchall()
+        contacts = [_row_to_contact(row) for row in rows]
+        self._contacts_cache = (version, contacts)
+        return contacts
+
+    def speed_dial_contacts(self) -> List[Dict]:
+        return [contact for contact in self.list_contacts() if contact["speed_dial"]]
+
+    def get(self, user_id: str) -> Optional[Dict]:
+        return self._fetch_one("user_id = ?", (str(user_id),))
+
+    def find_by_name(self, name: str) -> Optional[Dict]:
+        return self._fetch_one("name = ? COLLATE NOCASE", (name,))
+
+    def get_speed_dial_contact(self, position: int) -> Optional[Dict]:
+        return self._fetch_one("speed_dial = ?", (int(position),))
+
+    def get_speed_dial(self, position: int) -> Optional[str]:
+        """User id on a speed-dial slot (same contract as Settings.get_speed_dial)"""
+        contact = self.get_speed_dial_contact(position)
+        return contact["user_id"] if contact else None
+
+    def _fetch_one(self, where: str, params: tuple) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute(f"SELECT {COLUMNS} FROM contacts WHERE {where} LIMIT 1", params).fetchone()
+        return _row_to_contact(row) if row else None
+
+    # Local changes
+
+    def add_contact(self, name: str, user_id: str, speed_dial: Optional[int] = None):
+        """Add or update a contact on the Pi, taking over the speed-dial slot if given"""
+        user_id = str(user_id)
+        with self._lock, self._db:
+            if speed_dial:
+                self._db.execute("UPDATE contacts SET speed_dial = NULL WHERE speed_dial = ? AND user_id != ?",
+                                 (speed_dial, user_id))
+            self._db.execute(
+                "INSERT INTO contacts (user_id, name, speed_dial, local, updated_at) VALUES (?, ?, ?, 1, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET name = excluded.name, "
+                "speed_dial = COALESCE(excluded.speed_dial, speed_dial), local = 1, updated_at = excluded.updated_at",
+                (user_id, name, speed_dial, time.time())
+            )
+        self._changed()
+        logger.info(f"📱 Contact added: {name}")
+
+    def remove_contact(self, contact_name: str = None, user_id: str = None, speed_dial_position: int = None) -> bool:
+        """Remove a Pi contact; contacts that also exist on the server only lose their slot"""
+        if contact_name:
+            contact = self.find_by_name(contact_name)
+        elif user_id:
+            contact = self.get(user_id)
+        elif speed_dial_position:
+            contact = self.get_speed_dial_contact(speed_dial_position)
+        else:
+            contact = None
+
+        if not contact:
+            logger.warning("📱 Contact not found for removal")
+            return False
+
+        with self._lock, self._db:
+            if contact["synced"]:
+                self._db.execute("UPDATE contacts SET speed_dial = NULL, local = 0, updated_at = ? WHERE user_id = ?",
+                                 (time.time(), contact["user_id"]))
+            else:
+                self._db.execute("DELETE FROM contacts WHERE user_id = ?", (contact["user_id"],))
+        self._changed()
+        logger.info(f"📱 Contact removed: {contact['name']}")
+        return True
+
+    def clear(self):
+        """Forget all contacts and the sync position (user configuration cleared)"""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM contacts")
+            self._db.execute("DELETE FROM sync_state WHERE key != 'settings_snapshot'")
+        self._changed()
+
+    def set_speed_dial(self, position: int, user_id: str):
+        """Put a user on a speed-dial slot, adding a placeholder contact for unknown ids"""
+        user_id = str(user_id)
+        with self._lock, self._db:
+            self._db.execute("UPDATE contacts SET speed_dial = NULL WHERE speed_dial = ? AND user_id != ?",
+                             (position, user_id))
+            self._db.execute(
+                "INSERT INTO contacts (user_id, name, speed_dial, local, updated_at) VALUES (?, ?, ?, 1, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET speed_dial = excluded.speed_dial, local = 1, "
+                "updated_at = excluded.updated_at",
+                (user_id, f"User {user_id}", position, time.time())
+            )
+        self._changed()
+        logger.info(f"📱 Speed dial {position}: {user_id}")
+
+    def import_settings(self, settings):
+        """Apply changes made to the contacts kept in settings.json
+        
+        Older tools (configure_speed_dial.py, setup scripts) still edit
+        user.contacts and user.speed_dial. The directory owns contacts made on
+        the Pi, so only what changed in settings since the last import is
+        applied, removals included.
+        """
+        contacts = settings.get("user.contacts", []) or []
+        speed_dial = settings.get("user.speed_dial", {}) or {}
+        current = {
+            "contacts": {str(contact["user_id"]): contact for contact in contacts
+                         if contact.get("user_id") and contact.get("name")},
+            "speed_dial": {str(position): str(user_id) for position, user_id in speed_dial.items()
+                           if str(position).isdigit() and user_id}
+        }
+        snapshot = json.dumps(current, sort_keys=True)
+        previous = self._get_state("settings_snapshot")
+        if previous == snapshot:
+            return
+        previous = json.loads(previous) if previous else {"contacts": {}, "speed_dial": {}}
+
+        changes = 0
+        for user_id, contact in current["contacts"].items():
+            if previous["contacts"].get(user_id) != contact:
+                self.add_contact(contact["name"], user_id, contact.get("speed_dial"))
+                changes += 1
+        for user_id in previous["contacts"].keys() - current["contacts"].keys():
+            if self.get(user_id):
+                self.remove_contact(user_id=user_id)
+                changes += 1
+
+        for position, user_id in current["speed_dial"].items():
+            if previous["speed_dial"].get(position) != user_id:
+                self.set_speed_dial(int(position), user_id)
+                changes += 1
+        for position, user_id in previous["speed_dial"].items():
+            if position not in current["speed_dial"]:
+                # Only if the slot was not reassigned on the Pi meanwhile
+                with self._lock, self._db:
+                    cleared = self._db.execute("UPDATE contacts SET speed_dial = NULL WHERE speed_dial = ? AND user_id = ?",
+                                               (int(position), user_id)).rowcount
+                if cleared:
+                    self._changed()
+                    changes += 1
+
+        self._set_state({"settings_snapshot": snapshot})
+        if changes:
+            logger.info(f"📇 Applied {changes} contact changes from settings")
+
+    @property
+    def version(self) -> tuple:
+        """Cache key for the directory's contents, for page caches and the contact list
+
+        PRAGMA data_version moves when another connection (the CLI, another
+        process) commits to the same database, so their changes are seen too.
+        """
+        with self._lock:
+            data_version = self._db.execute("PRAGMA data_version").fetchone()[0]
+        return (self._local_version, data_version)
+
+    def _changed(self):
+        self._local_version += 1
+        metrics.increment("contacts.changes")
+
+    # Sync
+
+    async def sync(self, web_api) -> bool:
+        """Fetch contact changes from the web client; returns True if any applied
+
+        Concurrent calls (sync loop, CLI, page loads) share one request.
+        """
+        if not web_api or not web_api.authenticated or not web_api.ready:
+            return False
+        return await web_api.cache.coalesce("contacts.sync", lambda: self._sync(web_api))
+
+    async def _sync(self, web_api) -> bool:
+        state = self._get_states(("etag", "last_modified", "cursor"))
+        headers = {}
+        if state.get("etag"):
+            headers["If-None-Match"] = state["etag"]
+        if state.get("last_modified"):
+            headers["If-Modified-Since"] = state["last_modified"]
+        params = {"since": state["cursor"]} if state.get("cursor") else None
+
+        started = time.monotonic()
+        try:
+            response = await web_api.request("GET", "contacts", headers=headers, params=params)
+        except Exception as e:
+            self.last_sync_error = str(e)
+            logger.warning(f"⚠️ Contact sync failed: {e}")
+            return False
+
+        if response.status == 304:
+            self.not_modified += 1
+            metrics.increment("contacts.sync_not_modified")
+            self.last_sync = time.time()
+            self.last_sync_error = None
+            return False
+        if response.status != 200:
+            self.last_sync_error = f"{response.status} - {response.text()}"
+            logger.warning(f"⚠️ Contact sync failed: {self.last_sync_error}")
+            return False
+        try:
+            payload = response.json()
+        except ValueError as e:
+            self.last_sync_error = f"invalid response: {e}"
+            logger.warning(f"⚠️ Contact sync failed: {self.last_sync_error}")
+            return False
+        validators = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified")
+        }
+
+        loop = asyncio.get_running_loop()
+        changed = await loop.run_in_executor(None, self._apply_sync, payload, validators)
+        self.syncs += 1
+        self.last_sync = time.time()
+        self.last_sync_error = None
+        metrics.increment("contacts.syncs")
+        logger.info(f"📇 Contacts synced in {(time.monotonic() - started) * 1000:.0f} ms"
+                    f"{' (changed)' if changed else ''}")
+        return changed
+
+    def _apply_sync(self, payload, validators: Dict) -> bool:
+        """Merge a sync response: a full list, or {contacts, deleted, cursor} for a delta"""
+        if isinstance(payload, dict):
+            entries = payload.get("contacts", [])
+            deleted = [str(user_id) for user_id in payload.get("deleted", [])]
+            # A delta lists its deletions; without them the list is complete
+            full = "deleted" not in payload
+            validators["cursor"] = payload.get("cursor")
+        else:
+            entries, deleted, full = payload, [], True
+
+        contacts = [contact for contact in map(_server_contact, entries) if contact]
+        now = time.time()
+        with self._lock, self._db:
+            before = self._db.total_changes
+            for contact in contacts:
+                self._db.execute(
+                    "INSERT INTO contacts (user_id, name, username, synced, data, updated_at) "
+                    "VALUES (?, ?, ?, 1, ?, ?) "
+                    "ON CONFLICT (user_id) DO UPDATE SET "
+                    "name = CASE WHEN local THEN name ELSE excluded.name END, "
+                    "username = excluded.username, synced = 1, data = excluded.data, updated_at = excluded.updated_at "
+                    "WHERE data IS NOT excluded.data OR synced = 0",
+                    (contact["user_id"], contact["name"], contact["username"], contact["data"], now)
+                )
+
+            if full:
+                # Anything synced before and missing now was deleted on the server
+                present = {contact["user_id"] for contact in contacts}
+                synced = [row[0] for row in self._db.execute("SELECT user_id FROM contacts WHERE synced = 1")]
+                deleted = [user_id for user_id in synced if user_id not in present]
+
+            for user_id in deleted:
+                self._db.execute("DELETE FROM contacts WHERE user_id = ? AND local = 0", (user_id,))
+                self._db.execute("UPDATE contacts SET synced = 0 WHERE user_id = ?", (user_id,))
+
+            changed = self._db.total_changes != before
+            self._set_state_locked(validators)
+
+        if changed:
+            self._changed()
+        return changed
+
+    def request_sync(self, max_age: float = 0.0):
+        """Ask the sync task to run now (e.g. the contact list was opened)
+
+        Skipped if the last sync is younger than max_age seconds, so callers
+        that read the directory often can refresh it stale-while-revalidate.
+        """
+        if self.last_sync and time.time() - self.last_sync < max_age:
+            return
+        if self._sync_requested:
+            self._sync_requested.set()
+
+    async def start(self, web_api, interval: Optional[float] = None):
+        """Sync now and then periodically in the background"""
+        if self.running:
+            return
+        if interval is not None:
+            self.sync_interval = interval
+        self.running = True
+        self._sync_requested = asyncio.Event()
+        self.task = asyncio.create_task(self._sync_loop(web_api))
+        logger.info(f"📇 Contact directory started ({len(self.list_contacts())} contacts)")
+
+    async def stop(self):
+        self.running = False
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def _sync_loop(self, web_api):
+        while self.running:
+            await self.sync(web_api)
+            try:
+                await asyncio.wait_for(self._sync_requested.wait(), timeout=self.sync_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._sync_requested.clear()
+
+    # Sync state
+
+    def _get_state(self, key: str) -> Optional[str]:
+        return self._get_states((key,)).get(key)
+
+    def _get_states(self, keys: Iterable[str]) -> Dict[str, str]:
+        keys = list(keys)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT key, value FROM sync_state WHERE key IN ({', '.join('?' * len(keys))})", keys
+            ).fetchall()
+        return dict(rows)
+
+    def _set_state(self, values: Dict[str, Optional[str]]):
+        with self._lock, self._db:
+            self._set_state_locked(values)
+
+    def _set_state_locked(self, values: Dict[str, Optional[str]]):
+        for key, value in values.items():
+            if value is None:
+                self._db.execute("DELETE FROM sync_state WHERE key = ?", (key,))
+            else:
+                self._db.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def get_stats(self) -> Dict:
+        contacts = self.list_contacts()
+        return {
+            "contacts": len(contacts),
+            "speed_dial": len([contact for contact in contacts if contact["speed_dial"]]),
+            "version": self.version,
+            "syncs": self.syncs,
+            "not_modified": self.not_modified,
+            "last_sync": self.last_sync,
+            "last_sync_error": self.last_sync_error
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
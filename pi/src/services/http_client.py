@@ -0,0 +1,460 @@
+"""
+HTTP Client for EmmaPhone2 Pi
+
+One pooled aiohttp session for everything the Pi asks the web client:
+keep-alive connections with a DNS cache, per-endpoint timeouts, jittered
+exponential retry for calls that are safe to repeat, and a circuit breaker
+so an unreachable server fails fast instead of stacking up timeouts.
+
+Every request is timed into a per-endpoint latency histogram, and requests
+that had to open a new TCP/TLS connection are counted as cold. prewarm()
+opens a connection ahead of a likely call (button pressed, call ringing) so
+initiate-call goes out on a connection that is already up.
+"""
+import asyncio
+import bisect
+import json
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+from yarl import URL
+
+from diagnostics.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Server errors worth another attempt (the request never reached the app or it was overloaded)
+RETRY_STATUSES = {502, 503, 504}
+
+# Per-endpoint policy: total timeout in seconds and attempts after the first.
+# Only calls that are safe to repeat get retries; initiate-call must never be
+# sent twice, and a caller waiting on the button wants a quick answer.
+DEFAULT_POLICY = {"timeout": 10.0, "retries": 0}
+DEFAULT_GET_POLICY = {"timeout": 10.0, "retries": 2}
+ENDPOINT_POLICIES = {
+    "initiate-call": {"timeout": 5.0, "retries": 0},
+    "auth/login": {"timeout": 8.0, "retries": 2},
+    "auth/me": {"timeout": 5.0, "retries": 1},
+    "auth/register": {"timeout": 10.0, "retries": 0},
+    "check-username": {"timeout": 5.0, "retries": 1},
+    "contacts": {"timeout": 15.0, "retries": 2},
+    "users/search": {"timeout": 5.0, "retries": 1},
+    "uploads": {"timeout": 60.0, "retries": 0},
+    "warmup": {"timeout": 5.0, "retries": 0},
+}
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request while the circuit breaker is open"""
+
+class HttpResponse:
+    """A fully read response (the connection is back in the pool)"""
+
+    __slots__ = ("status", "headers", "body")
+
+    def __init__(self, status: int, headers, body: bytes):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def text(self) -> str:
+        return self.body.decode("utf-8", errors="replace")
+
+    def json(self) -> Any:
+        return json.loads(self.body) if self.body else None
+
+class LatencyHistogram:
+    """Request latency histogram in LoopMonitor's bucket layout"""
+
+    BUCKET_BOUNDS_MS = [10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+    def __init__(self):
+        # One extra bucket for everything above the last bound
+        self.buckets = [0] * (len(self.BUCKET_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, latency_ms: float):
+        self.buckets[bisect.bisect_left(self.BUCKET_BOUNDS_MS, latency_ms)] += 1
+        self.count += 1
+        self.total_ms += latency_ms
+        if latency_ms > self.max_ms:
+            self.max_ms = latency_ms
+
+    def get_histogram(self) -> List[Dict]:
+        histogram = []
+        lower = 0
+        for bound, count in zip(self.BUCKET_BOUNDS_MS, self.buckets):
+            histogram.append({"le_ms": bound, "gt_ms": lower, "count": count})
+            lower = bound
+        histogram.append({"le_ms": None, "gt_ms": lower, "count": self.buckets[-1]})
+        return histogram
+
+    def get_percentile(self, percentile: float) -> Optional[float]:
+        """Estimate a latency percentile (upper bucket bound) in milliseconds"""
+        if not self.count:
+            return None
+        target = self.count * percentile / 100.0
+        cumulative = 0
+        for bound, count in zip(self.BUCKET_BOUNDS_MS, self.buckets):
+            cumulative += count
+            if cumulative >= target:
+                return float(bound)
+        return self.max_ms
+
+class EndpointStats:
+    """Latency and outcome counters for one endpoint"""
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.cold = 0
+        self.statuses: Dict[int, int] = {}
+
+    def get_stats(self) -> Dict:
+        latency = self.latency
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "cold_connections": self.cold,
+            "statuses": dict(self.statuses),
+            "avg_ms": latency.total_ms / latency.count if latency.count else None,
+            "p50_ms": latency.get_percentile(50),
+            "p95_ms": latency.get_percentile(95),
+            "max_ms": latency.max_ms,
+            "histogram": latency.get_histogram()
+        }
+
+class CircuitBreaker:
+    """Closed → open after consecutive failures → half-open probe after a pause"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.open_count = 0
+        self._probing = False
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now"""
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+            self._probing = False
+        if self.state == self.HALF_OPEN:
+            # A single probe decides whether the server is back (a probe that
+            # was cancelled without an answer frees the slot after a while)
+            now = time.monotonic()
+            if self._probing and now - self.opened_at < 2 * self.reset_timeout:
+                return False
+            self._probing = True
+            self.opened_at = now - self.reset_timeout
+        return True
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info("🔌 Web client reachable again, circuit closed")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.open_count += 1
+                logger.warning(f"⚠️ Web client unreachable after {self.failures} failures, "
+                               f"failing fast for {self.reset_timeout:.0f}s")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+    def get_stats(self) -> Dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "times_opened": self.open_count
+        }
+
+class HttpClient:
+    """Pooled, instrumented HTTP client for one web client server"""
+
+    def __init__(self,
+                 base_url: str,
+                 api_endpoint: str = "/api",
+                 pool_size: int = 8,
+                 keepalive_timeout: float = 4.0,
+                 dns_cache_ttl: int = 300,
+                 connect_timeout: float = 5.0,
+                 warmup_path: str = "/auth/me",
+                 failure_threshold: int = 5,
+                 reset_timeout: float = 30.0):
+        self.base_url = base_url.rstrip('/')
+        self.api_endpoint = api_endpoint
+        self.pool_size = pool_size
+        # Stay under the server's idle timeout (Node closes idle sockets after 5 s)
+        # so a pooled connection is never reused just as the server drops it
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.connect_timeout = connect_timeout
+        self.warmup_path = warmup_path
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.endpoints: Dict[str, EndpointStats] = {}
+        self.last_response_at = 0.0
+        self.warmups = 0
+        self._warm_task = None
+        self._keep_warm_task = None
+        self._keep_warm_until = 0.0
+        # Called on a 401 from a non-auth endpoint; returns True once logged in again
+        self.on_unauthorized: Optional[Callable[[], Awaitable[bool]]] = None
+        self.reauthentications = 0
+
+    async def start(self):
+        """Create the connection pool"""
+        if self.session:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.pool_size,
+            ttl_dns_cache=self.dns_cache_ttl,
+            keepalive_timeout=self.keepalive_timeout
+        )
+        trace = aiohttp.TraceConfig()
+        trace.on_connection_create_end.append(self._on_connection_created)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=DEFAULT_POLICY["timeout"], connect=self.connect_timeout),
+            # unsafe: keep session cookies from servers addressed by IP (local setups)
+            cookie_jar=aiohttp.CookieJar(unsafe=True),
+            trace_configs=[trace]
+        )
+
+    async def close(self):
+        for task in (self._warm_task, self._keep_warm_task):
+            if task and not task.done():
+                task.cancel()
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+    async def _on_connection_created(self, session, context, params):
+        if context.trace_request_ctx is not None:
+            context.trace_request_ctx["cold"] = True
+
+    def url(self, path: str) -> str:
+        """Absolute URL for an API path (absolute URLs pass through)"""
+        if path.startswith(("http://", "https://")):
+            return path
+        return f"{self.base_url}{self.api_endpoint}/{path.lstrip('/')}"
+
+    def _endpoint_name(self, path: str) -> str:
+        if path.startswith(("http://", "https://")):
+            path = urlsplit(path).path
+            if path.startswith(self.api_endpoint + "/"):
+                path = path[len(self.api_endpoint):]
+        return path.split("?", 1)[0].strip("/") or "/"
+
+    async def request(self, method: str, path: str, endpoint: Optional[str] = None,
+                      retries: Optional[int] = None, timeout: Optional[float] = None,
+                      **kwargs) -> HttpResponse:
+        """Send a request and read the whole response
+
+        endpoint names the policy and stats bucket (defaults to the path).
+        Connection errors, timeouts and 502/503/504 are retried with full
+        jitter up to the policy's retry count; the last exception is raised
+        when attempts run out. Raises CircuitOpenError while the server is
+        considered down. path may also be an absolute URL.
+
+        A 401 from this server means the session expired: on_unauthorized()
+        logs in again and the request is repeated once.
+        """
+        endpoint = endpoint or self._endpoint_name(path)
+        response = await self._request(method, path, endpoint, retries, timeout, **kwargs)
+        if (response.status == 401 and self.on_unauthorized and endpoint not in ("auth/login", "auth/register")
+                and self.url(path).startswith(self.base_url + "/")):
+            self.reauthentications += 1
+            metrics.increment("web_client.reauthentications")
+            if await self.on_unauthorized():
+                response = await self._request(method, path, endpoint, retries, timeout, **kwargs)
+        return response
+
+    async def _request(self, method: str, path: str, endpoint: Optional[str] = None,
+                       retries: Optional[int] = None, timeout: Optional[float] = None,
+                       **kwargs) -> HttpResponse:
+        """One request, with the endpoint's retries"""
+        if not self.session:
+            raise RuntimeError("HTTP client not started")
+        policy = ENDPOINT_POLICIES.get(endpoint, DEFAULT_GET_POLICY if method == "GET" else DEFAULT_POLICY)
+        retries = policy["retries"] if retries is None else retries
+        timeout = aiohttp.ClientTimeout(total=timeout or policy["timeout"], connect=self.connect_timeout)
+        stats = self.endpoints.get(endpoint)
+        if stats is None:
+            stats = self.endpoints[endpoint] = EndpointStats()
+        url = self.url(path)
+        # Other hosts (e.g. an upload server) must not trip the breaker for this one
+        breaker = self.breaker if url.startswith(self.base_url + "/") else None
+
+        attempt = 0
+        while True:
+            if breaker and not breaker.allow():
+                metrics.increment("web_client.circuit_rejected")
+                raise CircuitOpenError(f"web client unavailable, not sending {endpoint}")
+
+            trace_ctx = {"cold": False}
+            started = time.monotonic()
+            stats.requests += 1
+            metrics.increment("web_client.requests")
+            try:
+                async with self.session.request(method, url, timeout=timeout,
+                                                trace_request_ctx=trace_ctx, **kwargs) as response:
+                    body = await response.read()
+                    result = HttpResponse(response.status, response.headers, body)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self._record(stats, started, trace_ctx, None)
+                if breaker:
+                    breaker.record_failure()
+                if attempt >= retries:
+                    raise
+                error = e
+            else:
+                self._record(stats, started, trace_ctx, result.status)
+                if breaker:
+                    if result.status >= 500:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                    self.last_response_at = time.monotonic()
+                if result.status not in RETRY_STATUSES or attempt >= retries:
+                    return result
+                error = f"status {result.status}"
+
+            # Full jitter keeps a fleet of phones from retrying in lockstep
+            attempt += 1
+            stats.retries += 1
+            metrics.increment("web_client.retries")
+            delay = random.uniform(0, min(4.0, 0.25 * 2 ** attempt))
+            logger.debug(f"🔁 Retrying {endpoint} in {delay:.2f}s ({error})")
+            await asyncio.sleep(delay)
+
+    def _record(self, stats: EndpointStats, started: float, trace_ctx: Dict, status: Optional[int]):
+        stats.latency.record((time.monotonic() - started) * 1000.0)
+        if trace_ctx["cold"]:
+            stats.cold += 1
+            metrics.increment("web_client.cold_connections")
+        if status is None:
+            stats.errors += 1
+            metrics.increment("web_client.errors")
+            return
+        stats.statuses[status] = stats.statuses.get(status, 0) + 1
+
+    async def get(self, path: str, **kwargs) -> HttpResponse:
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> HttpResponse:
+        return await self.request("POST", path, **kwargs)
+
+    async def put(self, path: str, **kwargs) -> HttpResponse:
+        return await self.request("PUT", path, **kwargs)
+
+    # Session cookies
+
+    def export_cookies(self) -> Dict[str, Dict]:
+        """Cookies the server set for base_url, with their expiry (epoch seconds or None)"""
+        if not self.session:
+            return {}
+        cookies = {}
+        names = self.session.cookie_jar.filter_cookies(URL(self.base_url)).keys()
+        # The jar's own morsels keep the attributes (filter_cookies returns bare values)
+        for morsel in self.session.cookie_jar:
+            name = morsel.key
+            if name not in names:
+                continue
+            expires = None
+            if morsel["expires"]:
+                try:
+                    expires = parsedate_to_datetime(morsel["expires"]).timestamp()
+                except (TypeError, ValueError):
+                    pass
+            elif morsel["max-age"]:
+                try:
+                    expires = time.time() + int(morsel["max-age"])
+                except ValueError:
+                    pass
+            cookies[name] = {"value": morsel.value, "expires": expires}
+        return cookies
+
+    def import_cookies(self, cookies: Dict[str, Dict]):
+        """Restore cookies saved with export_cookies()"""
+        if self.session and cookies:
+            self.session.cookie_jar.update_cookies(
+                {name: cookie["value"] for name, cookie in cookies.items()},
+                response_url=URL(self.base_url)
+            )
+
+    def clear_cookies(self):
+        if self.session:
+            self.session.cookie_jar.clear()
+
+    # Warm connections
+
+    def is_warm(self) -> bool:
+        """Whether a pooled connection is probably still open"""
+        return time.monotonic() - self.last_response_at < self.keepalive_timeout - 0.5
+
+    def prewarm(self):
+        """Open a connection now unless one is already warm (safe to call often)"""
+        if not self.session or self.is_warm() or self.breaker.state == CircuitBreaker.OPEN:
+            return
+        if self._warm_task and not self._warm_task.done():
+            return
+        self._warm_task = asyncio.create_task(self._warm())
+
+    async def _warm(self):
+        try:
+            await self.request("GET", self.warmup_path, endpoint="warmup")
+            self.warmups += 1
+            metrics.increment("web_client.warmups")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.debug(f"Connection warm-up failed: {e}")
+
+    def keep_warm(self, seconds: float):
+        """Keep a connection open for the next few seconds (e.g. while a call rings)"""
+        self._keep_warm_until = max(self._keep_warm_until, time.monotonic() + seconds)
+        self.prewarm()
+        if not self._keep_warm_task or self._keep_warm_task.done():
+            self._keep_warm_task = asyncio.create_task(self._keep_warm_loop())
+
+    async def _keep_warm_loop(self):
+        while self.session and time.monotonic() < self._keep_warm_until:
+            await asyncio.sleep(max(0.5, self.keepalive_timeout - 1.0))
+            self.prewarm()
+
+    def get_stats(self) -> Dict:
+        return {
+            "base_url": self.base_url,
+            "pool_size": self.pool_size,
+            "keepalive_timeout": self.keepalive_timeout,
+            "dns_cache_ttl": self.dns_cache_ttl,
+            "warm": self.is_warm(),
+            "warmups": self.warmups,
+            "reauthentications": self.reauthentications,
+            "circuit": self.breaker.get_stats(),
+            "endpoints": {name: stats.get_stats() for name, stats in sorted(self.endpoints.items())}
+        }
@@ -7,16 +7,29 @@ import asyncio
 import logging
 import json
 import aiohttp
+import numpy as np
 import pyaudio
+import time
 from typing import Optional, Callable, Dict, Any
 from livekit import rtc
 
+from diagnostics.fast_logging import SampledLogger
+from diagnostics.flight_recorder import KIND_PLAYBACK, FLAG_BUFFER_UNDERRUN, FLAG_CONCEALED
+from .network_stats import NetworkStatsCollector
+from .adaptive_publisher import AdaptivePublishController, PublishProfile
+from dsp.mixer import AudioMixer
+from dsp.concealment import PacketLossConcealer
+
 logger = logging.getLogger(__name__)
 
+# Sampled logger for capture/playback callbacks: first few frames, then ~every 10s
+hot_log = SampledLogger(logger, first=3, every=500, rate=0.2, burst=2)
+
 class LiveKitClient:
     """LiveKit WebRTC client for Pi audio calling"""
     
-    def __init__(self, server_url: str, api_key: str, api_secret: str):
+    def __init__(self, server_url: str, api_key: str, api_secret: str,
+                 publish_config: Optional[Dict] = None):
         self.server_url = server_url
         self.api_key = api_key
         self.api_secret = api_secret
@@ -31,9 +44,29 @@ class LiveKitClient:
         self.local_audio_track = None
         self.remote_audio_track = None
         
+        # Playback mixer with one input per remote audio track, followed by
+        # gap concealment before the speaker
+        self.mixer = None
+        self.concealer = None
+        
+        # (source, channels) the capture callback feeds; swapped atomically on republish
+        self._publish_target = None
+        
         # Event loop for threading
         self.main_loop = None
         
+        # WebRTC network quality stats (collected while in a room)
+        self.network_stats = NetworkStatsCollector(self)
+        
+        # Network-adaptive publishing profile selection
+        publish_config = publish_config or {}
+        self.publish_controller = AdaptivePublishController(
+            self,
+            initial_profile=publish_config.get("initial_profile", "standard"),
+            enabled=publish_config.get("adaptive", True)
+        )
+        self.network_stats.on_sample = self.publish_controller.on_sample
+        
         # Callbacks
         self.on_connected = None
         self.on_disconnected = None
@@ -109,6 +142,8 @@ class LiveKitClient:
             # Set connected flag manually since callback might not fire
             self.connected = True
             
+            await self.network_stats.start()
+            
             logger.info(f"✅ Joined room: {room_name}")
             return True
             
@@ -119,6 +154,8 @@ class LiveKitClient:
     async def leave_room(self):
         """Leave the current room"""
         try:
+            await self.network_stats.stop()
+            
             if self.room and self.connected:
                 await self.room.disconnect()
                 logger.info("📤 Left room")
@@ -137,31 +174,11 @@ class LiveKitClient:
             
             logger.info("🎤 Creating LiveKit audio source...")
             
-            # Create audio source compatible with LiveKit
-            from livekit import rtc
-            
-            # Create audio source with Pi's audio configuration
-            self.audio_source = rtc.AudioSource(
-                sample_rate=audio_manager.SAMPLE_RATE,
-                num_channels=audio_manager.CHANNELS
-            )
-            
-            # Create audio track from source
-            self.local_audio_track = rtc.LocalAudioTrack.create_audio_track(
-                "microphone",
-                self.audio_source
-            )
-            
-            logger.info("🎤 Created LiveKit audio track")
-            
-            # Publish the track
-            options = rtc.TrackPublishOptions()
-            options.source = rtc.TrackSource.SOURCE_MICROPHONE
+            # Start every call on the configured profile
+            self.publish_controller.reset()
+            profile = self.publish_controller.profile
             
-            publication = await self.room.local_participant.publish_track(
-                self.local_audio_track,
-                options
-            )
+            publication = await self._publish_with_profile(profile)
             
             logger.info("🎤 Audio track published to LiveKit room")
             
@@ -174,6 +191,58 @@ class LiveKitClient:
             logger.error(f"❌ Failed to publish audio track: {e}")
             raise
     
+    def _build_publish_options(self, profile: PublishProfile):
+        """Build track publish options for a publishing profile"""
+        options = rtc.TrackPublishOptions()
+        options.source = rtc.TrackSource.SOURCE_MICROPHONE
+        options.dtx = profile.dtx
+        options.red = profile.red
+        options.audio_encoding.max_bitrate = profile.max_bitrate
+        return options
+    
+    async def _publish_with_profile(self, profile: PublishProfile):
+        """Create a source and track for the profile and publish it"""
+        channels = 2 if profile.stereo and self.audio_manager.CHANNELS == 2 else 1
+        
+        # Create audio source with Pi's sample rate and the profile's channel count
+        audio_source = rtc.AudioSource(
+            sample_rate=self.audio_manager.SAMPLE_RATE,
+            num_channels=channels
+        )
+        
+        # Create audio track from source
+        audio_track = rtc.LocalAudioTrack.create_audio_track("microphone", audio_source)
+        logger.info(f"🎤 Created LiveKit audio track (profile {profile.name}, {channels}ch, "
+                    f"{profile.max_bitrate // 1000}kbps, dtx={profile.dtx}, red={profile.red})")
+        
+        publication = await self.room.local_participant.publish_track(
+            audio_track,
+            self._build_publish_options(profile)
+        )
+        
+        self.audio_source = audio_source
+        self.local_audio_track = audio_track
+        self._publish_target = (audio_source, channels)
+        return publication
+    
+    async def apply_publish_profile(self, profile: PublishProfile):
+        """Republish the microphone track with a different profile mid-call"""
+        try:
+            if not self.room or not self.connected or not self.local_audio_track:
+                return
+            
+            old_track = self.local_audio_track
+            
+            # Publish the new track first so the capture callback switches over
+            # with the shortest possible gap, then drop the old one
+            await self._publish_with_profile(profile)
+            await self.room.local_participant.unpublish_track(old_track.sid)
+            
+            logger.info(f"🎤 Audio republished with profile {profile.name}")
+            
+        except Exception as e:
+            logger.error(f"❌ Failed to apply publish profile {profile.name}: {e}")
+    
     async def _start_audio_capture(self, audio_manager):
         """Start capturing audio from Pi and feeding to LiveKit"""
         try:
@@ -181,62 +250,56 @@ class LiveKitClient:
             
             # Add frame counter for debugging
             self.frame_count = 0
+            hot_log.reset()
             
             def audio_callback(audio_data):
                 """Callback to send audio data to LiveKit"""
                 try:
                     self.frame_count += 1
                     
-                    if self.audio_source and len(audio_data) > 0:
-                        # Log first few frames for debugging
-                        if self.frame_count <= 5:
-                            logger.info(f"🎤 Audio frame {self.frame_count}: {len(audio_data)} samples, type: {type(audio_data)}")
-                        elif self.frame_count == 50:
-                            logger.info(f"🎤 Audio streaming: {self.frame_count} frames sent so far")
+                    target = self._publish_target
+                    if target and len(audio_data) > 0:
+                        audio_source, channels = target
+                        hot_log.info("capture_frame", "🎤 Audio frame %d: %d samples",
+                                     self.frame_count, len(audio_data))
                         
                         # Convert numpy array to the format LiveKit expects
-                        import numpy as np
                         if isinstance(audio_data, np.ndarray):
                             # Apply gain reduction to prevent clipping (reduce volume by 75%)
-                            audio_float = audio_data.astype(np.float32) * 0.25
+                            audio_float = audio_data.astype(np.float32) * audio_manager.CAPTURE_GAIN
                             # Convert to int16 PCM data
                             audio_pcm = audio_float.astype(np.int16)
                             
-                            # Add to mixed call recording if active
-                            if hasattr(audio_manager, 'add_microphone_to_recording'):
-                                audio_manager.add_microphone_to_recording(audio_pcm)
-                            
-                            # Check for silence (all zeros)
-                            if self.frame_count <= 5:
-                                max_amplitude = np.max(np.abs(audio_pcm))
-                                logger.info(f"🎤 Frame {self.frame_count} max amplitude: {max_amplitude} (after gain reduction)")
+                            # Downmix for mono publishing profiles
+                            if channels == 1 and audio_manager.CHANNELS == 2:
+                                publish_pcm = audio_float.reshape(-1, 2).mean(axis=1).astype(np.int16)
+                            else:
+                                publish_pcm = audio_pcm
                             
                             # Create AudioFrame and send to LiveKit
                             frame = rtc.AudioFrame(
-                                data=audio_pcm.tobytes(),
+                                data=publish_pcm.tobytes(),
                                 sample_rate=audio_manager.SAMPLE_RATE,
-                                num_channels=audio_manager.CHANNELS,
-                                samples_per_channel=len(audio_pcm) // audio_manager.CHANNELS
+                                num_channels=channels,
+                                samples_per_channel=len(publish_pcm) // channels
                             )
                             
                             # Send frame to LiveKit using main event loop
                             if self.main_loop and not self.main_loop.is_closed():
                                 try:
                                     # Schedule in the main event loop
-                                    future = asyncio.run_coroutine_threadsafe(
-                                        self.audio_source.capture_frame(frame), self.main_loop
+                                    asyncio.run_coroutine_threadsafe(
+                                        audio_source.capture_frame(frame), self.main_loop
                                     )
-                                    # Log success for first few frames
-                                    if self.frame_count <= 3:
-                                        logger.info(f"🎤 Frame {self.frame_count} sent to LiveKit successfully")
                                 except Exception as e:
-                                    if self.frame_count <= 5:
-                                        logger.error(f"❌ Failed to send frame {self.frame_count}: {e}")
+                                    hot_log.error("capture_send_error", "❌ Failed to send frame %d: %s",
+                                                  self.frame_count, e)
                             
                 except Exception as e:
                     # Don't spam logs for threading issues
-                    if "event loop" not in str(e) and self.frame_count <= 5:
-                        logger.error(f"❌ Audio callback error frame {self.frame_count}: {e}")
+                    if "event loop" not in str(e):
+                        hot_log.error("capture_error", "❌ Audio callback error frame %d: %s",
+                                      self.frame_count, e)
             
             # Start recording with our callback
             await audio_manager.start_recording(audio_callback)
@@ -254,6 +317,7 @@ class LiveKitClient:
                     self.local_audio_track.sid
                 )
                 self.local_audio_track = None
+                self._publish_target = None
                 logger.info("🔇 Audio track unpublished")
                 
         except Exception as e:
@@ -338,22 +402,44 @@ class LiveKitClient:
             if self.on_audio_received:
                 asyncio.create_task(self._safe_callback(self.on_audio_received, track, participant))
     
+    def _get_mixer(self) -> AudioMixer:
+        """Get the playback mixer, creating it for the audio manager's format"""
+        if self.mixer is None:
+            self.mixer = AudioMixer(
+                channels=self.audio_manager.CHANNELS,
+                capacity_frames=self.audio_manager.SAMPLE_RATE
+            )
+            self.concealer = PacketLossConcealer(
+                sample_rate=self.audio_manager.SAMPLE_RATE,
+                channels=self.audio_manager.CHANNELS
+            )
+        return self.mixer
+    
     async def _process_incoming_audio(self, track, participant):
-        """Process incoming audio track and send to speakers"""
+        """Process incoming audio track and feed it to the playback mixer"""
+        input_id = track.sid
         try:
             logger.info(f"🔊 Starting audio processing from {participant.identity}")
             
-            # Create audio stream to read frames from the track
-            audio_stream = rtc.AudioStream(track)
+            if not getattr(self, 'audio_manager', None):
+                logger.warning("⚠️ No audio manager available for incoming audio")
+                return
+            
+            # Create audio stream in the device format (the SDK resamples/remixes)
+            audio_stream = rtc.AudioStream(
+                track,
+                sample_rate=self.audio_manager.SAMPLE_RATE,
+                num_channels=self.audio_manager.CHANNELS
+            )
             frame_count = 0
             
-            # Initialize playback buffer as instance variable
-            if not hasattr(self, 'playback_buffer'):
-                self.playback_buffer = []
+            # Each remote track gets its own mixer input
+            mixer = self._get_mixer()
+            if not mixer.add_input(input_id):
+                return
             
             # Start audio playback if not already active
-            if hasattr(self, 'audio_manager') and self.audio_manager:
-                await self._start_audio_playback()
+            await self._start_audio_playback()
             
             async for audio_frame_event in audio_stream:
                 frame_count += 1
@@ -361,41 +447,22 @@ class LiveKitClient:
                 # Extract the actual AudioFrame from the event
                 audio_frame = audio_frame_event.frame
                 
-                # Log first few frames for debugging
-                if frame_count <= 3:
-                    logger.info(f"🔊 Received audio frame {frame_count}: {audio_frame.samples_per_channel} samples")
-                elif frame_count == 50:
-                    logger.info(f"🔊 Audio playback: {frame_count} frames received so far")
+                hot_log.info("receive_frame", "🔊 Received audio frame %d: %d samples",
+                             frame_count, audio_frame.samples_per_channel)
                 
-                # Convert LiveKit audio frame to numpy array for playback
                 try:
-                    import numpy as np
-                    
-                    # Extract PCM data from LiveKit AudioFrame
-                    pcm_data = audio_frame.data
-                    
-                    # Convert bytes to numpy array (int16)
-                    audio_array = np.frombuffer(pcm_data, dtype=np.int16)
-                    
-                    # Add to playback buffer (limit buffer size to prevent memory issues)
-                    if len(self.playback_buffer) < 50:  # Max ~1 second of audio
-                        self.playback_buffer.append(audio_array.tobytes())
-                    
-                    # Add to mixed call recording if active
-                    if hasattr(self, 'audio_manager') and hasattr(self.audio_manager, 'add_incoming_to_recording'):
-                        self.audio_manager.add_incoming_to_recording(audio_array.tobytes())
-                    
-                    # Log audio level for first few frames
-                    if frame_count <= 3:
-                        max_amplitude = np.max(np.abs(audio_array))
-                        logger.info(f"🔊 Frame {frame_count} max amplitude: {max_amplitude}")
+                    # Convert LiveKit PCM data to an int16 array and hand it to the mixer
+                    audio_array = np.frombuffer(audio_frame.data, dtype=np.int16)
+                    mixer.push(input_id, audio_array)
                 
                 except Exception as e:
-                    if frame_count <= 5:
-                        logger.error(f"❌ Failed to process audio frame {frame_count}: {e}")
+                    hot_log.error("receive_error", "❌ Failed to process audio frame %d: %s", frame_count, e)
                 
         except Exception as e:
             logger.error(f"❌ Failed to process incoming audio from {participant.identity}: {e}")
+        finally:
+            if self.mixer:
+                self.mixer.remove_input(input_id)
     
     async def _start_audio_playback(self):
         """Start audio playback using the audio manager"""
@@ -405,26 +472,46 @@ class LiveKitClient:
                 logger.warning("⚠️ No audio manager available for playback")
                 return
             
-            # Check if playback is already active
-            if getattr(self.audio_manager, 'playing', False):
+            # Check if playback is already active (a prompt-only stream gets taken over)
+            if getattr(self.audio_manager, 'playing', False) and not self.audio_manager.prompt_stream_only:
                 logger.info("🔊 Playback already active")
                 return
             
+            audio_manager = self.audio_manager
+            flight_recorder = audio_manager.flight_recorder
+            mixer = self._get_mixer()
+            concealer = self.concealer
+            concealer.reset()
+            self.playback_chunks_played = 0
+            
             def playback_callback(in_data, frame_count, time_info, status):
-                """Callback to provide audio data for playback"""
+                """Callback to mix all remote inputs into the speaker output"""
+                started = time.monotonic()
+                depth = mixer.buffered_frames() // max(frame_count, 1)
                 try:
-                    if hasattr(self, 'playback_buffer') and self.playback_buffer:
-                        # Get audio data from buffer
-                        audio_data = self.playback_buffer.pop(0)
-                        return (audio_data, pyaudio.paContinue)
-                    else:
-                        # Return silence if no data available
-                        silence = b'\x00' * (frame_count * self.audio_manager.CHANNELS * 2)
-                        return (silence, pyaudio.paContinue)
+                    mixed, active_inputs = mixer.mix(frame_count)
+                    if active_inputs:
+                        self.playback_chunks_played += 1
+                    
+                    # Only an underrun once remote audio has started flowing
+                    if self.playback_chunks_played and mixer.last_mix_frames < frame_count:
+                        status |= FLAG_BUFFER_UNDERRUN
+                        if mixer.has_inputs():
+                            status |= FLAG_CONCEALED
+                    
+                    # Fill gaps instead of playing hard silence
+                    if self.playback_chunks_played and mixer.has_inputs():
+                        mixed = concealer.process(mixed, mixer.last_mix_frames)
+                    audio_data = mixed.tobytes()
+                    
+                    # Publish what was actually played for the recorder and other taps
+                    audio_manager.incoming_bus.write(mixed)
                 except Exception as e:
-                    logger.error(f"❌ Playback callback error: {e}")
-                    silence = b'\x00' * (frame_count * self.audio_manager.CHANNELS * 2)
-                    return (silence, pyaudio.paContinue)
+                    hot_log.error("playback_error", "❌ Playback callback error: %s", e)
+                    audio_data = b'\x00' * (frame_count * audio_manager.CHANNELS * 2)
+                
+                flight_recorder.record(KIND_PLAYBACK, started, time_info, status, frame_count, depth)
+                return (audio_data, pyaudio.paContinue)
             
             # Start playback with callback
             await self.audio_manager.start_playback(playback_callback)
@@ -440,10 +527,9 @@ class LiveKitClient:
         if track.kind == rtc.TrackKind.KIND_AUDIO:
             self.remote_audio_track = None
             
-            # Clear playback buffer
-            if hasattr(self, 'playback_buffer'):
-                self.playback_buffer.clear()
-                logger.info("🔊 Playback buffer cleared")
+            # Release this track's mixer input
+            if self.mixer:
+                self.mixer.remove_input(track.sid)
     
     async def _safe_callback(self, callback, *args):
         """Safely execute callback function"""
@@ -461,9 +547,9 @@ class LiveKitClient:
             await self.unpublish_audio_track()
             await self.leave_room()
             
-            # Clear playback buffer
-            if hasattr(self, 'playback_buffer'):
-                self.playback_buffer.clear()
+            # Drop all mixer inputs
+            if self.mixer:
+                self.mixer.reset()
             
             self.room = None
             self.connected = False
@@ -0,0 +1,304 @@
+"""
+Network Quality Stats for EmmaPhone2 Pi
+
+Periodically pulls WebRTC statistics for the published and subscribed audio
+tracks from the LiveKit room and keeps a bounded, downsampled time series
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, asdict, fields
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class NetworkSample:
+    """One network quality sample (rates are over the sample interval)"""
+    timestamp: float
+    rtt_ms: Optional[float] = None
+    jitter_ms: Optional[float] = None
+    inbound_loss_pct: Optional[float] = None
+    outbound_loss_pct: Optional[float] = None
+    inbound_kbps: Optional[float] = None
+    outbound_kbps: Optional[float] = None
+    concealed_pct: Optional[float] = None
+    concealment_events: int = 0
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+def _mean(values: List[float]) -> Optional[float]:
+    return round(sum(values) / len(values), 2) if values else None
+
+def _merge_samples(a: NetworkSample, b: NetworkSample,
+                   weight_a: int = 1, weight_b: int = 1) -> NetworkSample:
+    """Weighted average of two adjacent samples (used for downsampling)"""
+    merged = NetworkSample(timestamp=a.timestamp)
+
+    for field in fields(NetworkSample):
+        if field.name == "timestamp":
+            continue
+        value_a, value_b = getattr(a, field.name), getattr(b, field.name)
+        if field.name == "concealment_events":
+            merged.concealment_events = value_a + value_b
+        elif value_a is None or value_b is None:
+            setattr(merged, field.name, value_a if value_b is None else value_b)
+        else:
+            setattr(merged, field.name,
+                    round((value_a * weight_a + value_b * weight_b) / (weight_a + weight_b), 2))
+
+    return merged
+
+class NetworkStatsCollector:
+    """Collects RTT, jitter, loss, bitrate and concealment stats during a call"""
+
+    def __init__(self, livekit_client, interval: float = 2.0, max_samples: int = 120):
+        self.livekit_client = livekit_client
+        self.interval = interval
+        self.max_samples = max_samples
+
+        # Downsampled series: once full, adjacent samples are merged and the
+        # number of raw samples folded into each entry (stride) doubles
+        self.samples: List[NetworkSample] = []
+        self.stride = 1
+        self._pending: Optional[NetworkSample] = None
+        self._pending_count = 0
+
+        self.latest: Optional[NetworkSample] = None
+        self.peaks: Dict[str, float] = {}
+        self.started_at = None
+        self.task = None
+        self.running = False
+
+        # Called with each new raw NetworkSample (e.g. by the publish controller)
+        self.on_sample = None
+
+        # Previous cumulative counters for delta computation
+        self._previous: Dict[str, float] = {}
+        self._first_counters: Dict[str, float] = {}
+        self._last_counters: Dict[str, float] = {}
+
+    async def start(self):
+        """Start collecting (resets the series for a new call)"""
+        if self.running:
+            return
+
+        self.samples = []
+        self.stride = 1
+        self._pending = None
+        self._pending_count = 0
+        self.latest = None
+        self.peaks = {}
+        self._previous = {}
+        self._first_counters = {}
+        self._last_counters = {}
+        self.started_at = time.time()
+        self.running = True
+
+        self.task = asyncio.create_task(self._collect_loop())
+        logger.info(f"📶 Network stats collection started (every {self.interval}s)")
+
+    async def stop(self):
+        """Stop collecting; the series and summary remain available"""
+        if not self.running:
+            return
+
+        self.running = False
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+        logger.info("📶 Network stats collection stopped")
+
+    async def _collect_loop(self):
+        """Poll the room stats API at a fixed interval"""
+        while self.running:
+            await asyncio.sleep(self.interval)
+
+            room = self.livekit_client.room
+            if not room or not self.livekit_client.connected:
+                continue
+
+            try:
+                stats = await room.get_rtc_stats()
+                sample = self._build_sample(stats.publisher_stats, stats.subscriber_stats)
+                self._add_sample(sample)
+            except Exception as e:
+                logger.warning(f"⚠️ Failed to collect network stats: {e}")
+                continue
+
+            if self.on_sample:
+                try:
+                    self.on_sample(sample)
+                except Exception as e:
+                    logger.error(f"❌ Network sample callback error: {e}")
+
+    def _parse_counters(self, publisher_stats, subscriber_stats) -> Dict[str, float]:
+        """Extract cumulative counters and instantaneous values for audio streams"""
+        counters = {}
+
+        def add(key, value):
+            if value:
+                counters[key] = counters.get(key, 0) + value
+
+        for report in list(publisher_stats) + list(subscriber_stats):
+            kind = report.WhichOneof("stats")
+
+            if kind == "outbound_rtp":
+                if report.outbound_rtp.stream.kind != "audio":
+                    continue
+                add("bytes_sent", report.outbound_rtp.sent.bytes_sent)
+                add("packets_sent", report.outbound_rtp.sent.packets_sent)
+
+            elif kind == "remote_inbound_rtp":
+                if report.remote_inbound_rtp.stream.kind != "audio":
+                    continue
+                # What the remote peer reports about our published audio
+                add("remote_packets_lost", report.remote_inbound_rtp.received.packets_lost)
+                rtt = report.remote_inbound_rtp.remote_inbound.round_trip_time
+                if rtt:
+                    counters["rtt"] = rtt
+
+            elif kind == "inbound_rtp":
+                if report.inbound_rtp.stream.kind != "audio":
+                    continue
+                add("bytes_received", report.inbound_rtp.inbound.bytes_received)
+                add("packets_received", report.inbound_rtp.received.packets_received)
+                add("packets_lost", report.inbound_rtp.received.packets_lost)
+                add("concealed_samples", report.inbound_rtp.inbound.concealed_samples)
+                add("concealment_events", report.inbound_rtp.inbound.concealment_events)
+                add("total_samples_received", report.inbound_rtp.inbound.total_samples_received)
+                jitter = report.inbound_rtp.received.jitter
+                if jitter:
+                    counters["jitter"] = max(counters.get("jitter", 0.0), jitter)
+
+            elif kind == "candidate_pair":
+                pair = report.candidate_pair.candidate_pair
+                if pair.nominated and pair.current_round_trip_time and "rtt" not in counters:
+                    counters["rtt"] = pair.current_round_trip_time
+
+        return counters
+
+    def _build_sample(self, publisher_stats, subscriber_stats) -> NetworkSample:
+        """Turn a stats report into a sample using deltas since the previous poll"""
+        now = time.monotonic()
+        counters = self._parse_counters(publisher_stats, subscriber_stats)
+        previous = self._previous
+        elapsed = now - previous.get("_time", now)
+
+        def delta(key):
+            if key not in counters or key not in previous:
+                return None
+            return max(0.0, counters[key] - previous[key])
+
+        def loss_pct(lost_key, ok_key):
+            lost, ok = delta(lost_key), delta(ok_key)
+            if lost is None or ok is None or lost + ok <= 0:
+                return None
+            return round(100.0 * lost / (lost + ok), 2)
+
+        def kbps(key):
+            d = delta(key)
+            if d is None or elapsed <= 0:
+                return None
+            return round(d * 8 / elapsed / 1000.0, 1)
+
+        concealed_pct = None
+        concealed, total = delta("concealed_samples"), delta("total_samples_received")
+        if concealed is not None and total:
+            concealed_pct = round(100.0 * concealed / total, 2)
+
+        sample = NetworkSample(
+            timestamp=time.time(),
+            rtt_ms=round(counters["rtt"] * 1000.0, 1) if "rtt" in counters else None,
+            jitter_ms=round(counters["jitter"] * 1000.0, 1) if "jitter" in counters else None,
+            inbound_loss_pct=loss_pct("packets_lost", "packets_received"),
+            outbound_loss_pct=loss_pct("remote_packets_lost", "packets_sent"),
+            inbound_kbps=kbps("bytes_received"),
+            outbound_kbps=kbps("bytes_sent"),
+            concealed_pct=concealed_pct,
+            concealment_events=int(delta("concealment_events") or 0)
+        )
+
+        counters["_time"] = now
+        self._previous = counters
+        if not self._first_counters:
+            self._first_counters = dict(counters)
+        self._last_counters = counters
+        return sample
+
+    def _add_sample(self, sample: NetworkSample):
+        """Append a sample to the series, downsampling when it is full"""
+        self.latest = sample
+
+        # Peaks are tracked on raw samples since downsampling averages them away
+        for name in ("rtt_ms", "jitter_ms", "inbound_loss_pct", "outbound_loss_pct"):
+            value = getattr(sample, name)
+            if value is not None and value > self.peaks.get(name, float("-inf")):
+                self.peaks[name] = value
+
+        if self._pending is None:
+            self._pending = sample
+        else:
+            self._pending = _merge_samples(self._pending, sample, self._pending_count, 1)
+        self._pending_count += 1
+
+        if self._pending_count < self.stride:
+            return
+
+        self.samples.append(self._pending)
+        self._pending = None
+        self._pending_count = 0
+
+        if len(self.samples) >= self.max_samples:
+            self.samples = [
+                _merge_samples(self.samples[i], self.samples[i + 1]) if i + 1 < len(self.samples)
+                else self.samples[i]
+                for i in range(0, len(self.samples), 2)
+            ]
+            self.stride *= 2
+
+    def get_series(self) -> List[Dict]:
+        """Get the downsampled time series"""
+        return [sample.to_dict() for sample in self.samples]
+
+    def get_latest(self) -> Optional[Dict]:
+        """Get the most recent sample"""
+        return self.latest.to_dict() if self.latest else None
+
+    def get_summary(self) -> Dict:
+        """Summarize network quality over the whole collection period"""
+        samples = self.samples + ([self._pending] if self._pending else [])
+
+        def collect(name):
+            return [getattr(s, name) for s in samples if getattr(s, name) is not None]
+
+        first, last = self._first_counters, self._last_counters
+
+        def total_delta(key):
+            return max(0.0, last.get(key, 0) - first.get(key, 0))
+
+        lost, received = total_delta("packets_lost"), total_delta("packets_received")
+        remote_lost, sent = total_delta("remote_packets_lost"), total_delta("packets_sent")
+        concealed, total_samples = total_delta("concealed_samples"), total_delta("total_samples_received")
+
+        return {
+            "started_at": self.started_at,
+            "duration": round(time.time() - self.started_at, 1) if self.started_at else 0,
+            "samples": len(samples),
+            "rtt_ms_mean": _mean(collect("rtt_ms")),
+            "rtt_ms_max": self.peaks.get("rtt_ms"),
+            "jitter_ms_mean": _mean(collect("jitter_ms")),
+            "jitter_ms_max": self.peaks.get("jitter_ms"),
+            "inbound_loss_pct": round(100.0 * lost / (lost + received), 2) if lost + received else None,
+            "outbound_loss_pct": round(100.0 * remote_lost / (remote_lost + sent), 2) if remote_lost + sent else None,
+            "inbound_kbps_mean": _mean(collect("inbound_kbps")),
+            "outbound_kbps_mean": _mean(collect("outbound_kbps")),
+            "concealed_pct": round(100.0 * concealed / total_samples, 2) if total_samples else None,
+            "concealment_events": int(total_delta("concealment_events"))
+        }
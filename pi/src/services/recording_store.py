@@ -0,0 +1,249 @@
+"""
+Recording Store for EmmaPhone2 Pi
+
+Keeps call recordings in one directory with a small JSON index (call id,
+participants, duration, size, codec) and enforces size and age limits in
+the background
+"""
+import asyncio
+import json
+import logging
+import mmap
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from dsp.codecs import read_wav_info
+
+logger = logging.getLogger(__name__)
+
+class RecordingStore:
+    """Indexed call recordings with retention quotas"""
+
+    INDEX_FILE = "index.json"
+
+    def __init__(self,
+                 directory: Optional[str] = None,
+                 max_total_mb: float = 500.0,
+                 max_age_days: float = 30.0,
+                 retention_interval: float = 600.0):
+        if directory is None:
+            directory = Path.home() / ".emmaphone" / "recordings"
+        self.directory = Path(directory).expanduser()
+        self.index_path = self.directory / self.INDEX_FILE
+        self.max_total_bytes = int(max_total_mb * 1024 * 1024)
+        self.max_age = max_age_days * 86400
+        self.retention_interval = retention_interval
+
+        self.recordings: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self.task = None
+        self.running = False
+
+        # Called with the entry of each newly added recording (e.g. by the uploader)
+        self.on_recording_added = None
+
+    def load(self):
+        """Load the index and reconcile it with the files on disk"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        try:
+            if self.index_path.exists():
+                with open(self.index_path, "r") as f:
+                    entries = json.load(f).get("recordings", [])
+                self.recordings = {entry["id"]: entry for entry in entries}
+        except Exception as e:
+            logger.error(f"❌ Failed to load recording index, rebuilding: {e}")
+            self.recordings = {}
+
+        changed = False
+
+        # Drop entries whose files are gone
+        for recording_id in [rid for rid, entry in self.recordings.items()
+                             if not (self.directory / entry["filename"]).exists()]:
+            del self.recordings[recording_id]
+            changed = True
+
+        # Index stray recordings (e.g. written before a crash)
+        indexed = {entry["filename"] for entry in self.recordings.values()}
+        for path in self.directory.glob("*.wav"):
+            if path.name not in indexed:
+                entry = self._describe(path)
+                if entry:
+                    self.recordings[entry["id"]] = entry
+                    changed = True
+
+        if changed:
+            self._save()
+        logger.info(f"📼 Recording store: {len(self.recordings)} recordings in {self.directory}")
+
+    def _save(self):
+        """Write the index atomically"""
+        entries = sorted(self.recordings.values(), key=lambda e: e["created"])
+        temp_path = self.index_path.with_suffix(".tmp")
+        with open(temp_path, "w") as f:
+            json.dump({"recordings": entries}, f, indent=2)
+        os.replace(temp_path, self.index_path)
+
+    def _describe(self, path: Path, call_id: str = "", participants: Optional[List[str]] = None,
+                  started_at: Optional[float] = None) -> Optional[Dict]:
+        """Build an index entry from a recording file's header"""
+        try:
+            # Only the header pages are touched
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                info = read_wav_info(mapped)
+            stat = path.stat()
+            frames = info["frames"]
+            if frames is None:
+                # PCM: frames follow from the data size
+                frames = info["data_size"] // max(1, info["channels"] * info["bits"] // 8)
+
+            return {
+                "id": path.stem,
+                "filename": path.name,
+                "call_id": call_id,
+                "participants": participants or [],
+                "started_at": started_at,
+                "created": stat.st_mtime,
+                "duration": round(frames / info["sample_rate"], 2),
+                "size": stat.st_size,
+                "codec": info["codec"],
+                "channels": info["channels"],
+                "sample_rate": info["sample_rate"]
+            }
+        except Exception as e:
+            logger.warning(f"⚠️ Skipping unreadable recording {path.name}: {e}")
+            return None
+
+    def new_path(self, call_id: str = "") -> str:
+        """Get a fresh file path for a recording"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        safe_id = "".join(c if c.isalnum() or c in "-_" else "_" for c in str(call_id))[:40]
+        name = f"call_{timestamp}_{safe_id}" if safe_id else f"call_{timestamp}"
+        return str(self.directory / f"{name}.wav")
+
+    def add(self, path: str, call_id: str = "", participants: Optional[List[str]] = None,
+            started_at: Optional[float] = None) -> Optional[Dict]:
+        """Index a finished recording"""
+        entry = self._describe(Path(path), call_id, participants, started_at)
+        if not entry:
+            return None
+
+        with self._lock:
+            self.recordings[entry["id"]] = entry
+            self._save()
+
+        logger.info(f"📼 Stored recording {entry['id']} ({entry['duration']}s, {entry['size'] // 1024} KB)")
+        if self.on_recording_added:
+            try:
+                self.on_recording_added(entry)
+            except Exception as e:
+                logger.error(f"❌ Recording added callback error: {e}")
+        return entry
+
+    def list(self) -> List[Dict]:
+        """Get index entries, newest first"""
+        return sorted(self._entries(), key=lambda e: e["created"], reverse=True)
+
+    def get(self, recording_id: str) -> Optional[Dict]:
+        return self.recordings.get(recording_id)
+
+    def get_path(self, recording_id: str) -> Optional[Path]:
+        """Get the file path for a recording id (only ids in the index resolve)"""
+        entry = self.recordings.get(recording_id)
+        return self.directory / entry["filename"] if entry else None
+
+    def delete(self, recording_id: str) -> bool:
+        """Delete a recording and its index entry"""
+        with self._lock:
+            entry = self.recordings.pop(recording_id, None)
+            if not entry:
+                return False
+            try:
+                (self.directory / entry["filename"]).unlink()
+            except FileNotFoundError:
+                pass
+            self._save()
+        return True
+
+    def _entries(self) -> List[Dict]:
+        """Snapshot of the index (add() runs on the recording executor thread)"""
+        with self._lock:
+            return list(self.recordings.values())
+
+    def total_bytes(self) -> int:
+        return sum(entry["size"] for entry in self._entries())
+
+    def enforce_retention(self) -> int:
+        """Delete recordings past the age limit, then oldest first over the size quota
+
+        Returns the number of recordings deleted.
+        """
+        now = time.time()
+        oldest_first = sorted(self._entries(), key=lambda e: e["created"])
+        victims = []
+
+        if self.max_age > 0:
+            victims = [e for e in oldest_first if now - e["created"] > self.max_age]
+
+        if self.max_total_bytes > 0:
+            total = sum(e["size"] for e in oldest_first) - sum(e["size"] for e in victims)
+            for entry in oldest_first:
+                if total <= self.max_total_bytes:
+                    break
+                if entry not in victims:
+                    victims.append(entry)
+                    total -= entry["size"]
+
+        for entry in victims:
+            self.delete(entry["id"])
+
+        if victims:
+            logger.info(f"📼 Retention removed {len(victims)} recordings "
+                        f"({self.total_bytes() // 1024} KB kept)")
+        return len(victims)
+
+    async def start(self):
+        """Load the index and start background retention"""
+        if self.running:
+            return
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.load)
+        self.running = True
+        self.task = asyncio.create_task(self._retention_loop())
+
+    async def stop(self):
+        """Stop background retention"""
+        self.running = False
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def _retention_loop(self):
+        """Enforce retention now and then every retention_interval seconds"""
+        loop = asyncio.get_running_loop()
+        while self.running:
+            try:
+                await loop.run_in_executor(None, self.enforce_retention)
+            except Exception as e:
+                logger.error(f"❌ Recording retention failed: {e}")
+            await asyncio.sleep(self.retention_interval)
+
+    def get_status(self) -> Dict:
+        """Get store usage and limits"""
+        return {
+            "directory": str(self.directory),
+            "count": len(self.recordings),
+            "total_bytes": self.total_bytes(),
+            "max_total_bytes": self.max_total_bytes,
+            "max_age_days": round(self.max_age / 86400, 1)
+        }
@@ -0,0 +1,129 @@
+"""
+Request Cache for EmmaPhone2 Pi
+
+Single-flight TTL cache for read-only web client calls. The web UI, the CLI
+and the call manager can all ask for the same thing at once; concurrent
+callers for one key share a single in-flight request, and the result is
+kept for a TTL. Once it expires the old value is still served for a
+stale-while-revalidate window while one background request refreshes it,
+so a reader only waits on the network when nothing usable is cached.
+
+Entries are dropped explicitly with invalidate() when a Socket.IO event
+says the server-side data changed (see WebClientSocket.cache).
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from diagnostics.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class _Entry:
+    __slots__ = ("value", "fetched_at", "ttl", "stale_ttl")
+
+    def __init__(self, value: Any, ttl: float, stale_ttl: float):
+        self.value = value
+        self.fetched_at = time.monotonic()
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+
+class RequestCache:
+    """Coalesced, TTL-cached results keyed by resource"""
+
+    def __init__(self, ttl: float = 30.0, stale_ttl: float = 300.0):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries: Dict[str, _Entry] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+
+    async def get(self, key: str, fetch: Callable[[], Awaitable[Any]],
+                  ttl: Optional[float] = None, stale_ttl: Optional[float] = None,
+                  cacheable: Optional[Callable[[Any], bool]] = None) -> Any:
+        """Cached value for key, calling fetch() at most once at a time per key
+
+        cacheable(value) decides whether a result is stored (default: not None),
+        so failures are shared with concurrent callers but never cached.
+        """
+        entry = self._entries.get(key)
+        if entry:
+            age = time.monotonic() - entry.fetched_at
+            if age < entry.ttl:
+                self.hits += 1
+                metrics.increment("web_client.cache.hits")
+                return entry.value
+            if age < entry.ttl + entry.stale_ttl:
+                # Serve the old value now, refresh once in the background
+                self.stale_hits += 1
+                metrics.increment("web_client.cache.stale_hits")
+                self._start(key, fetch, ttl, stale_ttl, cacheable)
+                return entry.value
+
+        self.misses += 1
+        metrics.increment("web_client.cache.misses")
+        return await self._join(self._start(key, fetch, ttl, stale_ttl, cacheable))
+
+    async def coalesce(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fetch() unless the same key is already in flight, then share its result"""
+        return await self._join(self._start(key, fetch, None, None, lambda value: False))
+
+    def _start(self, key: str, fetch, ttl, stale_ttl, cacheable) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task:
+            self.coalesced += 1
+            metrics.increment("web_client.cache.coalesced")
+            return task
+
+        task = asyncio.create_task(self._fetch(key, fetch, ttl, stale_ttl, cacheable))
+        self._inflight[key] = task
+        task.add_done_callback(lambda done: self._finished(key, done))
+        return task
+
+    async def _fetch(self, key: str, fetch, ttl, stale_ttl, cacheable) -> Any:
+        value = await fetch()
+        # invalidate() removes the task from _inflight: a result fetched
+        # before the invalidating event must not be stored
+        if self._inflight.get(key) is asyncio.current_task():
+            if cacheable(value) if cacheable else value is not None:
+                self._entries[key] = _Entry(value,
+                                            self.ttl if ttl is None else ttl,
+                                            self.stale_ttl if stale_ttl is None else stale_ttl)
+        return value
+
+    def _finished(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled() and task.exception():
+            # Background refreshes have nobody awaiting them
+            logger.debug(f"Request for {key} failed: {task.exception()}")
+
+    @staticmethod
+    async def _join(task: asyncio.Task) -> Any:
+        # A caller that gives up must not cancel the request others are waiting on
+        return await asyncio.shield(task)
+
+    def invalidate(self, prefix: str = ""):
+        """Drop cached values (and forget in-flight requests) for keys starting with prefix"""
+        for key in [key for key in self._entries if key.startswith(prefix)]:
+            del self._entries[key]
+        for key in [key for key in self._inflight if key.startswith(prefix)]:
+            del self._inflight[key]
+        self.invalidations += 1
+
+    def get_stats(self) -> Dict:
+        now = time.monotonic()
+        return {
+            "entries": {key: round(now - entry.fetched_at, 1) for key, entry in self._entries.items()},
+            "in_flight": sorted(self._inflight),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "invalidations": self.invalidations
+        }
@@ -0,0 +1,323 @@
+"""
+Artifact Upload Queue for EmmaPhone2 Pi
+
+Uploads finished recordings and flight recorder dumps to a configurable
+HTTP endpoint in the background. Uploads are chunked and resumable, capped
+to a bandwidth budget, paused while a call is active, and the queue is
+persisted so it survives restarts.
+
+Protocol (see upload_receiver.py for a local stand-in server):
+    GET {url}/{upload_id}  -> 200 {"offset": n}, or 404 if nothing received yet
+    PUT {url}/{upload_id}  with Content-Range: bytes a-b/total and the chunk
+                           -> 200 {"offset": b + 1, "complete": bool}
+                           -> 409 {"offset": n} if the server has a different offset
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from diagnostics.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+def _file_digest(path: str) -> str:
+    """SHA-256 of a file, read in blocks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _read_chunk(path: str, offset: int, size: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return f.read(size)
+
+class UploadQueue:
+    """Persistent background queue of chunked, resumable uploads"""
+
+    def __init__(self,
+                 web_api,
+                 url: str,
+                 queue_file: Optional[str] = None,
+                 chunk_size_kb: int = 256,
+                 max_kbps: float = 256.0,
+                 token: str = "",
+                 is_busy: Optional[Callable[[], bool]] = None,
+                 max_completed: int = 20):
+        self.web_api = web_api
+        self.url = url.rstrip("/")
+        self.chunk_size = chunk_size_kb * 1024
+        self.max_kbps = max_kbps
+        self.token = token
+        self.is_busy = is_busy or (lambda: False)
+        self.max_completed = max_completed
+
+        if queue_file is None:
+            queue_file = Path.home() / ".emmaphone" / "upload_queue.json"
+        self.queue_file = Path(queue_file)
+
+        self.pending: List[Dict] = []
+        self.completed: List[Dict] = []
+        self.current: Optional[Dict] = None
+        self.paused = False
+
+        self.loop = None
+        self.task = None
+        self.running = False
+        self._wakeup = None
+
+    def _load(self):
+        try:
+            if self.queue_file.exists():
+                with open(self.queue_file, "r") as f:
+                    state = json.load(f)
+                self.pending = state.get("pending", [])
+                self.completed = state.get("completed", [])
+        except Exception as e:
+            logger.error(f"❌ Failed to load upload queue: {e}")
+
+        # Files removed since the last run (e.g. by retention) cannot be sent
+        missing = [item for item in self.pending if not os.path.exists(item["path"])]
+        for item in missing:
+            logger.info(f"📤 Dropping upload of missing file {item['path']}")
+            self.pending.remove(item)
+
+    def _save(self):
+        """Persist the queue atomically"""
+        try:
+            self.queue_file.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = self.queue_file.with_suffix(".tmp")
+            with open(temp_path, "w") as f:
+                json.dump({"pending": self.pending, "completed": self.completed}, f, indent=2)
+            os.replace(temp_path, self.queue_file)
+        except Exception as e:
+            logger.error(f"❌ Failed to save upload queue: {e}")
+
+    async def start(self):
+        """Load the persisted queue and start uploading"""
+        if self.running:
+            return
+
+        self.loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        await self.loop.run_in_executor(None, self._load)
+        self.running = True
+        self.task = asyncio.create_task(self._run())
+        logger.info(f"📤 Upload queue started ({len(self.pending)} pending) → {self.url}")
+
+    async def stop(self):
+        """Stop uploading; progress is kept for the next start"""
+        if not self.running:
+            return
+
+        self.running = False
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        self._save()
+        logger.info("📤 Upload queue stopped")
+
+    async def enqueue(self, path: str, kind: str, metadata: Optional[Dict] = None) -> Optional[Dict]:
+        """Add a finished file to the queue"""
+        try:
+            loop = asyncio.get_running_loop()
+            digest = await loop.run_in_executor(None, _file_digest, path)
+        except Exception as e:
+            logger.error(f"❌ Cannot queue {path} for upload: {e}")
+            return None
+
+        upload_id = digest[:32]
+        if any(item["id"] == upload_id for item in self.pending):
+            return None
+
+        item = {
+            "id": upload_id,
+            "path": str(path),
+            "filename": Path(path).name,
+            "kind": kind,
+            "size": os.path.getsize(path),
+            "sha256": digest,
+            "offset": 0,
+            "attempts": 0,
+            "added": time.time(),
+            "metadata": metadata or {}
+        }
+        self.pending.append(item)
+        self._save()
+        metrics.increment("uploads.queued")
+
+        if self._wakeup:
+            self._wakeup.set()
+        logger.info(f"📤 Queued {kind} upload: {item['filename']} ({item['size'] // 1024} KB)")
+        return item
+
+    def enqueue_threadsafe(self, path: str, kind: str, metadata: Optional[Dict] = None):
+        """Queue a file from a worker thread (e.g. an executor callback)"""
+        if self.loop and self.running:
+            self.loop.call_soon_threadsafe(
+                lambda: asyncio.ensure_future(self.enqueue(path, kind, metadata))
+            )
+
+    def _headers(self, item: Dict) -> Dict:
+        headers = {
+            "X-Upload-Filename": item["filename"],
+            "X-Upload-Kind": item["kind"],
+            "X-Upload-Sha256": item["sha256"],
+            "X-Upload-Metadata": json.dumps(item["metadata"])
+        }
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        return headers
+
+    async def _run(self):
+        """Upload queued items one at a time"""
+        while self.running:
+            if not self.pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            if not self.web_api or not self.web_api.ready:
+                await asyncio.sleep(5)
+                continue
+
+            item = self.pending[0]
+            self.current = item
+            try:
+                done = await self._upload(item)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                done = False
+                logger.warning(f"⚠️ Upload of {item['filename']} failed: {e}")
+
+            self.current = None
+            if done:
+                self.pending.remove(item)
+                item["completed"] = time.time()
+                self.completed = (self.completed + [item])[-self.max_completed:]
+                self._save()
+                metrics.increment("uploads.completed")
+                metrics.increment("uploads.bytes", item["size"])
+                logger.info(f"📤 Uploaded {item['filename']}")
+            elif item in self.pending:
+                # Back off with jitter, then retry (next run resumes at the saved offset)
+                item["attempts"] += 1
+                self._save()
+                metrics.increment("uploads.failures")
+                delay = min(600, 5 * 2 ** min(item["attempts"], 7)) * random.uniform(0.5, 1.0)
+                await asyncio.sleep(delay)
+
+    async def _wait_until_idle(self):
+        """Hold uploads while a call is active so they never compete for bandwidth"""
+        while self.running and self.is_busy():
+            if not self.paused:
+                self.paused = True
+                logger.info("📤 Uploads paused during call")
+            await asyncio.sleep(1.0)
+        if self.paused:
+            self.paused = False
+            logger.info("📤 Uploads resumed")
+
+    async def _upload(self, item: Dict) -> bool:
+        """Upload one item chunk by chunk, resuming from the server's offset"""
+        if not os.path.exists(item["path"]):
+            logger.warning(f"⚠️ Upload source vanished: {item['path']}")
+            self.pending.remove(item)
+            self._save()
+            return False
+        if os.path.getsize(item["path"]) != item["size"]:
+            # Rewritten or truncated since it was queued: its checksum no longer matches
+            logger.warning(f"⚠️ Upload source changed size, dropping: {item['path']}")
+            self.pending.remove(item)
+            self._save()
+            return False
+
+        target = f"{self.url}/{item['id']}"
+        loop = asyncio.get_running_loop()
+
+        # Ask the server how much it already has
+        response = await self.web_api.request("GET", target, endpoint="uploads", headers=self._headers(item))
+        if response.status == 200:
+            item["offset"] = int(response.json().get("offset", 0))
+        elif response.status == 404:
+            item["offset"] = 0
+        else:
+            raise RuntimeError(f"status check returned {response.status}")
+
+        size = item["size"]
+        rewound = False
+        while item["offset"] < size or size == 0:
+            await self._wait_until_idle()
+            if not self.running:
+                return False
+
+            offset = item["offset"]
+            chunk = await loop.run_in_executor(None, _read_chunk, item["path"], offset, self.chunk_size)
+            if not chunk and size:
+                # Let _run back off; the next attempt re-checks the file
+                raise RuntimeError(f"source ended at {offset} of {size} bytes")
+            end = offset + len(chunk) - 1
+            headers = self._headers(item)
+            headers["Content-Range"] = f"bytes {offset}-{end}/{size}" if chunk else f"bytes */{size}"
+            headers["Content-Type"] = "application/octet-stream"
+
+            started = time.monotonic()
+            response = await self.web_api.request("PUT", target, endpoint="uploads", data=chunk, headers=headers)
+            if response.status == 409:
+                # Out of sync with the server: continue from its offset. Starting
+                # over (e.g. checksum mismatch) is allowed once per attempt.
+                server_offset = int(response.json().get("offset", 0))
+                if server_offset <= offset:
+                    if rewound:
+                        raise RuntimeError(f"server rewound to {server_offset} again")
+                    rewound = True
+                item["offset"] = server_offset
+                continue
+            if response.status != 200:
+                raise RuntimeError(f"chunk upload returned {response.status}")
+            result = response.json()
+
+            new_offset = int(result.get("offset", end + 1))
+            if result.get("complete") or size == 0:
+                item["offset"] = new_offset
+                self._save()
+                return True
+            if new_offset <= offset:
+                raise RuntimeError(f"server did not advance past {offset}")
+            item["offset"] = new_offset
+            self._save()
+
+            # Bandwidth cap: spread chunks so the average rate stays under max_kbps
+            if self.max_kbps > 0:
+                budget = len(chunk) * 8 / (self.max_kbps * 1000.0)
+                remaining = budget - (time.monotonic() - started)
+                if remaining > 0:
+                    await asyncio.sleep(remaining)
+
+        return True
+
+    def get_status(self) -> Dict:
+        """Get queue state for diagnostics"""
+        current = self.current
+        return {
+            "url": self.url,
+            "running": self.running,
+            "paused": self.paused,
+            "pending": [{k: item[k] for k in ("id", "filename", "kind", "size", "offset", "attempts")}
+                        for item in self.pending],
+            "current": current["filename"] if current else None,
+            "completed": [{k: item.get(k) for k in ("filename", "kind", "size", "completed")}
+                          for item in self.completed]
+        }
@@ -0,0 +1,312 @@
+"""
+User Search Index for EmmaPhone2 Pi
+
+Local search over the users the Pi knows about: the contact directory plus
+every user a server search has returned. UserIndex keeps a sorted token
+list for word-prefix matches and a trigram index for substring and typo
+tolerant matches, both updated incrementally, so a query typed into the
+CLI or the web dialer is answered from memory in microseconds.
+
+UserSearch puts the index in front of the web client's /api/users/search.
+The server matches substrings and returns at most one page per request; a
+query whose results came back in full marks that substring as covered, and
+any longer query containing it is answered locally without a request.
+"""
+import bisect
+import logging
+import re
+import time
+import unicodedata
+from typing import Dict, Iterable, List, Optional
+
+from diagnostics.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# The web client rejects shorter search queries
+MIN_SERVER_QUERY = 2
+
+# Share of the query's trigrams a fuzzy match must contain
+TRIGRAM_THRESHOLD = 0.4
+
+# Rank of a match, best first
+RANK_EXACT = 0
+RANK_USERNAME_PREFIX = 1
+RANK_NAME_PREFIX = 2
+RANK_WORD_PREFIX = 3
+RANK_SUBSTRING = 4
+RANK_FUZZY = 5
+
+WORD = re.compile(r"\w+")
+
+def fold(text: str) -> str:
+    """Lowercase and strip accents, so 'Zoë' matches 'zoe'"""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+def _trigrams(text: str) -> set:
+    grams = set()
+    for word in WORD.findall(text):
+        padded = f" {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+class _Indexed:
+    __slots__ = ("user", "username", "name", "tokens", "trigrams")
+
+    def __init__(self, user: Dict):
+        self.user = user
+        self.username = fold(user.get("username", ""))
+        self.name = fold(user.get("display_name", ""))
+        self.tokens = set(WORD.findall(self.username)) | set(WORD.findall(self.name))
+        if self.username:
+            self.tokens.add(self.username)
+        self.trigrams = _trigrams(self.username) | _trigrams(self.name)
+
+class UserIndex:
+    """Prefix and trigram index over user names and display names"""
+
+    def __init__(self):
+        self._users: Dict[str, _Indexed] = {}
+        self._prefix: List[tuple] = []  # sorted (token, user key)
+        self._trigrams: Dict[str, set] = {}
+        self.version = 0
+
+    def __len__(self):
+        return len(self._users)
+
+    def update(self, users: Iterable[Dict]) -> int:
+        """Add or refresh users ({id, username, display_name}); returns how many were new"""
+        added = 0
+        tokens = []
+        for user in users:
+            if user.get("id") is None:
+                continue
+            key = str(user["id"])
+            current = self._users.get(key)
+            if current:
+                if (current.user.get("username"), current.user.get("display_name")) == \
+                        (user.get("username"), user.get("display_name")):
+                    current.user = user
+                    continue
+                self._unindex(key, current)
+            else:
+                added += 1
+            entry = _Indexed(user)
+            self._users[key] = entry
+            tokens.extend((token, key) for token in entry.tokens)
+            for gram in entry.trigrams:
+                self._trigrams.setdefault(gram, set()).add(key)
+            self.version += 1
+
+        if len(tokens) > 64:
+            # Initial load or a big server page: one sort beats many insertions
+            self._prefix.extend(tokens)
+            self._prefix.sort()
+        else:
+            for token in tokens:
+                bisect.insort(self._prefix, token)
+        return added
+
+    def remove(self, user_id) -> bool:
+        key = str(user_id)
+        entry = self._users.pop(key, None)
+        if not entry:
+            return False
+        self._unindex(key, entry)
+        self.version += 1
+        return True
+
+    def _unindex(self, key: str, entry: _Indexed):
+        for token in entry.tokens:
+            position = bisect.bisect_left(self._prefix, (token, key))
+            if position < len(self._prefix) and self._prefix[position] == (token, key):
+                del self._prefix[position]
+        for gram in entry.trigrams:
+            keys = self._trigrams.get(gram)
+            if keys:
+                keys.discard(key)
+                if not keys:
+                    del self._trigrams[gram]
+
+    def get(self, user_id) -> Optional[Dict]:
+        entry = self._users.get(str(user_id))
+        return entry.user if entry else None
+
+    def all_users(self, exclude=None) -> List[Dict]:
+        """Every indexed user, by display name"""
+        exclude = str(exclude) if exclude is not None else None
+        entries = sorted((entry for key, entry in self._users.items() if key != exclude),
+                         key=lambda entry: (entry.name, entry.username))
+        return [entry.user for entry in entries]
+
+    def _prefix_keys(self, prefix: str) -> set:
+        keys = set()
+        position = bisect.bisect_left(self._prefix, (prefix,))
+        while position < len(self._prefix) and self._prefix[position][0].startswith(prefix):
+            keys.add(self._prefix[position][1])
+            position += 1
+        return keys
+
+    def search(self, query: str, limit: int = 10, exclude=None) -> List[Dict]:
+        """Ranked matches for what the user has typed so far"""
+        query = fold(query).strip()
+        words = WORD.findall(query)
+        if not words:
+            return []
+        exclude = str(exclude) if exclude is not None else None
+
+        # Every query word must start one of the user's words
+        candidates = self._prefix_keys(words[0])
+        for word in words[1:]:
+            candidates &= self._prefix_keys(word)
+
+        scored = {}
+        for key in candidates:
+            entry = self._users[key]
+            if query in (entry.username, entry.name):
+                rank = RANK_EXACT
+            elif entry.username.startswith(query):
+                rank = RANK_USERNAME_PREFIX
+            elif entry.name.startswith(query):
+                rank = RANK_NAME_PREFIX
+            else:
+                rank = RANK_WORD_PREFIX
+            scored[key] = (rank, 0.0)
+
+        # Substrings and near misses, when the prefix matches did not fill the page
+        grams = _trigrams(query)
+        if len(scored) < limit and grams:
+            counts: Dict[str, int] = {}
+            for gram in grams:
+                for key in self._trigrams.get(gram, ()):
+                    counts[key] = counts.get(key, 0) + 1
+            for key, count in counts.items():
+                if key in scored:
+                    continue
+                similarity = count / len(grams)
+                entry = self._users[key]
+                if query in entry.username or query in entry.name:
+                    scored[key] = (RANK_SUBSTRING, -similarity)
+                elif similarity >= TRIGRAM_THRESHOLD:
+                    scored[key] = (RANK_FUZZY, -similarity)
+
+        scored.pop(exclude, None)
+        ranked = sorted(scored, key=lambda key: (scored[key], self._users[key].name, key))
+        return [self._users[key].user for key in ranked[:limit]]
+
+    def get_stats(self) -> Dict:
+        return {
+            "users": len(self._users),
+            "tokens": len(self._prefix),
+            "trigrams": len(self._trigrams),
+            "version": self.version
+        }
+
+class UserSearch:
+    """Local-first user search, filled from the contact directory and server results"""
+
+    def __init__(self, contacts, page_size: int = 20, max_pages: int = 5, coverage_ttl: float = 300.0):
+        self.contacts = contacts
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.coverage_ttl = coverage_ttl
+        self.index = UserIndex()
+        self._contacts_version = None
+        # Substrings whose complete server result set is in the index, and when
+        # (new accounts appear, so coverage expires)
+        self._covered: Dict[str, float] = {}
+        self.local_searches = 0
+        self.server_pages = 0
+
+    def _sync_contacts(self):
+        """Index contacts added since the last search (cheap when nothing changed)"""
+        if self._contacts_version == self.contacts.version:
+            return
+        self._contacts_version = self.contacts.version
+        users = []
+        for contact in self.contacts.list_contacts():
+            user_id = contact["user_id"]
+            known = self.index.get(user_id)
+            if known and not known.get("contact"):
+                continue  # Server data is richer than the contact entry
+            users.append({
+                "id": int(user_id) if str(user_id).isdigit() else user_id,
+                "username": contact.get("username") or "",
+                "display_name": contact["name"],
+                "contact": True
+            })
+        self.index.update(users)
+
+    def is_covered(self, query: str) -> bool:
+        """Whether the server could not return anything the index lacks"""
+        query = fold(query).strip()
+        now = time.monotonic()
+        return any(covered in query and now - fetched_at < self.coverage_ttl
+                   for covered, fetched_at in self._covered.items())
+
+    def invalidate(self):
+        """Forget coverage so the next searches ask the server again"""
+        self._covered.clear()
+
+    def search_local(self, query: str, limit: int = 10, exclude=None) -> List[Dict]:
+        """Ranked matches from the index only (no network)"""
+        self._sync_contacts()
+        self.local_searches += 1
+        return self.index.search(query, limit, exclude)
+
+    async def search(self, web_api, query: str, limit: int = 10, exclude=None) -> List[Dict]:
+        """Ranked matches, asking the server only for what the index cannot answer"""
+        results = self.search_local(query, limit, exclude)
+        if len(results) >= limit or self.is_covered(query) or len(query.strip()) < MIN_SERVER_QUERY:
+            return results
+        if web_api and web_api.authenticated:
+            await self.fetch(web_api, query)
+            results = self.index.search(query, limit, exclude)
+        return results
+
+    async def fetch(self, web_api, query: str = "") -> int:
+        """Page server results for query into the index; returns how many users were new"""
+        folded = fold(query).strip()
+        added = 0
+        for page in range(self.max_pages):
+            try:
+                response = await web_api.search_users(query, limit=self.page_size, offset=page * self.page_size)
+            except Exception as e:
+                logger.warning(f"⚠️ User search failed: {e}")
+                break
+            if response.status != 200:
+                # Older servers reject short or empty queries
+                logger.debug(f"User search for '{query}' returned {response.status}")
+                break
+            users = response.json() or []
+            self.server_pages += 1
+            metrics.increment("users.search_pages")
+            new = self.index.update(users)
+            added += new
+            if len(users) < self.page_size:
+                self._covered[folded] = time.monotonic()
+                break
+            if not new:
+                break  # Server ignores paging: every page is the first one
+        return added
+
+    async def refresh(self, web_api) -> List[Dict]:
+        """Everything the server will list, plus contacts"""
+        self._sync_contacts()
+        if web_api and web_api.authenticated:
+            await self.fetch(web_api, "")
+        return self.index.all_users()
+
+    def all_users(self, exclude=None) -> List[Dict]:
+        self._sync_contacts()
+        return self.index.all_users(exclude)
+
+    def get_stats(self) -> Dict:
+        stats = self.index.get_stats()
+        stats.update({
+            "covered_queries": sorted(self._covered),
+            "local_searches": self.local_searches,
+            "server_pages": self.server_pages
+        })
+        return stats
@@ -6,13 +6,22 @@ Handles user registration, authentication, and management with web client
 import asyncio
 import logging
 import secrets
+import time
 from typing import Optional, Dict, Any
 
+from .contact_directory import ContactDirectory
+from .user_index import UserSearch
 from .web_client import WebClientAPI
 from config.settings import Settings
 
 logger = logging.getLogger(__name__)
 
+# Log in again rather than reuse a saved session this close to expiry
+SESSION_EXPIRY_MARGIN = 300
+
+# Assumed lifetime when the server's cookie carries no expiry (the web client uses 24 h)
+DEFAULT_SESSION_LIFETIME = 24 * 3600
+
 class UserManager:
     """Manages Pi user registration and authentication"""
     
@@ -20,6 +29,12 @@ class UserManager:
         self.settings = settings
         self.web_api = None
         self.authenticated_user = None
+        
+        # Local, indexed contacts; synced from the web client once authenticated
+        self.contacts = ContactDirectory.for_settings(settings)
+        
+        # Local-first user search (dialer, speed dial setup)
+        self.user_search = UserSearch(self.contacts)
     
     async def initialize(self):
         """Initialize user manager"""
@@ -27,9 +42,13 @@ class UserManager:
             web_config = self.settings.get_web_client_config()
             self.web_api = WebClientAPI(
                 web_config.get("url", ""),
-                web_config.get("api_endpoint", "/api")
+                web_config.get("api_endpoint", "/api"),
+                **web_config.get("http", {})
             )
             await self.web_api.initialize()
+            
+            # An expired session shows up as a 401 on any request; log in again then
+            self.web_api.http.on_unauthorized = self._reauthenticate
             logger.info("✅ User manager initialized")
             
         except Exception as e:
@@ -38,6 +57,7 @@ class UserManager:
     
     async def close(self):
         """Close user manager"""
+        await self.contacts.stop()
         if self.web_api:
             await self.web_api.close()
     
@@ -57,46 +77,36 @@ class UserManager:
                 password = secrets.token_urlsafe(32)
             
             # Register with web client
-            register_data = {
-                "username": username,
-                "displayName": display_name,
-                "password": password,
-                "avatarColor": "#FF6B35"  # Orange for Pi users
-            }
-            
-            url = f"{self.web_api.base_url}{self.web_api.api_endpoint}/auth/register"
-            
-            async with self.web_api.session.post(url, json=register_data) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    user_data = result.get("user", {})
-                    user_id = user_data.get("id")
+            response = await self.web_api.register(username, display_name, password)
+            if response.status == 200:
+                result = response.json()
+                user_data = result.get("user", {})
+                user_id = user_data.get("id")
+                
+                if user_id:
+                    # Save user configuration
+                    self.settings.configure_user(username, display_name, password, str(user_id))
                     
-                    if user_id:
-                        # Save user configuration
-                        self.settings.configure_user(username, display_name, password, str(user_id))
-                        
-                        user_info = {
-                            "user_id": user_id,
-                            "username": username,
-                            "display_name": display_name,
-                            "password": password
-                        }
-                        
-                        logger.info(f"✅ New user registered: {username} (ID: {user_id})")
-                        return user_info
-                    else:
-                        logger.error("❌ Registration succeeded but no user ID received")
-                        return None
-                        
-                elif response.status == 409:
-                    logger.error(f"❌ Username '{username}' already exists")
-                    return None
+                    user_info = {
+                        "user_id": user_id,
+                        "username": username,
+                        "display_name": display_name,
+                        "password": password
+                    }
+                    
+                    logger.info(f"✅ New user registered: {username} (ID: {user_id})")
+                    return user_info
                 else:
-                    error_text = await response.text()
-                    logger.error(f"❌ Registration failed: {response.status} - {error_text}")
+                    logger.error("❌ Registration succeeded but no user ID received")
                     return None
                     
+            elif response.status == 409:
+                logger.error(f"❌ Username '{username}' already exists")
+                return None
+            else:
+                logger.error(f"❌ Registration failed: {response.status} - {response.text()}")
+                return None
+                
         except Exception as e:
             logger.error(f"❌ Failed to register user: {e}")
             return None
@@ -115,52 +125,103 @@ class UserManager:
                 return None
             
             # Login with web client
-            login_data = {
-                "username": username,
-                "password": password
-            }
-            
-            url = f"{self.web_api.base_url}{self.web_api.api_endpoint}/auth/login"
-            
-            async with self.web_api.session.post(url, json=login_data) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    user_data = result.get("user", {})
-                    user_id = user_data.get("id")
-                    display_name = user_data.get("displayName", username)
+            response = await self.web_api.login(username, password)
+            if response.status == 200:
+                result = response.json()
+                user_data = result.get("user", {})
+                user_id = user_data.get("id")
+                display_name = user_data.get("displayName", username)
+                
+                if user_id:
+                    # Update stored user ID if it changed
+                    stored_creds = self.settings.get_user_credentials()
+                    if stored_creds.get("user_id") != str(user_id):
+                        self.settings.set_user_id(str(user_id))
+                    
+                    self._set_authenticated(user_id, username, display_name)
+                    self._save_session()
                     
-                    if user_id:
-                        # Update stored user ID if it changed
-                        stored_creds = self.settings.get_user_credentials()
-                        if stored_creds.get("user_id") != str(user_id):
-                            self.settings.set_user_id(str(user_id))
-                        
-                        self.authenticated_user = {
-                            "user_id": user_id,
-                            "username": username,
-                            "display_name": display_name
-                        }
-                        
-                        # Update web API authentication state
-                        self.web_api.authenticated = True
-                        self.web_api.user_id = user_id
-                        self.web_api.username = username
-                        
-                        logger.info(f"✅ User authenticated: {username} (ID: {user_id})")
-                        return self.authenticated_user
-                    else:
-                        logger.error("❌ Authentication succeeded but no user ID received")
-                        return None
-                        
+                    logger.info(f"✅ User authenticated: {username} (ID: {user_id})")
+                    return self.authenticated_user
                 else:
-                    error_text = await response.text()
-                    logger.error(f"❌ Authentication failed: {response.status} - {error_text}")
+                    logger.error("❌ Authentication succeeded but no user ID received")
                     return None
                     
+            else:
+                logger.error(f"❌ Authentication failed: {response.status} - {response.text()}")
+                return None
+                
         except Exception as e:
             logger.error(f"❌ Failed to authenticate user: {e}")
             return None
     
+    def _set_authenticated(self, user_id, username: str, display_name: str):
+        self.authenticated_user = {
+            "user_id": user_id,
+            "username": username,
+            "display_name": display_name
+        }
+        
+        # Update web API authentication state
+        self.web_api.authenticated = True
+        self.web_api.user_id = user_id
+        self.web_api.username = username
+    
+    def _save_session(self):
+        """Persist the session cookie to auth.json so the next boot can skip login"""
+        cookies = self.web_api.http.export_cookies()
+        if not cookies:
+            return
+        expiries = [cookie["expires"] for cookie in cookies.values() if cookie["expires"]]
+        self.settings.save_auth({
+            "base_url": self.web_api.base_url,
+            "user_id": self.authenticated_user["user_id"],
+            "username": self.authenticated_user["username"],
+            "display_name": self.authenticated_user["display_name"],
+            "cookies": cookies,
+            "expires": min(expiries) if expiries else time.time() + DEFAULT_SESSION_LIFETIME,
+            "saved_at": time.time()
+        })
+    
+    def restore_session(self) -> Optional[Dict]:
+        """Reuse the session saved in auth.json (no network); None if there is no usable one"""
+        auth = self.settings.load_auth()
+        username = self.settings.get_user_credentials().get("username")
+        if (not auth.get("cookies") or not auth.get("user_id") or
+                auth.get("base_url") != self.web_api.base_url or auth.get("username") != username):
+            return None
+        
+        remaining = auth.get("expires", 0) - time.time()
+        if remaining < SESSION_EXPIRY_MARGIN:
+            logger.info("🔑 Saved session expired, logging in again")
+            return None
+        
+        self.web_api.http.import_cookies(auth["cookies"])
+        self._set_authenticated(auth["user_id"], username, auth.get("display_name", username))
+        logger.info(f"🔑 Reusing saved session for {username} (valid for {remaining / 3600:.1f} h)")
+        return self.authenticated_user
+    
+    async def start_session(self) -> Optional[Dict]:
+        """Initialize and authenticate, reusing a saved session when there is one
+        
+        A restored session is not checked here; if the server no longer
+        accepts it, the first request's 401 triggers a fresh login.
+        """
+        if not self.web_api:
+            await self.initialize()
+        return self.restore_session() or await self.authenticate_user()
+    
+    async def _reauthenticate(self) -> bool:
+        """Log in again after a 401 (concurrent 401s share one login)"""
+        user = await self.web_api.cache.coalesce("auth/relogin", self.authenticate_user)
+        if user is None:
+            self.settings.clear_auth()
+        return user is not None
+    
+    async def start_contact_sync(self, interval: float = 300.0):
+        """Keep the contact directory in sync with the web client"""
+        await self.contacts.start(self.web_api, interval)
+    
     def get_authenticated_user(self) -> Optional[Dict]:
         """Get currently authenticated user"""
         return self.authenticated_user
@@ -173,17 +234,13 @@ class UserManager:
         """Validate if username is available"""
         try:
             # Simple validation - check if user exists
-            check_data = {"username": username}
-            url = f"{self.web_api.base_url}{self.web_api.api_endpoint}/check-username"
-            
-            async with self.web_api.session.post(url, json=check_data) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    return result.get("available", False)
-                else:
-                    # If endpoint doesn't exist, assume available
-                    return True
-                    
+            response = await self.web_api.check_username(username)
+            if response.status == 200:
+                return response.json().get("available", False)
+            else:
+                # If endpoint doesn't exist, assume available
+                return True
+                
         except Exception as e:
             logger.warning(f"⚠️ Username validation failed: {e}")
             return True  # Assume available if we can't check
@@ -191,8 +248,10 @@ class UserManager:
     def clear_user_configuration(self):
         """Clear user configuration"""
         self.settings.clear_user_config()
+        self.contacts.clear()
         self.authenticated_user = None
         if self.web_api:
+            self.web_api.http.clear_cookies()
             self.web_api.authenticated = False
             self.web_api.user_id = None
             self.web_api.username = None
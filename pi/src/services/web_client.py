@@ -4,37 +4,103 @@ Web Client API Integration for EmmaPhone2 Pi
 Handles communication with the web client API for user-based calling
 """
 import asyncio
-import aiohttp
 import logging
-import json
+import random
+import time
 from typing import Dict, Optional, Any
 import socketio
 
+from diagnostics.metrics import metrics
+from .http_client import HttpClient, HttpResponse, LatencyHistogram
+from .request_cache import RequestCache
+
 logger = logging.getLogger(__name__)
 
+# Server events after which cached reads may be out of date, by cache key prefix
+INVALIDATING_EVENTS = {
+    "user-registered": "",      # (Re)connected: anything may have changed meanwhile
+    "incoming-call": "users/",  # The caller's presence changed
+}
+
+def _is_ok(response: HttpResponse) -> bool:
+    return response.status == 200
+
 class WebClientAPI:
     """Web client API integration for Pi device"""
     
-    def __init__(self, base_url: str, api_endpoint: str = "/api"):
+    def __init__(self, base_url: str, api_endpoint: str = "/api", **http_options):
         self.base_url = base_url.rstrip('/')
         self.api_endpoint = api_endpoint
-        self.session = None
+        self.http = HttpClient(self.base_url, api_endpoint, **http_options)
+        # Shared, coalesced results of read-only calls
+        self.cache = RequestCache()
         self.authenticated = False
         self.user_id = None
         self.username = None
+    
+    @property
+    def ready(self) -> bool:
+        """Whether the HTTP session is open"""
+        return self.http.session is not None
         
     async def initialize(self):
         """Initialize HTTP session"""
-        self.session = aiohttp.ClientSession()
+        await self.http.start()
         logger.info(f"✅ WebClient API initialized: {self.base_url}")
     
     async def close(self):
         """Close HTTP session"""
-        if self.session:
-            await self.session.close()
-            self.session = None
+        if self.ready:
+            await self.http.close()
             logger.info("🔌 WebClient API session closed")
     
+    async def request(self, method: str, path: str, **kwargs) -> HttpResponse:
+        """Send a request to an API path (see HttpClient.request)"""
+        return await self.http.request(method, path, **kwargs)
+    
+    def prewarm(self):
+        """Open a connection ahead of a likely call"""
+        self.http.prewarm()
+    
+    def keep_warm(self, seconds: float):
+        """Keep a connection open for the next few seconds"""
+        self.http.keep_warm(seconds)
+    
+    async def register(self, username: str, display_name: str, password: str,
+                       avatar_color: str = "#FF6B35") -> HttpResponse:
+        """Create a web client account"""
+        return await self.http.post("auth/register", json={
+            "username": username,
+            "displayName": display_name,
+            "password": password,
+            "avatarColor": avatar_color
+        })
+    
+    async def login(self, username: str, password: str) -> HttpResponse:
+        """Log in; the session cookie is kept by the pooled session"""
+        response = await self.http.post("auth/login", json={"username": username, "password": password})
+        if response.status == 200:
+            # Cached reads belonged to the previous session
+            self.cache.invalidate()
+        return response
+    
+    async def check_username(self, username: str) -> HttpResponse:
+        return await self.http.post("check-username", json={"username": username})
+    
+    async def get_me(self) -> HttpResponse:
+        """Current session's user (also a cheap authenticated round trip)"""
+        return await self.cache.get("auth/me", lambda: self.http.get("auth/me"),
+                                    ttl=10.0, stale_ttl=0.0, cacheable=_is_ok)
+    
+    async def search_users(self, query: str = "", limit: Optional[int] = None, offset: int = 0) -> HttpResponse:
+        """One page of users matching query (servers without paging ignore limit/offset)"""
+        query = query.strip()
+        params = {"q": query}
+        if limit:
+            params.update(limit=limit, offset=offset)
+        return await self.cache.get(f"users/search?q={query.lower()}&limit={limit}&offset={offset}",
+                                    lambda: self.http.get("users/search", params=params),
+                                    ttl=30.0, cacheable=_is_ok)
     
     async def initiate_call(self, target_user_id: str) -> Optional[Dict]:
         """Initiate a call to another user via web client API"""
@@ -47,17 +113,14 @@ class WebClientAPI:
                 "toUser": int(target_user_id)  # Ensure integer type for Map lookup
             }
             
-            url = f"{self.base_url}{self.api_endpoint}/initiate-call"
-            
-            async with self.session.post(url, json=call_data) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    logger.info(f"✅ Call initiated to user {target_user_id}")
-                    return result
-                else:
-                    error_text = await response.text()
-                    logger.error(f"❌ Failed to initiate call: {response.status} - {error_text}")
-                    return None
+            response = await self.http.post("initiate-call", json=call_data)
+            if response.status == 200:
+                result = response.json()
+                logger.info(f"✅ Call initiated to user {target_user_id}")
+                return result
+            else:
+                logger.error(f"❌ Failed to initiate call: {response.status} - {response.text()}")
+                return None
                     
         except Exception as e:
             logger.error(f"❌ Failed to initiate call: {e}")
@@ -70,54 +133,135 @@ class WebClientAPI:
                 logger.error("❌ Not authenticated with web client")
                 return None
             
-            url = f"{self.base_url}{self.api_endpoint}/contacts"
-            
-            async with self.session.get(url) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    logger.info(f"✅ Retrieved {len(result)} contacts")
-                    return result
-                else:
-                    error_text = await response.text()
-                    logger.error(f"❌ Failed to get contacts: {response.status} - {error_text}")
-                    return None
+            return await self.cache.get("contacts", self._fetch_contacts, ttl=60.0)
                     
         except Exception as e:
             logger.error(f"❌ Failed to get contacts: {e}")
             return None
+    
+    async def _fetch_contacts(self) -> Optional[list]:
+        response = await self.http.get("contacts")
+        if response.status == 200:
+            result = response.json()
+            logger.info(f"✅ Retrieved {len(result)} contacts")
+            return result
+        else:
+            logger.error(f"❌ Failed to get contacts: {response.status} - {response.text()}")
+            return None
+    
+    def get_stats(self) -> Dict:
+        """Connection pool, circuit breaker and per-endpoint latency"""
+        stats = self.http.get_stats()
+        stats["authenticated"] = self.authenticated
+        stats["cache"] = self.cache.get_stats()
+        return stats
 
 class WebClientSocket:
-    """Socket.IO client for real-time communication with web client"""
+    """Socket.IO client for real-time communication with web client
+    
+    Connects over a websocket straight away (no long-polling handshake and
+    upgrade) and reconnects on its own with full-jitter backoff. The server
+    learns the Pi is back from register-user; its 'user-registered' reply
+    marks the Pi reachable for calls again and is passed to on_reconnected
+    so call state can be reconciled with what the server knows.
+    """
     
-    def __init__(self, base_url: str, socket_endpoint: str = "/socket.io"):
+    def __init__(self, base_url: str, socket_endpoint: str = "/socket.io",
+                 connect_timeout: float = 5.0, reconnect_delay: float = 0.5,
+                 reconnect_delay_max: float = 15.0):
         self.base_url = base_url.rstrip('/')
         self.socket_endpoint = socket_endpoint
+        self.connect_timeout = connect_timeout
+        self.reconnect_delay = reconnect_delay
+        self.reconnect_delay_max = reconnect_delay_max
         self.sio = None
         self.connected = False
+        self.registered = False
         self.user_id = None
         self.on_incoming_call = None
         self.on_call_ended = None
+        self.on_reconnected = None
+        
+        # WebClientAPI.cache, invalidated by server events
+        self.cache = None
+        # WebClientAPI.http: a response from it during an outage means the network is back
+        self.http = None
+        
+        self._reconnect_task = None
+        self._closing = False
+        self.disconnected_at = None
+        self.connect_started_at = None
+        self.connects = 0
+        self.reconnects = 0
+        self.reconnect_attempts = 0
+        self.last_recovery_ms = None
+        self.recovery = LatencyHistogram()
+        
+    async def initialize(self, user_id: str) -> bool:
+        """Initialize Socket.IO connection
+        
+        Returns False if the server is not reachable yet; the connection is
+        then retried in the background.
+        """
+        self.user_id = user_id
+        self._closing = False
+        # Reconnection is ours (_reconnect_loop): the library's backoff is not
+        # fully jittered and does not cover a failed first connect
+        self.sio = socketio.AsyncClient(reconnection=False, request_timeout=self.connect_timeout)
+        
+        # Register event handlers
+        self.sio.on('connect', self._on_connect)
+        self.sio.on('disconnect', self._on_disconnect)
+        self.sio.on('incoming-call', self._on_incoming_call)
+        self.sio.on('call-ended', self._on_call_ended)
+        self.sio.on('user-registered', self._on_user_registered)
         
-    async def initialize(self, user_id: str):
-        """Initialize Socket.IO connection"""
         try:
-            self.user_id = user_id
-            self.sio = socketio.AsyncClient()
-            
-            # Register event handlers
-            self.sio.on('connect', self._on_connect)
-            self.sio.on('disconnect', self._on_disconnect)
-            self.sio.on('incoming-call', self._on_incoming_call)
-            self.sio.on('call-ended', self._on_call_ended)
-            
-            # Connect to server
-            await self.sio.connect(f"{self.base_url}{self.socket_endpoint}")
-            
+            await self._connect()
             logger.info(f"✅ Socket.IO connected: {self.base_url}")
-            
+            return True
         except Exception as e:
-            logger.error(f"❌ Failed to initialize Socket.IO: {e}")
-            raise
+            logger.warning(f"⚠️ Socket.IO connect failed ({e}), retrying in background")
+            self.disconnected_at = time.monotonic()
+            self._start_reconnect()
+            return False
+    
+    async def _connect(self):
+        self.connect_started_at = time.monotonic()
+        await self.sio.connect(
+            self.base_url,
+            transports=['websocket'],
+            socketio_path=self.socket_endpoint.strip('/'),
+            wait_timeout=self.connect_timeout
+        )
+    
+    def _start_reconnect(self):
+        if self._closing or (self._reconnect_task and not self._reconnect_task.done()):
+            return
+        self._reconnect_task = asyncio.create_task(self._reconnect_loop())
+    
+    def _network_back(self) -> bool:
+        """Whether the web client answered HTTP since the socket dropped"""
+        return bool(self.http and self.disconnected_at and self.http.last_response_at > self.disconnected_at)
+    
+    async def _reconnect_loop(self):
+        attempt = 0
+        while not self._closing and not self.connected:
+            # Full jitter, as for HTTP retries: after a server restart a fleet
+            # of phones must not reconnect in lockstep. Once HTTP gets through
+            # the network is back, so stop backing off.
+            ceiling = self.reconnect_delay if self._network_back() else \
+                min(self.reconnect_delay_max, self.reconnect_delay * 2 ** attempt)
+            await asyncio.sleep(random.uniform(0, ceiling))
+            if self._closing or self.connected:
+                break
+            attempt += 1
+            self.reconnect_attempts += 1
+            metrics.increment("web_client.socket.reconnect_attempts")
+            try:
+                await self._connect()
+            except Exception as e:
+                logger.debug(f"Socket.IO reconnect attempt {attempt} failed: {e}")
     
     async def register_user(self):
         """Register user with Socket.IO server"""
@@ -140,6 +284,10 @@ class WebClientSocket:
     async def disconnect(self):
         """Disconnect from Socket.IO server"""
         try:
+            self._closing = True
+            if self._reconnect_task:
+                self._reconnect_task.cancel()
+                self._reconnect_task = None
             if self.sio and self.connected:
                 await self.sio.disconnect()
                 logger.info("🔌 Socket.IO disconnected")
@@ -150,19 +298,66 @@ class WebClientSocket:
     def _on_connect(self):
         """Handle Socket.IO connection"""
         self.connected = True
+        self.connects += 1
         logger.info("🔗 Socket.IO connected")
         
         # Register user after connection
         asyncio.create_task(self.register_user())
     
-    def _on_disconnect(self):
+    def _on_disconnect(self, reason=None):
         """Handle Socket.IO disconnection"""
         self.connected = False
-        logger.info("🔌 Socket.IO disconnected")
+        self.registered = False
+        self.disconnected_at = time.monotonic()
+        metrics.increment("web_client.socket.disconnects")
+        logger.info(f"🔌 Socket.IO disconnected ({reason or 'unknown'})")
+        
+        self._start_reconnect()
+    
+    def _invalidate(self, event: str):
+        """Drop cached web client reads that this server event makes stale"""
+        prefix = INVALIDATING_EVENTS.get(event)
+        if self.cache and prefix is not None:
+            self.cache.invalidate(prefix)
+    
+    def _on_user_registered(self, data):
+        """Handle registration acknowledgement (after every connect)"""
+        self._invalidate('user-registered')
+        self.registered = True
+        now = time.monotonic()
+        metrics.set_gauge("web_client.socket.connect_ms", round((now - self.connect_started_at) * 1000))
+        
+        if self.disconnected_at is None:
+            return
+        
+        # Reachable for calls again. Measure from when the network came back:
+        # the successful attempt, or an earlier HTTP response if backoff made
+        # the socket lag behind.
+        recovered_at = self.connect_started_at
+        if self._network_back():
+            recovered_at = min(recovered_at, self.http.last_response_at)
+        self.last_recovery_ms = round((now - recovered_at) * 1000)
+        self.recovery.record(self.last_recovery_ms)
+        downtime = now - self.disconnected_at
+        self.disconnected_at = None
+        self.reconnects += 1
+        
+        metrics.increment("web_client.socket.reconnects")
+        metrics.set_gauge("web_client.socket.recovery_ms", self.last_recovery_ms)
+        metrics.record_event("socket_reconnected", {
+            "downtime_s": round(downtime, 1),
+            "recovery_ms": self.last_recovery_ms
+        })
+        logger.info(f"🔗 Socket.IO reachable again after {downtime:.1f}s offline "
+                    f"({self.last_recovery_ms} ms after the network recovered)")
+        
+        if self.on_reconnected:
+            asyncio.create_task(self._safe_callback(self.on_reconnected, data or {}))
     
     def _on_incoming_call(self, data):
         """Handle incoming call notification"""
         logger.info(f"📞 Incoming call from: {data.get('from_user')}")
+        self._invalidate('incoming-call')
         
         if self.on_incoming_call:
             asyncio.create_task(self._safe_callback(self.on_incoming_call, data))
@@ -208,4 +403,24 @@ class WebClientSocket:
             logger.info("✅ Call rejected")
             
         except Exception as e:
-            logger.error(f"❌ Failed to reject call: {e}")
\ No newline at end of file
+            logger.error(f"❌ Failed to reject call: {e}")
+    
+    def get_stats(self) -> Dict:
+        """Connection state and how quickly the Pi became reachable after drops"""
+        return {
+            "connected": self.connected,
+            "registered": self.registered,
+            "reconnecting": bool(self._reconnect_task and not self._reconnect_task.done()),
+            "offline_s": round(time.monotonic() - self.disconnected_at, 1) if self.disconnected_at else None,
+            "transport": self.sio.transport() if self.sio and self.connected else None,
+            "connects": self.connects,
+            "reconnects": self.reconnects,
+            "reconnect_attempts": self.reconnect_attempts,
+            "recovery": {
+                "last_ms": self.last_recovery_ms,
+                "p50_ms": self.recovery.get_percentile(50),
+                "p95_ms": self.recovery.get_percentile(95),
+                "max_ms": round(self.recovery.max_ms, 1),
+                "histogram": self.recovery.get_histogram()
+            }
+        }
@@ -0,0 +1,302 @@
+"""
+Static Assets and Page Cache for EmmaPhone2 Pi Web Interface
+
+StaticAssets precompresses the files under web/static once (gzip, plus
+brotli when the optional brotli module is installed) into a cache directory
+with a manifest, so later boots only re-hash files whose size or mtime
+changed. Each file gets a content hash used both as its strong ETag and as
+the ?v= version on its URL; a request carrying the current version can be
+cached by the browser for a year, anything else must revalidate.
+
+PageCache keeps rendered pages whose content depends only on settings (and
+the contact directory), keyed by the versions of what they read, together
+with a gzip copy and an ETag so repeat visits are a dictionary lookup or a
+304.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+from diagnostics.metrics import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Versioned URLs never change content, so browsers may keep them for a year
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# Content types worth compressing (images and fonts are already compressed)
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+
+# Preferred order when the client accepts several encodings
+ENCODINGS = ("br", "gzip")
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+def accepted_encodings(accept_encoding: Optional[str]) -> set:
+    """Content codings the client accepts (ignoring q=0)"""
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding and params.replace(" ", "") not in ("q=0", "q=0.0"):
+            accepted.add(coding.strip().lower())
+    return accepted
+
+def etag_matches(if_none_match: Optional[str], etags) -> bool:
+    """Whether an If-None-Match header matches any of the given ETags"""
+    if not if_none_match:
+        return False
+    candidates = {tag.strip() for tag in if_none_match.split(",")}
+    if "*" in candidates:
+        return True
+    # Weak comparison is what If-None-Match specifies
+    candidates = {tag[2:] if tag.startswith("W/") else tag for tag in candidates}
+    return any(etag in candidates for etag in etags)
+
+class Representation:
+    """One encoding of a response body"""
+
+    __slots__ = ("body", "encoding", "etag")
+
+    def __init__(self, body: bytes, encoding: Optional[str], etag: str):
+        self.body = body
+        self.encoding = encoding
+        self.etag = etag
+
+class Asset:
+    """A static file with its version and precompressed variants"""
+
+    def __init__(self, name: str, path: Path, version: str, content_type: str):
+        self.name = name
+        self.path = path
+        self.version = version
+        self.content_type = content_type
+        self.variants: Dict[Optional[str], Representation] = {}
+
+    @property
+    def etags(self):
+        return [variant.etag for variant in self.variants.values()]
+
+    def negotiate(self, accept_encoding: Optional[str]) -> Representation:
+        """Smallest representation the client can decode"""
+        accepted = accepted_encodings(accept_encoding)
+        for encoding in ENCODINGS:
+            if encoding in accepted and encoding in self.variants:
+                return self.variants[encoding]
+        return self.variants[None]
+
+class StaticAssets:
+    """Precompressed, content-versioned static files"""
+
+    def __init__(self, static_dir: Path, cache_dir: Path):
+        self.static_dir = Path(static_dir)
+        self.cache_dir = Path(cache_dir)
+        self.manifest_file = self.cache_dir / "manifest.json"
+        self.assets: Dict[str, Asset] = {}
+        self.compressed_files = 0
+
+    def build(self):
+        """Hash and precompress every static file, reusing the on-disk cache"""
+        manifest = self._load_manifest()
+        new_manifest = {}
+
+        for path in sorted(self.static_dir.rglob("*")):
+            if not path.is_file():
+                continue
+            name = path.relative_to(self.static_dir).as_posix()
+            try:
+                stat = path.stat()
+                entry = manifest.get(name)
+                if not entry or entry["size"] != stat.st_size or entry["mtime"] != stat.st_mtime:
+                    entry = {"size": stat.st_size, "mtime": stat.st_mtime,
+                             "sha256": hashlib.sha256(path.read_bytes()).hexdigest()}
+                new_manifest[name] = entry
+                self.assets[name] = self._load_asset(name, path, entry["sha256"])
+            except OSError as e:
+                logger.warning(f"⚠️ Could not prepare static asset {name}: {e}")
+
+        self._save_manifest(new_manifest)
+        logger.info(f"📦 Static assets ready: {len(self.assets)} files, "
+                    f"{self.compressed_files} compressed variants built"
+                    f"{'' if brotli else ' (brotli not installed, gzip only)'}")
+
+    def _load_asset(self, name: str, path: Path, sha256: str) -> Asset:
+        version = sha256[:12]
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        if content_type.startswith("text/"):
+            content_type += "; charset=utf-8"
+        asset = Asset(name, path, version, content_type)
+
+        body = path.read_bytes()
+        asset.variants[None] = Representation(body, None, f'"{version}"')
+        if not content_type.startswith(COMPRESSIBLE_TYPES):
+            return asset
+
+        for encoding in ENCODINGS:
+            compressed = self._compressed(name, version, encoding, body)
+            if compressed is not None and len(compressed) < len(body):
+                asset.variants[encoding] = Representation(compressed, encoding, f'"{version}-{encoding}"')
+        return asset
+
+    def _compressed(self, name: str, version: str, encoding: str, body: bytes) -> Optional[bytes]:
+        """Read a precompressed variant from the cache, building it on first use"""
+        if encoding == "br" and brotli is None:
+            return None
+        cached = self.cache_dir / version / (name + ENCODING_SUFFIXES[encoding])
+        try:
+            return cached.read_bytes()
+        except OSError:
+            pass
+
+        if encoding == "br":
+            compressed = brotli.compress(body, quality=11)
+        else:
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+
+        try:
+            cached.parent.mkdir(parents=True, exist_ok=True)
+            temp_file = cached.with_name(cached.name + ".tmp")
+            temp_file.write_bytes(compressed)
+            os.replace(temp_file, cached)
+        except OSError as e:
+            logger.warning(f"⚠️ Could not cache compressed {name}: {e}")
+        self.compressed_files += 1
+        return compressed
+
+    def _load_manifest(self) -> Dict:
+        try:
+            with open(self.manifest_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self, manifest: Dict):
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            temp_file = self.manifest_file.with_suffix(".tmp")
+            with open(temp_file, "w") as f:
+                json.dump(manifest, f, indent=2)
+            os.replace(temp_file, self.manifest_file)
+        except OSError as e:
+            logger.warning(f"⚠️ Could not save static asset manifest: {e}")
+
+    def version(self, name: str) -> Optional[str]:
+        asset = self.assets.get(name)
+        return asset.version if asset else None
+
+    def lookup(self, name: str, version: Optional[str], accept_encoding: Optional[str],
+               if_none_match: Optional[str]) -> Optional[Tuple[int, Optional[Representation], Dict]]:
+        """Resolve a static request to (status, representation or None for 304, headers)"""
+        asset = self.assets.get(name)
+        if asset is None:
+            return None
+
+        representation = asset.negotiate(accept_encoding)
+        headers = {
+            "ETag": representation.etag,
+            "Vary": "Accept-Encoding",
+            "Cache-Control": IMMUTABLE_CACHE_CONTROL if version == asset.version else REVALIDATE_CACHE_CONTROL,
+        }
+        if etag_matches(if_none_match, asset.etags):
+            metrics.increment("web.static.not_modified")
+            return 304, None, headers
+
+        headers["Content-Type"] = asset.content_type
+        if representation.encoding:
+            headers["Content-Encoding"] = representation.encoding
+        metrics.increment("web.static.bytes", len(representation.body))
+        return 200, representation, headers
+
+    def get_stats(self) -> Dict:
+        return {
+            "brotli": brotli is not None,
+            "files": {
+                name: {"version": asset.version,
+                       "bytes": {encoding or "identity": len(variant.body)
+                                 for encoding, variant in asset.variants.items()}}
+                for name, asset in self.assets.items()
+            }
+        }
+
+class CachedPage:
+    """A rendered page with its gzip variant"""
+
+    def __init__(self, html: str):
+        body = html.encode("utf-8")
+        etag = hashlib.sha256(body).hexdigest()[:16]
+        self.variants: Dict[Optional[str], Representation] = {
+            None: Representation(body, None, f'"{etag}"')
+        }
+        compressed = gzip.compress(body, compresslevel=6, mtime=0)
+        if len(compressed) < len(body):
+            self.variants["gzip"] = Representation(compressed, "gzip", f'"{etag}-gzip"')
+
+    @property
+    def etags(self):
+        return [variant.etag for variant in self.variants.values()]
+
+    def negotiate(self, accept_encoding: Optional[str]) -> Representation:
+        if "gzip" in self.variants and "gzip" in accepted_encodings(accept_encoding):
+            return self.variants["gzip"]
+        return self.variants[None]
+
+class PageCache:
+    """Rendered pages that depend only on settings, invalidated by version changes"""
+
+    def __init__(self):
+        self._pages: Dict[str, Tuple[tuple, CachedPage]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, version: tuple, render: Callable[[], str]) -> CachedPage:
+        """Cached page for key, re-rendered when the version of its inputs changed"""
+        with self._lock:
+            cached = self._pages.get(key)
+        if cached and cached[0] == version:
+            self.hits += 1
+            metrics.increment("web.page_cache.hits")
+            return cached[1]
+
+        self.misses += 1
+        metrics.increment("web.page_cache.misses")
+        page = CachedPage(render())
+        with self._lock:
+            self._pages[key] = (version, page)
+        return page
+
+    def respond(self, page: CachedPage, accept_encoding: Optional[str],
+                if_none_match: Optional[str]) -> Tuple[int, Optional[Representation], Dict]:
+        """Resolve a page request to (status, representation or None for 304, headers)"""
+        representation = page.negotiate(accept_encoding)
+        headers = {
+            "ETag": representation.etag,
+            "Vary": "Accept-Encoding",
+            # Settings can change at any time, so browsers always revalidate
+            "Cache-Control": REVALIDATE_CACHE_CONTROL,
+        }
+        if etag_matches(if_none_match, page.etags):
+            return 304, None, headers
+
+        headers["Content-Type"] = "text/html; charset=utf-8"
+        if representation.encoding:
+            headers["Content-Encoding"] = representation.encoding
+        metrics.increment("web.page_bytes", len(representation.body))
+        return 200, representation, headers
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+
+    def get_stats(self) -> Dict:
+        return {"pages": len(self._pages), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,735 @@
+"""
+EmmaPhone2 Pi Web Interface Server (asyncio)
+
+The same pages, JSON API and Socket.IO topics as web/server.py, served by
+aiohttp and python-socketio on the application's main event loop. Handlers
+await the call and audio managers directly instead of crossing threads with
+run_coroutine_threadsafe or spinning up throwaway event loops.
+
+Enabled with "web_server": {"server": "aiohttp"} in settings.
+"""
+import asyncio
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+
+import socketio
+from aiohttp import web
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+from config.settings import Settings
+from diagnostics import flight_recorder
+from diagnostics.metrics import metrics
+from dsp import codecs
+from web.base import BaseWebServer, STATUS_TOPICS, TEMPLATE_DIR, parse_byte_range
+
+logger = logging.getLogger(__name__)
+
+# Flash messages survive the redirect in a short-lived cookie
+FLASH_COOKIE = "emmaphone_flash"
+
+def _int_arg(request, name: str, default: int) -> int:
+    try:
+        return int(request.query.get(name, default))
+    except ValueError:
+        return default
+
+class AsyncPiWebServer(BaseWebServer):
+    """aiohttp web server for Pi management interface, running on the main loop"""
+
+    def __init__(self, settings: Settings, port: int = 8080):
+        self.sio = socketio.AsyncServer(async_mode='aiohttp', cors_allowed_origins='*')
+        super().__init__(settings, port, self.sio)
+
+        self.app = web.Application()
+        self.sio.attach(self.app)
+        self.templates = Environment(loader=FileSystemLoader(str(TEMPLATE_DIR)),
+                                     autoescape=select_autoescape(['html']))
+        self.runner = None
+        self._tasks = set()
+
+        self.setup_routes()
+        self.setup_socketio_events()
+
+    # Helpers
+
+    def _url_for(self, endpoint: str, **values) -> str:
+        """Flask-style url_for over the named aiohttp routes"""
+        if endpoint == 'static':
+            url = self.app.router['static'].url_for(filename=values['filename'])
+            version = self.assets.version(values['filename'])
+            return str(url.with_query(v=version) if version else url)
+        return str(self.app.router[endpoint].url_for())
+
+    def _respond(self, status: int, representation, headers) -> web.Response:
+        """Build a response from a cached page or asset lookup"""
+        if representation is None:
+            return web.Response(status=status, headers=headers)
+        return web.Response(body=representation.body, status=status, headers=headers)
+
+    def _page(self, request, template: str, **context) -> web.Response:
+        """Render a settings-only page through the page cache"""
+        # Flashed messages make the page one-off
+        if request.cookies.get(FLASH_COOKIE):
+            return self._render(request, template, **context)
+
+        endpoint = request.match_info.route.name
+        page = self.pages.get(endpoint, self.page_version(endpoint),
+                              lambda: self._render_html(request, template, [], **context))
+        return self._respond(*self.pages.respond(page,
+                                                  request.headers.get('Accept-Encoding'),
+                                                  request.headers.get('If-None-Match')))
+
+    def _render_html(self, request, template: str, messages, **context) -> str:
+        def get_flashed_messages(with_categories=False):
+            return messages if with_categories else [message for _, message in messages]
+
+        return self.templates.get_template(template).render(
+            request=SimpleNamespace(endpoint=request.match_info.route.name, host=request.host),
+            url_for=self._url_for,
+            get_flashed_messages=get_flashed_messages,
+            **context
+        )
+
+    def _render(self, request, template: str, **context) -> web.Response:
+        """Render a page with the globals the Flask templates expect"""
+        messages = []
+        raw_flashes = request.cookies.get(FLASH_COOKIE)
+        if raw_flashes:
+            try:
+                messages = [tuple(message) for message in json.loads(raw_flashes)]
+            except ValueError:
+                pass
+
+        html = self._render_html(request, template, messages, **context)
+        response = web.Response(text=html, content_type='text/html')
+        if raw_flashes:
+            response.del_cookie(FLASH_COOKIE)
+        return response
+
+    def _redirect(self, endpoint: str, *messages) -> web.Response:
+        """Redirect to a named page, flashing (category, message) pairs"""
+        response = web.Response(status=302, headers={'Location': self._url_for(endpoint)})
+        if messages:
+            response.set_cookie(FLASH_COOKIE, json.dumps(messages), httponly=True, samesite='Lax')
+        return response
+
+    def _spawn(self, coro):
+        """Run a long coroutine (call setup, file playback) without holding the request"""
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def setup_routes(self):
+        """Setup aiohttp routes (same paths and names as the Flask server)"""
+        routes = [
+            ('GET', '/', self.index, 'index'),
+            ('GET', '/setup', self.setup, 'setup'),
+            ('POST', '/setup/user', self.setup_user, 'setup_user'),
+            ('GET', '/contacts', self.contacts, 'contacts'),
+            ('POST', '/contacts/add', self.add_contact, 'add_contact'),
+            ('POST', '/contacts/remove', self.remove_contact, 'remove_contact'),
+            ('GET', '/status', self.status, 'status'),
+            ('GET', '/config', self.config, 'config'),
+            ('POST', '/config/save', self.save_config, 'save_config'),
+            ('GET', '/api/status', self.api_status, None),
+            ('POST', '/api/audio/test', self.api_audio_test, None),
+            ('GET', '/api/audio/level', self.api_audio_level, None),
+            ('POST', '/api/audio/record', self.api_start_recording, None),
+            ('GET', '/api/audio/recordings/latest', self.api_latest_recording, None),
+            ('POST', '/api/audio/recordings/latest/play', self.api_play_latest_recording, None),
+            ('GET', '/api/uploads', self.api_uploads, None),
+            ('GET', '/api/contacts', self.api_contacts, None),
+            ('GET', '/api/users/search', self.api_user_search, None),
+            ('GET', '/api/recordings', self.api_recordings, None),
+            ('GET', '/api/recordings/{recording_id}', self.api_recording, None),
+            ('DELETE', '/api/recordings/{recording_id}', self.api_recording, None),
+            ('GET', '/api/audio/bus', self.api_audio_bus, None),
+            ('GET', '/api/audio/sounds', self.api_audio_sounds, None),
+            ('POST', '/api/audio/sounds/{name}/play', self.api_play_sound, None),
+            ('POST', '/api/audio/sounds/stop', self.api_stop_sounds, None),
+            ('GET', '/api/audio/devices', self.api_audio_devices, None),
+            ('GET', '/api/audio/device', self.api_get_current_device, None),
+            ('POST', r'/api/audio/device/{device_index:\d+}', self.api_set_device, None),
+            ('GET', '/api/call/network', self.api_call_network, None),
+            ('POST', '/api/call/{user_id}', self.api_call, None),
+            ('POST', '/api/hangup', self.api_hangup, None),
+            ('GET', '/api/metrics', self.api_metrics, None),
+            ('GET', '/api/web/cache', self.api_web_cache, None),
+            ('GET', '/api/diagnostics/http', self.api_http_diagnostics, None),
+            ('GET', '/api/diagnostics/loop', self.api_loop_diagnostics, None),
+            ('POST', '/api/diagnostics/loop/reset', self.api_loop_diagnostics_reset, None),
+            ('GET', '/api/diagnostics/flight-recorder', self.api_flight_recorder, None),
+            ('POST', '/api/diagnostics/flight-recorder/dump', self.api_flight_recorder_dump, None),
+        ]
+        for method, path, handler, name in routes:
+            self.app.router.add_route(method, path, handler, name=name)
+        self.app.router.add_get('/static/{filename:.+}', self.static, name='static')
+
+    async def static(self, request):
+        """Precompressed static files with strong ETags"""
+        result = self.assets.lookup(request.match_info['filename'],
+                                    request.query.get('v'),
+                                    request.headers.get('Accept-Encoding'),
+                                    request.headers.get('If-None-Match'))
+        if result is None:
+            raise web.HTTPNotFound()
+        return self._respond(*result)
+
+    # Pages
+
+    async def index(self, request):
+        """Main dashboard"""
+        self.warm_web_client()
+        return self._page(request, 'index.html',
+                          settings=self.settings,
+                          contacts=self.contact_directory.list_contacts(),
+                          status=self.system_status)
+
+    async def setup(self, request):
+        """User setup page"""
+        return self._page(request, 'setup.html',
+                          settings=self.settings,
+                          user_configured=self.settings.is_user_configured())
+
+    async def setup_user(self, request):
+        """Handle user setup form"""
+        try:
+            form = await request.post()
+            username = form.get('username', '').strip()
+            display_name = form.get('display_name', '').strip()
+            password = form.get('password', '')
+
+            if not all([username, display_name, password]):
+                return self._redirect('setup', ('error', 'All fields are required'))
+
+            if len(password) < 6:
+                return self._redirect('setup', ('error', 'Password must be at least 6 characters'))
+
+            # Configure user in settings
+            self.settings.configure_user(username, display_name, password)
+
+            return self._redirect('index', ('success', f'User {username} configured successfully!'))
+
+        except Exception as e:
+            logger.error(f"Failed to setup user: {e}")
+            return self._redirect('setup', ('error', f'Setup failed: {e}'))
+
+    async def contacts(self, request):
+        """Speed dial contacts management"""
+        self.warm_web_client()
+        return self._page(request, 'contacts.html',
+                          contacts=self.contact_directory.list_contacts(),
+                          settings=self.settings)
+
+    async def add_contact(self, request):
+        """Add speed dial contact"""
+        try:
+            form = await request.post()
+            name = form.get('name', '').strip()
+            user_id = form.get('user_id', '').strip()
+            position = form.get('position', '')
+
+            if not all([name, user_id, position]):
+                return self._redirect('contacts', ('error', 'All fields are required'))
+
+            position = int(position)
+            if position < 1 or position > 4:
+                return self._redirect('contacts', ('error', 'Position must be between 1 and 4'))
+
+            # Check if position is already taken
+            if self.contact_directory.get_speed_dial(position):
+                return self._redirect('contacts', ('error', f'Position {position} is already taken'))
+
+            self.contact_directory.add_contact(name, user_id, position)
+            return self._redirect('contacts', ('success', f'Contact {name} added to position {position}'))
+
+        except ValueError:
+            return self._redirect('contacts', ('error', 'Invalid position number'))
+        except Exception as e:
+            logger.error(f"Failed to add contact: {e}")
+            return self._redirect('contacts', ('error', f'Failed to add contact: {e}'))
+
+    async def remove_contact(self, request):
+        """Remove speed dial contact"""
+        try:
+            form = await request.post()
+            contact_name = form.get('contact_name', '').strip()
+
+            if not contact_name:
+                return self._redirect('contacts', ('error', 'Contact name is required'))
+
+            if self.contact_directory.remove_contact(contact_name=contact_name):
+                return self._redirect('contacts', ('success', f'Contact {contact_name} removed'))
+            return self._redirect('contacts', ('error', f'Contact {contact_name} not found'))
+
+        except Exception as e:
+            logger.error(f"Failed to remove contact: {e}")
+            return self._redirect('contacts', ('error', f'Failed to remove contact: {e}'))
+
+    async def status(self, request):
+        """System status page"""
+        return self._render(request, 'status.html',
+                            status=self.get_system_status(),
+                            settings=self.settings)
+
+    async def config(self, request):
+        """Configuration page"""
+        return self._page(request, 'config.html', settings=self.settings)
+
+    async def save_config(self, request):
+        """Save configuration changes"""
+        try:
+            form = await request.post()
+
+            # Apply the form as one change and one write
+            with self.settings.transaction():
+                # Update web client URL
+                web_url = form.get('web_url', '').strip()
+                if web_url:
+                    self.settings.set('web_client.url', web_url)
+
+                # Update LiveKit configuration
+                livekit_url = form.get('livekit_url', '').strip()
+                livekit_key = form.get('livekit_key', '').strip()
+                livekit_secret = form.get('livekit_secret', '').strip()
+
+                if livekit_url:
+                    self.settings.set('livekit.url', livekit_url)
+                if livekit_key:
+                    self.settings.set('livekit.api_key', livekit_key)
+                if livekit_secret:
+                    self.settings.set('livekit.api_secret', livekit_secret)
+
+                self.settings.save_settings()
+            return self._redirect('config', ('success', 'Configuration saved successfully!'))
+
+        except Exception as e:
+            logger.error(f"Failed to save config: {e}")
+            return self._redirect('config', ('error', f'Failed to save configuration: {e}'))
+
+    # JSON API
+
+    async def api_status(self, request):
+        """API endpoint for system status"""
+        return web.json_response(self.get_system_status())
+
+    async def api_audio_test(self, request):
+        """API endpoint to test audio recording"""
+        if not self.audio_manager:
+            return web.json_response({"error": "Audio manager not available"}, status=503)
+
+        test_result = {"success": False, "error": None}
+        try:
+            # Test audio recording for 2 seconds
+            audio_data = await asyncio.wait_for(self.audio_manager.record_audio(duration=2.0), timeout=5)
+            if audio_data:
+                test_result["success"] = True
+                test_result["data_length"] = len(audio_data)
+            else:
+                test_result["error"] = "No audio data recorded"
+        except Exception as e:
+            test_result["error"] = str(e) or type(e).__name__
+
+        return web.json_response(test_result)
+
+    async def api_audio_level(self, request):
+        """API endpoint to get current audio input level"""
+        if not self.audio_manager:
+            return web.json_response({"error": "Audio manager not available"}, status=503)
+
+        # Sampled from the meter the capture callback keeps current
+        recording = getattr(self.audio_manager, 'recording', False)
+        levels = self.audio_manager.level_meter.get_levels() if recording else {"level": 0.0}
+        return web.json_response({
+            **levels,
+            "recording": recording,
+            "playing": getattr(self.audio_manager, 'playing', False)
+        })
+
+    async def api_start_recording(self, request):
+        """API endpoint to start call recording"""
+        try:
+            if not self.call_manager:
+                return web.json_response({"error": "Call manager not available"}, status=503)
+
+            if not hasattr(self.call_manager, 'enable_call_recording'):
+                return web.json_response({"error": "Call recording not supported"}, status=501)
+
+            if not self.call_manager.enable_call_recording():
+                return web.json_response({"error": "Failed to enable call recording"}, status=500)
+
+            # If there's an active call, start recording immediately
+            if (self.call_manager.get_call_state().value == 'connected' and
+                    hasattr(self.call_manager, 'start_call_recording')):
+                try:
+                    # Shielded: a slow start still completes after we answer
+                    recording_started = await asyncio.wait_for(
+                        asyncio.shield(self.call_manager.start_call_recording()), timeout=2.0
+                    )
+                except Exception as e:
+                    return web.json_response({"error": f"Recording failed: {e}"})
+
+                if recording_started:
+                    return web.json_response(self.recording_started_payload())
+                return web.json_response({"error": "Failed to start recording - check audio hardware"})
+
+            return web.json_response({
+                "success": True,
+                "message": "Call recording enabled. Recording will start with next call.",
+                "recording_file": self.call_manager.get_call_recording_file()
+            })
+
+        except Exception as e:
+            logger.error(f"Failed to start recording: {e}")
+            return web.json_response({"error": str(e)}, status=500)
+
+    async def api_latest_recording(self, request):
+        """API endpoint to download the last call recording (?format=pcm|raw)"""
+        try:
+            if not self.call_manager:
+                return web.json_response({"error": "Call manager not available"}, status=503)
+
+            path = self.call_manager.get_last_call_recording_file()
+            if not path or not Path(path).exists():
+                return web.json_response({"error": "No call recording available"}, status=404)
+
+            filename = Path(path).name
+            if request.query.get('format', 'pcm') == 'raw':
+                # As stored (μ-law / IMA-ADPCM WAV)
+                return web.FileResponse(path, headers={
+                    'Content-Type': 'audio/wav',
+                    'Content-Disposition': f'attachment; filename={filename}'
+                })
+
+            # Decoded to 16-bit PCM so any browser can play it (off the loop)
+            loop = asyncio.get_running_loop()
+            data = await loop.run_in_executor(None, codecs.to_pcm_wav, path)
+            return web.Response(body=data, content_type='audio/wav', headers={
+                'Content-Disposition': f'attachment; filename={filename}'
+            })
+
+        except Exception as e:
+            logger.error(f"Failed to serve call recording: {e}")
+            return web.json_response({"error": str(e)}, status=500)
+
+    async def api_play_latest_recording(self, request):
+        """API endpoint to play the last call recording on the device speaker"""
+        if not self.call_manager or not self.audio_manager:
+            return web.json_response({"error": "Audio not available"}, status=503)
+
+        path = self.call_manager.get_last_call_recording_file()
+        if not path or not Path(path).exists():
+            return web.json_response({"error": "No call recording available"}, status=404)
+
+        self._spawn(self.audio_manager.play_from_file(path))
+        return web.json_response({"success": True, "playing": Path(path).name})
+
+    async def api_uploads(self, request):
+        """API endpoint for the background upload queue"""
+        return web.json_response(self.uploads_payload())
+
+    async def api_contacts(self, request):
+        """API endpoint for the local contact directory"""
+        return web.json_response({"contacts": self.contact_directory.list_contacts(),
+                                  "directory": self.contact_directory.get_stats()})
+
+    async def api_user_search(self, request):
+        """API endpoint for the dialer: ranked user matches, local index first"""
+        payload = await self.user_search_payload(request.query.get('q', ''),
+                                                 _int_arg(request, 'limit', 10),
+                                                 request.query.get('remote', '1') != '0')
+        if payload is None:
+            return web.json_response({"error": "User manager not available"}, status=503)
+        return web.json_response(payload)
+
+    async def api_recordings(self, request):
+        """API endpoint to list indexed call recordings"""
+        store = self.call_manager.recording_store if self.call_manager else None
+        if not store:
+            return web.json_response({"error": "Recording store not available"}, status=503)
+        return web.json_response({"recordings": store.list(), "store": store.get_status()})
+
+    async def api_recording(self, request):
+        """API endpoint to stream (HTTP Range, ?format=pcm|raw) or delete a recording"""
+        store = self.call_manager.recording_store if self.call_manager else None
+        if not store:
+            return web.json_response({"error": "Recording store not available"}, status=503)
+
+        recording_id = request.match_info['recording_id']
+        path = store.get_path(recording_id)
+        if not path or not path.exists():
+            return web.json_response({"error": "Recording not found"}, status=404)
+
+        if request.method == 'DELETE':
+            store.delete(recording_id)
+            return web.json_response({"success": True})
+
+        try:
+            view = codecs.RecordingView(path, decode=request.query.get('format', 'pcm') != 'raw')
+        except Exception as e:
+            logger.error(f"Failed to open recording {recording_id}: {e}")
+            return web.json_response({"error": str(e)}, status=500)
+
+        return await self._range_response(request, view, path.name)
+
+    async def _range_response(self, request, view, filename: str, chunk_size: int = 256 * 1024):
+        """Stream a RecordingView, honouring a single HTTP byte range"""
+        try:
+            size = view.size
+            byte_range = parse_byte_range(request.headers.get('Range', ''), size)
+            if byte_range is None:
+                return web.Response(status=416, headers={'Content-Range': f'bytes */{size}'})
+            start, end, status = byte_range
+
+            response = web.StreamResponse(status=status, headers={
+                'Content-Type': 'audio/wav',
+                'Accept-Ranges': 'bytes',
+                'Content-Length': str(end - start + 1),
+                'Content-Disposition': f'inline; filename={filename}'
+            })
+            if status == 206:
+                response.headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+            await response.prepare(request)
+
+            # Decoding happens in read(), so keep it off the loop
+            loop = asyncio.get_running_loop()
+            position = start
+            while position <= end:
+                data = await loop.run_in_executor(None, view.read, position, min(position + chunk_size, end + 1))
+                if not data:
+                    break
+                position += len(data)
+                await response.write(data)
+            await response.write_eof()
+            return response
+        finally:
+            view.close()
+
+    async def api_audio_bus(self, request):
+        """API endpoint for audio bus counters and tap overruns"""
+        if not self.audio_manager:
+            return web.json_response({"error": "Audio manager not available"}, status=503)
+        return web.json_response(self.audio_manager.get_bus_stats())
+
+    async def api_audio_sounds(self, request):
+        """API endpoint to list preloaded prompts"""
+        if not self.audio_manager:
+            return web.json_response({"error": "Audio manager not available"}, status=503)
+        return web.json_response(self.audio_manager.sound_bank.get_status())
+
+    async def api_play_sound(self, request):
+        """API endpoint to play a preloaded prompt"""
+        if not self.audio_manager:
+            return web.json_response({"error": "Audio manager not available"}, status=503)
+
+        name = request.match_info['name']
+        try:
+            if not await self.audio_manager.play_sound(name):
+                return web.json_response({"error": f"Unknown prompt '{name}'"}, status=404)
+            return web.json_response({"success": True, "playing": name})
+        except Exception as e:
+            logger.error(f"Failed to play prompt: {e}")
+            return web.json_response({"error": str(e)}, status=500)
+
+    async def api_stop_sounds(self, request):
+        """API endpoint to stop all prompts"""
+        if not self.audio_manager:
+            return web.json_response({"error": "Audio manager not available"}, status=503)
+        self.audio_manager.stop_sound()
+        return web.json_response({"success": True})
+
+    async def api_audio_devices(self, request):
+        """API endpoint to get audio device information"""
+        if not self.audio_manager:
+            return web.json_response({"error": "Audio manager not available"}, status=503)
+
+        try:
+            devices = await asyncio.wait_for(self.audio_manager.get_device_info(), timeout=3)
+            return web.json_response({"devices": devices, "error": None})
+        except Exception as e:
+            return web.json_response({"devices": [], "error": str(e) or type(e).__name__})
+
+    async def api_get_current_device(self, request):
+        """API endpoint to get current audio device info"""
+        if not self.audio_manager:
+            return web.json_response({"error": "Audio manager not available"}, status=503)
+        return web.json_response({"current_device": self.audio_manager.get_current_device_info()})
+
+    async def api_set_device(self, request):
+        """API endpoint to change audio device"""
+        try:
+            if not self.audio_manager:
+                return web.json_response({"error": "Audio manager not available"}, status=503)
+
+            device_index = int(request.match_info['device_index'])
+
+            # Stop any active recording first
+            if getattr(self.audio_manager, 'recording', False):
+                await self.audio_manager.stop_recording()
+
+            # Set new device
+            self.audio_manager.set_device_index(device_index)
+
+            return web.json_response({
+                "success": True,
+                "message": f"Audio device changed to index {device_index}",
+                "device": self.audio_manager.get_current_device_info()
+            })
+
+        except Exception as e:
+            logger.error(f"Failed to set audio device: {e}")
+            return web.json_response({"error": str(e)}, status=500)
+
+    async def api_call(self, request):
+        """API endpoint to initiate call"""
+        if not self.call_manager:
+            return web.json_response({"error": "Call manager not available"}, status=503)
+
+        user_id = request.match_info['user_id']
+        # Call setup takes seconds; answer now, like the Flask server
+        self._spawn(self.call_manager.initiate_call(user_id))
+        return web.json_response({"success": True, "message": f"Call initiated to user {user_id}"})
+
+    async def api_hangup(self, request):
+        """API endpoint to hang up call"""
+        if not self.call_manager:
+            return web.json_response({"error": "Call manager not available"}, status=503)
+
+        try:
+            await self.call_manager.hang_up()
+            return web.json_response({"success": True, "message": "Call hung up"})
+        except Exception as e:
+            logger.error(f"Failed to hang up call: {e}")
+            return web.json_response({"error": str(e)}, status=500)
+
+    async def api_call_network(self, request):
+        """API endpoint for live call network quality (latest sample, series, summary)"""
+        if not self.call_manager:
+            return web.json_response({"error": "Call manager not available"}, status=503)
+        return web.json_response(self.call_network_payload())
+
+    async def api_metrics(self, request):
+        """API endpoint for application metrics (counters, gauges, recent events)"""
+        return web.json_response(metrics.snapshot(events=_int_arg(request, 'events', 50)))
+
+    async def api_web_cache(self, request):
+        """API endpoint for static asset and page cache statistics"""
+        return web.json_response({"static": self.assets.get_stats(), "pages": self.pages.get_stats()})
+
+    async def api_http_diagnostics(self, request):
+        """API endpoint for web client connection pool, circuit breaker and request latency"""
+        payload = self.http_client_payload()
+        if payload is None:
+            return web.json_response({"error": "Web client not available"}, status=503)
+        return web.json_response(payload)
+
+    async def api_loop_diagnostics(self, request):
+        """API endpoint for event loop lag histogram and slow callbacks"""
+        if not self.loop_monitor:
+            return web.json_response({"error": "Loop monitor not available"}, status=503)
+
+        include_stacks = request.query.get('stacks', '1') != '0'
+        return web.json_response(self.loop_monitor.get_stats(include_stacks=include_stacks))
+
+    async def api_loop_diagnostics_reset(self, request):
+        """API endpoint to reset event loop statistics"""
+        if not self.loop_monitor:
+            return web.json_response({"error": "Loop monitor not available"}, status=503)
+
+        self.loop_monitor.reset()
+        return web.json_response({"success": True})
+
+    async def api_flight_recorder(self, request):
+        """API endpoint to download the audio flight recorder ring
+
+        ?format=binary (default) returns a .epfr dump, ?format=timeline
+        returns the decoded timeline of the last `limit` events as JSON.
+        """
+        if not self.audio_manager:
+            return web.json_response({"error": "Audio manager not available"}, status=503)
+
+        recorder = self.audio_manager.flight_recorder
+        data = recorder.to_bytes()
+
+        if request.query.get('format') == 'timeline':
+            dump = flight_recorder.load_dump(data)
+            return web.json_response({
+                "summary": recorder.get_summary(),
+                "timeline": flight_recorder.timeline(dump, _int_arg(request, 'limit', 500))
+            })
+
+        filename = f"flight_{datetime.now().strftime('%Y%m%d_%H%M%S')}.epfr"
+        return web.Response(body=data, content_type='application/octet-stream',
+                            headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+    async def api_flight_recorder_dump(self, request):
+        """API endpoint to write the flight recorder ring to disk"""
+        if not self.audio_manager:
+            return web.json_response({"error": "Audio manager not available"}, status=503)
+
+        loop = asyncio.get_running_loop()
+        path = await loop.run_in_executor(None, self.audio_manager.flight_recorder.dump, "manual")
+        if not path:
+            return web.json_response({"error": "Failed to write flight recorder dump"}, status=500)
+
+        return web.json_response({"success": True, "path": path})
+
+    def setup_socketio_events(self):
+        """Setup Socket.IO events for real-time updates"""
+
+        @self.sio.on('connect')
+        async def handle_connect(sid, environ):
+            """Handle client connection"""
+            logger.info("Web client connected")
+
+        @self.sio.on('disconnect')
+        async def handle_disconnect(sid):
+            """Handle client disconnection"""
+            self.live.leave(sid)
+            logger.info("Web client disconnected")
+
+        @self.sio.on('get_status')
+        async def handle_get_status(sid, data=None):
+            """Handle status request (served from the topic cache)"""
+            await self.sio.emit('status_snapshot', self.live.snapshot(STATUS_TOPICS), to=sid)
+
+        @self.sio.on('subscribe')
+        async def handle_subscribe(sid, data):
+            """Join topic rooms and send their cached values"""
+            topics = self.live.join(sid, (data or {}).get('topics', []))
+            for topic in topics:
+                await self.sio.enter_room(sid, topic)
+            await self.sio.emit('status_snapshot', self.live.snapshot(topics), to=sid)
+
+        @self.sio.on('unsubscribe')
+        async def handle_unsubscribe(sid, data):
+            """Leave topic rooms"""
+            topics = self.live.valid_topics((data or {}).get('topics', []))
+            for topic in topics:
+                await self.sio.leave_room(sid, topic)
+            self.live.leave(sid, topics)
+
+    async def start(self, host='0.0.0.0'):
+        """Start serving on the running event loop"""
+        logger.info(f"Starting Pi web interface (aiohttp) on http://{host}:{self.port}")
+
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, self.port).start()
+
+        # Start pushing topic updates to subscribers
+        self.live.start()
+
+    async def stop(self):
+        """Stop the web server"""
+        logger.info("Stopping Pi web interface")
+        self.live.stop()
+        for task in list(self._tasks):
+            task.cancel()
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
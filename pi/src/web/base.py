@@ -0,0 +1,317 @@
+"""
+Shared state for the EmmaPhone2 Pi web servers
+
+Manager references, live update topics and status assembly used by both
+the Flask server (web/server.py) and the asyncio server (web/async_server.py)
+"""
+import asyncio
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+
+from config.settings import Settings
+from diagnostics.metrics import metrics
+from services.contact_directory import ContactDirectory
+from web.assets import PageCache, StaticAssets
+from web.live_updates import LiveUpdates
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_DIR = Path(__file__).parent / "templates"
+STATIC_DIR = Path(__file__).parent / "static"
+
+# Topics merged into the status object the pages render
+STATUS_TOPICS = ("call", "user", "wifi")
+
+# Settings sections read by each page that renders from settings and
+# contacts alone (base.html reads "user" for the footer)
+PAGE_SECTIONS = {
+    "index": ("user",),
+    "setup": ("user",),
+    "contacts": ("user",),
+    "config": ("user", "web_client", "livekit", "audio", "leds", "button"),
+}
+
+def parse_byte_range(header: str, size: int) -> Optional[tuple]:
+    """Resolve a Range header against a file of size bytes
+    
+    Returns (start, end, status): the whole file with 200 when there is no
+    usable header, or an inclusive range with 206. Returns None when the
+    range cannot be satisfied (416). Only the first range of a list is used.
+    """
+    if not header.startswith('bytes='):
+        return 0, size - 1, 200
+    first, _, last = header[6:].split(',')[0].strip().partition('-')
+    try:
+        if first:
+            start = int(first)
+            if last and int(last) < start:
+                return 0, size - 1, 200  # Invalid spec: ignored, as RFC 7233 requires
+            end = min(int(last), size - 1) if last else size - 1
+        elif last:
+            # Suffix range: the last N bytes
+            start, end = max(0, size - int(last)), size - 1
+        else:
+            return 0, size - 1, 200
+    except ValueError:
+        # Malformed: ignore the header rather than honour half of it
+        return 0, size - 1, 200
+    if start < 0 or start >= size:
+        return None
+    return start, end, 206
+
+class BaseWebServer:
+    """Manager references and push-based status shared by the web servers"""
+    
+    def __init__(self, settings: Settings, port: int, socketio):
+        self.settings = settings
+        self.port = port
+        
+        # Application state
+        self.call_manager = None
+        self.user_manager = None
+        self.audio_manager = None
+        self.led_controller = None
+        self.loop_monitor = None
+        self.wifi_manager = None
+        self.main_event_loop = None  # Reference to main event loop
+        self.system_status = {
+            "wifi_connected": False,
+            "user_configured": False,
+            "call_state": "idle",
+            "audio_devices": [],
+            "last_update": None
+        }
+        
+        # Push-based status and level updates
+        self.live = LiveUpdates(socketio)
+        self.setup_live_topics()
+        
+        # Precompressed static files and settings-only pages
+        self.assets = StaticAssets(STATIC_DIR, settings.config_dir / "web_cache")
+        self.assets.build()
+        self.pages = PageCache()
+        
+        # Contacts are read from the local directory, never the network
+        self.contact_directory = ContactDirectory.for_settings(settings)
+        
+    def set_managers(self, call_manager=None, user_manager=None, audio_manager=None, led_controller=None,
+                     loop_monitor=None, wifi_manager=None):
+        """Set manager instances for status monitoring"""
+        self.call_manager = call_manager
+        self.user_manager = user_manager
+        self.audio_manager = audio_manager
+        self.led_controller = led_controller
+        self.loop_monitor = loop_monitor
+        self.wifi_manager = wifi_manager
+        
+        # Push call state changes immediately rather than at the next poll
+        if call_manager:
+            previous_callback = call_manager.on_call_state_changed
+            
+            async def on_call_state_changed(old_state, new_state):
+                self.live.invalidate("call")
+                if previous_callback:
+                    await call_manager._safe_callback(previous_callback, old_state, new_state)
+            
+            call_manager.on_call_state_changed = on_call_state_changed
+        
+        # Store reference to the current event loop
+        try:
+            self.main_event_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop running, will handle this in the API calls
+            self.main_event_loop = None
+    
+    def on_settings_changed(self, changes: Dict):
+        """Push settings edits to open pages (from the settings watcher)"""
+        if any(key.startswith("user.") or key == "user" for key in changes):
+            self.live.invalidate("user")
+    
+    def page_version(self, endpoint: str) -> tuple:
+        """Cache key for a settings-only page: the versions of everything it reads"""
+        return self.settings.section_version(*PAGE_SECTIONS[endpoint]) + (self.contact_directory.version,)
+    
+    def setup_live_topics(self):
+        """Register the topics clients can subscribe to"""
+        level_hz = max(1, self.settings.get('web_server.level_hz', 10))
+        self.live.add_topic("levels", self._levels_topic, interval=1.0 / level_hz)
+        self.live.add_topic("call", self._call_topic, interval=1.0)
+        self.live.add_topic("user", self._user_topic, interval=30.0)
+        self.live.add_topic("wifi", self._wifi_topic, interval=10.0)
+        self.live.add_topic("metrics", self._metrics_topic, interval=2.0)
+    
+    def _levels_topic(self) -> Optional[Dict]:
+        """Input level from the meter, quantized so only visible changes are sent"""
+        if not self.audio_manager:
+            return None
+        recording = self.audio_manager.recording
+        levels = self.audio_manager.level_meter.get_levels() if recording else {}
+        return {
+            "level": round(levels.get("level", 0.0), 2),
+            "peak": round(levels.get("peak", 0.0), 2),
+            "rms_db": round(levels.get("rms_db", -120.0)),
+            "recording": recording,
+            "playing": self.audio_manager.playing
+        }
+    
+    def _call_topic(self) -> Dict:
+        """Call state, current call and connection to the web client"""
+        status = {"call_state": "idle", "current_call": None}
+        
+        if self.call_manager:
+            try:
+                status["call_state"] = self.call_manager.get_call_state().value
+                current_call = self.call_manager.get_current_call()
+                if current_call:
+                    status["current_call"] = {
+                        "caller_name": current_call.caller_name,
+                        "callee_name": current_call.callee_name,
+                        "state": current_call.state.value,
+                        "start_time": current_call.start_time
+                    }
+                
+                network_stats = self.call_manager.livekit_client.network_stats
+                if network_stats.running:
+                    status["network"] = network_stats.get_latest()
+                
+                status["web_client_connected"] = self.call_manager.is_connected_to_web_client()
+            except Exception as e:
+                logger.error(f"Error getting call manager status: {e}")
+        
+        return status
+    
+    def _user_topic(self) -> Dict:
+        """User configuration and contacts (rarely changes, so rarely sent)"""
+        status = {
+            "user_configured": self.settings.is_user_configured(),
+            "contacts": self.contact_directory.list_contacts()
+        }
+        
+        if self.user_manager and status["user_configured"]:
+            user_creds = self.settings.get_user_credentials()
+            status["user"] = {
+                "username": user_creds.get("username", ""),
+                "display_name": user_creds.get("display_name", ""),
+                "user_id": user_creds.get("user_id", "")
+            }
+        
+        return status
+    
+    def _wifi_topic(self) -> Optional[Dict]:
+        """WiFi state; read on the main loop and published when the commands return"""
+        if not self.wifi_manager or not self.main_event_loop:
+            # No WiFi manager (e.g. development machine): state unknown
+            return {"wifi_connected": None}
+        
+        future = asyncio.run_coroutine_threadsafe(self._read_wifi_status(), self.main_event_loop)
+        
+        def on_done(future):
+            if not future.cancelled() and future.exception() is None:
+                self.live.publish("wifi", future.result())
+        
+        future.add_done_callback(on_done)
+        return None
+    
+    async def _read_wifi_status(self) -> Dict:
+        connected = await self.wifi_manager.is_connected()
+        return {
+            "wifi_connected": connected,
+            "wifi_ssid": await self.wifi_manager.get_current_ssid() if connected else None,
+            "wifi_signal": await self.wifi_manager.get_signal_strength() if connected else 0,
+            "wifi_ap_mode": self.wifi_manager.ap_mode
+        }
+    
+    def _metrics_topic(self) -> Dict:
+        """Counters and gauges, flattened so deltas carry only the ones that moved"""
+        snapshot = metrics.snapshot(events=0)
+        flat = {f"counters.{name}": value for name, value in snapshot["counters"].items()}
+        flat.update({f"gauges.{name}": value for name, value in snapshot["gauges"].items()})
+        return flat
+    
+    def get_system_status(self) -> Dict:
+        """Get current system status"""
+        status = {
+            "timestamp": datetime.now().isoformat(),
+            "audio_devices": [],
+            "web_server_running": True,
+            "status_version": self.live.version
+        }
+        wifi = self.live.topics["wifi"]
+        if not wifi.members:
+            # Not polled without subscribers: refresh for the next status read
+            self.live.refresh("wifi")
+        status.update(wifi.data or {"wifi_connected": None})
+        status.update(self._user_topic())
+        status.update(self._call_topic())
+        
+        self.system_status = status
+        return status
+    
+    def broadcast_status_update(self):
+        """Push any status changes to subscribed clients now"""
+        for topic in STATUS_TOPICS:
+            self.live.invalidate(topic)
+    
+    def call_network_payload(self) -> Dict:
+        """Live call network quality: latest sample, series, summary and audio pipeline stats"""
+        livekit_client = self.call_manager.livekit_client
+        network_stats = livekit_client.network_stats
+        return {
+            "collecting": network_stats.running,
+            "latest": network_stats.get_latest(),
+            "series": network_stats.get_series(),
+            "summary": network_stats.get_summary(),
+            "publishing": livekit_client.publish_controller.get_status(),
+            "mixer": livekit_client.mixer.get_stats() if livekit_client.mixer else None,
+            "concealment": livekit_client.concealer.get_stats() if livekit_client.concealer else None
+        }
+    
+    def http_client_payload(self) -> Optional[Dict]:
+        """Web client connection pool, circuit breaker, per-endpoint latency and Socket.IO state"""
+        web_api = self.user_manager.web_api if self.user_manager else None
+        if not web_api:
+            return None
+        payload = web_api.get_stats()
+        web_socket = self.call_manager.web_socket if self.call_manager else None
+        payload["socket"] = web_socket.get_stats() if web_socket else None
+        return payload
+    
+    def warm_web_client(self, seconds: float = 30.0):
+        """Keep a web client connection open while someone may dial from a page (any thread)"""
+        web_api = self.user_manager.web_api if self.user_manager else None
+        if web_api and web_api.ready and self.main_event_loop:
+            self.main_event_loop.call_soon_threadsafe(web_api.keep_warm, seconds)
+    
+    async def user_search_payload(self, query: str, limit: int = 10, remote: bool = True) -> Optional[Dict]:
+        """Ranked dialer matches from the local user index (runs on the main loop)"""
+        user_search = self.user_manager.user_search if self.user_manager else None
+        if not user_search:
+            return None
+        exclude = self.settings.get("user.user_id") or None
+        if remote:
+            users = await user_search.search(self.user_manager.web_api, query, limit, exclude)
+        else:
+            users = user_search.search_local(query, limit, exclude)
+        return {"query": query, "users": users, "complete": user_search.is_covered(query)}
+    
+    def uploads_payload(self) -> Dict:
+        """Background upload queue state"""
+        queue = self.call_manager.upload_queue if self.call_manager else None
+        if not queue:
+            return {"enabled": False}
+        status = queue.get_status()
+        status["enabled"] = True
+        return status
+    
+    def recording_started_payload(self) -> Dict:
+        """Response for a call recording that just started (file and flushed pre-roll)"""
+        audio_manager = self.call_manager.audio_manager
+        preroll_bytes = len(getattr(audio_manager, 'call_recording_preroll', b''))
+        return {
+            "success": True, 
+            "message": "Call recording started",
+            "recording_file": self.call_manager.get_call_recording_file(),
+            "preroll_seconds": round(preroll_bytes / (audio_manager.CHANNELS * 2 * audio_manager.SAMPLE_RATE), 1)
+        }
@@ -0,0 +1,254 @@
+"""
+Live Updates for EmmaPhone2 Pi Web Interface
+
+Topic-based publish/subscribe over Socket.IO. Each topic (levels, call,
+wifi, user, metrics) holds its last published value and a version; a
+single background task polls topic producers at their own interval, or
+takes values pushed with publish(), and emits only the keys that changed
+to the clients subscribed to that topic (one Socket.IO room per topic).
+Changes made between ticks are coalesced into one delta.
+
+Producers are only polled while their topic has subscribers. With no
+page open the task sleeps until publish(), invalidate() or a subscribe
+wakes it, so an idle device pays nothing for the web interface.
+
+New clients get the cached values straight from the topics, so connecting
+never recomputes status. Works with both the Flask-SocketIO server and an
+asyncio python-socketio server (coroutine emit/sleep).
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+def diff(old: Dict, new: Dict):
+    """Shallow delta between two topic values: (changed keys, removed keys)"""
+    changed = {key: value for key, value in new.items() if old.get(key, _MISSING) != value}
+    removed = [key for key in old if key not in new]
+    return changed, removed
+
+class Topic:
+    """One stream of values with a version and its subscribers' room"""
+
+    def __init__(self, name: str, producer: Optional[Callable[[], Optional[Dict]]] = None,
+                 interval: Optional[float] = None):
+        self.name = name
+        self.producer = producer
+        self.interval = interval
+        self.data: Dict = {}
+        self.version = 0
+        self.pending: Optional[Dict] = None
+        self.dirty = producer is not None
+        # Poll once even without subscribers (refresh())
+        self.forced = False
+        self.next_poll = 0.0
+        self.members: set = set()
+        self.updates_sent = 0
+
+class LiveUpdates:
+    """Versioned topic cache that pushes coalesced deltas to subscribers"""
+
+    def __init__(self, socketio, tick: float = 0.05):
+        self.socketio = socketio
+        self.tick = tick
+        self.topics: Dict[str, Topic] = {}
+        self.version = 0
+        self.running = False
+        self._lock = threading.Lock()
+        self._snapshot = None
+        # Wakes the publishing task; asyncio.Event (set on its loop) or threading.Event
+        self._wake = None
+        self._loop = None
+        self.wakeups = 0
+
+    def add_topic(self, name: str, producer: Optional[Callable[[], Optional[Dict]]] = None,
+                  interval: Optional[float] = None) -> Topic:
+        """Register a topic, optionally polled from producer every interval seconds
+
+        A producer may return None when it has nothing synchronous to report
+        (e.g. it started an async fetch that will publish() the result).
+        """
+        topic = Topic(name, producer, interval)
+        self.topics[name] = topic
+        return topic
+
+    def publish(self, name: str, data: Dict):
+        """Push a topic's full current value (any thread); sent on the next tick if it changed"""
+        with self._lock:
+            self.topics[name].pending = data
+        self._wake_up()
+
+    def invalidate(self, name: str):
+        """Poll a topic's producer on the next tick instead of waiting for its interval
+
+        Topics without subscribers are polled when the next client subscribes.
+        """
+        topic = self.topics.get(name)
+        if topic:
+            topic.dirty = True
+            if topic.members:
+                self._wake_up()
+
+    def refresh(self, name: str):
+        """Poll a topic's producer on the next tick even if nobody is subscribed"""
+        topic = self.topics.get(name)
+        if topic and topic.producer:
+            topic.forced = True
+            self._wake_up()
+
+    def join(self, client: str, names: Iterable[str]) -> List[str]:
+        """Record a client's subscriptions; returns the valid topic names"""
+        names = self.valid_topics(names)
+        now = time.monotonic()
+        for name in names:
+            topic = self.topics[name]
+            topic.members.add(client)
+            if now >= topic.next_poll:
+                # Cached value is stale: send a fresh one right after the snapshot
+                topic.dirty = topic.producer is not None
+        self._wake_up()
+        return names
+
+    def leave(self, client: str, names: Optional[Iterable[str]] = None):
+        """Forget a client's subscriptions (all of them when names is None, e.g. on disconnect)"""
+        for name in self.valid_topics(names if names is not None else self.topics):
+            self.topics[name].members.discard(client)
+
+    def _wake_up(self):
+        """Wake the publishing task (any thread)"""
+        if self._wake is None:
+            return
+        if self._loop is None:
+            self._wake.set()
+            return
+        try:
+            on_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self._wake.set()
+        else:
+            try:
+                self._loop.call_soon_threadsafe(self._wake.set)
+            except RuntimeError:
+                pass  # Loop closed during shutdown
+
+    def snapshot(self, names: Optional[Iterable[str]] = None) -> Dict:
+        """Get cached topic values and versions (no producers are called)"""
+        snapshot = self._snapshot
+        if snapshot is None or snapshot["version"] != self.version:
+            snapshot = {
+                "version": self.version,
+                "topics": {name: {"version": topic.version, "data": topic.data}
+                           for name, topic in self.topics.items()}
+            }
+            self._snapshot = snapshot
+        if names is None:
+            return snapshot
+        return {
+            "version": snapshot["version"],
+            "topics": {name: snapshot["topics"][name] for name in names if name in snapshot["topics"]}
+        }
+
+    def valid_topics(self, names: Iterable[str]) -> List[str]:
+        return [name for name in names if name in self.topics]
+
+    def start(self):
+        """Start the publishing task on the Socket.IO server"""
+        if self.running:
+            return
+        self.running = True
+        if asyncio.iscoroutinefunction(self.socketio.emit):
+            self._loop = asyncio.get_running_loop()
+            self._wake = asyncio.Event()
+            self.socketio.start_background_task(self._run_async)
+        else:
+            self._wake = threading.Event()
+            self.socketio.start_background_task(self._run)
+
+    def stop(self):
+        self.running = False
+        self._wake_up()
+
+    def _run(self):
+        while self.running:
+            try:
+                for update in self._collect_changes():
+                    self.socketio.emit('topic_update', update, to=update["topic"])
+            except Exception as e:
+                logger.error(f"❌ Live update error: {e}")
+            self._wake.clear()
+            if self._wake.wait(self._next_timeout()):
+                # Woken by a change: let a burst of them settle into one delta
+                self.wakeups += 1
+                self.socketio.sleep(self.tick)
+
+    async def _run_async(self):
+        while self.running:
+            try:
+                for update in self._collect_changes():
+                    await self.socketio.emit('topic_update', update, to=update["topic"])
+            except Exception as e:
+                logger.error(f"❌ Live update error: {e}")
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), self._next_timeout())
+            except asyncio.TimeoutError:
+                continue
+            self.wakeups += 1
+            await self.socketio.sleep(self.tick)
+
+    def _next_timeout(self) -> Optional[float]:
+        """Seconds until a subscribed topic is due for polling (None: wait for a wake-up)"""
+        due = [topic.next_poll for topic in self.topics.values()
+               if topic.producer and topic.members]
+        if not due:
+            return None
+        return max(self.tick, min(due) - time.monotonic())
+
+    def _collect_changes(self) -> List[Dict]:
+        """Poll due topics and build a delta for each one whose value changed"""
+        now = time.monotonic()
+        updates = []
+        for topic in list(self.topics.values()):
+            with self._lock:
+                data, topic.pending = topic.pending, None
+
+            polled = topic.forced or (topic.members and (topic.dirty or now >= topic.next_poll))
+            if data is None and topic.producer and polled:
+                topic.dirty = topic.forced = False
+                topic.next_poll = now + (topic.interval if topic.interval is not None else 1.0)
+                data = topic.producer()
+
+            if data is None:
+                continue
+
+            changed, removed = diff(topic.data, data)
+            if not changed and not removed:
+                continue
+
+            topic.data = data
+            topic.version += 1
+            topic.updates_sent += 1
+            self.version += 1
+            updates.append({
+                "topic": topic.name,
+                "version": topic.version,
+                "changed": changed,
+                "removed": removed
+            })
+        return updates
+
+    def get_stats(self) -> Dict:
+        return {
+            "version": self.version,
+            "wakeups": self.wakeups,
+            "topics": {name: {"version": topic.version, "interval": topic.interval,
+                              "subscribers": len(topic.members), "updates_sent": topic.updates_sent}
+                       for name, topic in self.topics.items()}
+        }
@@ -10,76 +10,94 @@ from datetime import datetime
 from pathlib import Path
 from typing import Dict, Optional
 
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
-from flask_socketio import SocketIO, emit
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, Response, session
+from flask_socketio import SocketIO, emit, join_room, leave_room
 import threading
-import time
 
 from config.settings import Settings
+from diagnostics import flight_recorder
+from diagnostics.metrics import metrics
+from dsp import codecs
 from services.user_manager import UserManager
+from web.base import BaseWebServer, STATUS_TOPICS, TEMPLATE_DIR, parse_byte_range
 
 logger = logging.getLogger(__name__)
 
-class PiWebServer:
+class PiWebServer(BaseWebServer):
     """Flask web server for Pi management interface"""
     
     def __init__(self, settings: Settings, port: int = 8080):
-        self.settings = settings
-        self.port = port
+        # Static files are served from the precompressed asset cache
         self.app = Flask(__name__, 
-                        template_folder=str(Path(__file__).parent / "templates"),
-                        static_folder=str(Path(__file__).parent / "static"))
+                        template_folder=str(TEMPLATE_DIR),
+                        static_folder=None)
         
         self.app.secret_key = "emmaphone2-pi-web-interface"
         self.socketio = SocketIO(self.app, cors_allowed_origins="*")
-        
-        # Application state
-        self.call_manager = None
-        self.user_manager = None
-        self.audio_manager = None
-        self.led_controller = None
-        self.main_event_loop = None  # Reference to main event loop
-        self.system_status = {
-            "wifi_connected": False,
-            "user_configured": False,
-            "call_state": "idle",
-            "audio_devices": [],
-            "last_update": None
-        }
+        super().__init__(settings, port, self.socketio)
         
         self.setup_routes()
         self.setup_socketio_events()
         
-    def set_managers(self, call_manager=None, user_manager=None, audio_manager=None, led_controller=None):
-        """Set manager instances for status monitoring"""
-        self.call_manager = call_manager
-        self.user_manager = user_manager
-        self.audio_manager = audio_manager
-        self.led_controller = led_controller
+    def _respond(self, status: int, representation, headers: Dict) -> Response:
+        """Build a Flask response from a cached page or asset lookup"""
+        if representation is None:
+            return Response(status=status, headers=headers)
+        return Response(representation.body, status=status, headers=headers)
+    
+    def _page(self, template: str, **context) -> Response:
+        """Render a settings-only page through the page cache"""
+        endpoint = request.endpoint
         
-        # Store reference to the current event loop
-        try:
-            self.main_event_loop = asyncio.get_running_loop()
-        except RuntimeError:
-            # No event loop running, will handle this in the API calls
-            self.main_event_loop = None
+        def render():
+            return render_template(template, **context)
         
+        # Flashed messages make the page one-off
+        if session.get('_flashes'):
+            return render()
+        
+        page = self.pages.get(endpoint, self.page_version(endpoint), render)
+        return self._respond(*self.pages.respond(page,
+                                                  request.headers.get('Accept-Encoding'),
+                                                  request.headers.get('If-None-Match')))
+    
     def setup_routes(self):
         """Setup Flask routes"""
         
+        @self.app.url_defaults
+        def add_static_version(endpoint, values):
+            """Version static URLs by content so they can be cached for good"""
+            if endpoint == 'static' and 'filename' in values:
+                version = self.assets.version(values['filename'])
+                if version:
+                    values.setdefault('v', version)
+        
+        @self.app.route('/static/<path:filename>')
+        def static(filename):
+            """Precompressed static files with strong ETags"""
+            result = self.assets.lookup(filename,
+                                        request.args.get('v'),
+                                        request.headers.get('Accept-Encoding'),
+                                        request.headers.get('If-None-Match'))
+            if result is None:
+                return Response(status=404)
+            return self._respond(*result)
+        
         @self.app.route('/')
         def index():
             """Main dashboard"""
-            return render_template('index.html', 
-                                 settings=self.settings,
-                                 status=self.system_status)
+            self.warm_web_client()
+            return self._page('index.html', 
+                              settings=self.settings,
+                              contacts=self.contact_directory.list_contacts(),
+                              status=self.system_status)
         
         @self.app.route('/setup')
         def setup():
             """User setup page"""
-            return render_template('setup.html', 
-                                 settings=self.settings,
-                                 user_configured=self.settings.is_user_configured())
+            return self._page('setup.html', 
+                              settings=self.settings,
+                              user_configured=self.settings.is_user_configured())
         
         @self.app.route('/setup/user', methods=['POST'])
         def setup_user():
@@ -111,10 +129,11 @@ class PiWebServer:
         @self.app.route('/contacts')
         def contacts():
             """Speed dial contacts management"""
-            contacts = self.settings.get_contacts()
-            return render_template('contacts.html', 
-                                 contacts=contacts,
-                                 settings=self.settings)
+            self.warm_web_client()
+            contacts = self.contact_directory.list_contacts()
+            return self._page('contacts.html', 
+                              contacts=contacts,
+                              settings=self.settings)
         
         @self.app.route('/contacts/add', methods=['POST'])
         def add_contact():
@@ -134,12 +153,11 @@ class PiWebServer:
                     return redirect(url_for('contacts'))
                 
                 # Check if position is already taken
-                contacts = self.settings.get_contacts()
-                if any(c.get('speed_dial') == position for c in contacts):
+                if self.contact_directory.get_speed_dial(position):
                     flash(f'Position {position} is already taken', 'error')
                     return redirect(url_for('contacts'))
                 
-                self.settings.add_contact(name, user_id, position)
+                self.contact_directory.add_contact(name, user_id, position)
                 flash(f'Contact {name} added to position {position}', 'success')
                 
             except ValueError:
@@ -160,7 +178,7 @@ class PiWebServer:
                     flash('Contact name is required', 'error')
                     return redirect(url_for('contacts'))
                 
-                success = self.settings.remove_contact(contact_name=contact_name)
+                success = self.contact_directory.remove_contact(contact_name=contact_name)
                 if success:
                     flash(f'Contact {contact_name} removed', 'success')
                 else:
@@ -233,24 +251,13 @@ class PiWebServer:
                 if not self.audio_manager:
                     return jsonify({"error": "Audio manager not available"}), 503
                 
-                # Get actual audio level if recording is active
-                level = 0.0
-                if hasattr(self.audio_manager, 'recording') and self.audio_manager.recording:
-                    # Try to get real-time level
-                    try:
-                        if self.main_event_loop:
-                            # Schedule in main loop but don't wait
-                            future = asyncio.run_coroutine_threadsafe(
-                                self.audio_manager.get_audio_level(), 
-                                self.main_event_loop
-                            )
-                            level = future.result(timeout=0.1)  # Quick timeout
-                    except:
-                        level = 0.0
+                # Sampled from the meter the capture callback keeps current
+                recording = getattr(self.audio_manager, 'recording', False)
+                levels = self.audio_manager.level_meter.get_levels() if recording else {"level": 0.0}
                 
                 return jsonify({
-                    "level": level,
-                    "recording": getattr(self.audio_manager, 'recording', False),
+                    **levels,
+                    "recording": recording,
                     "playing": getattr(self.audio_manager, 'playing', False)
                 })
                 
@@ -284,12 +291,7 @@ class PiWebServer:
                             try:
                                 recording_started = future.result(timeout=2.0)
                                 if recording_started:
-                                    recording_file = self.call_manager.get_call_recording_file()
-                                    return jsonify({
-                                        "success": True, 
-                                        "message": "Call recording started",
-                                        "recording_file": recording_file
-                                    })
+                                    return jsonify(self.recording_started_payload())
                                 else:
                                     return jsonify({"error": "Failed to start recording - check audio hardware"})
                             except Exception as e:
@@ -309,6 +311,148 @@ class PiWebServer:
                 logger.error(f"Failed to start recording: {e}")
                 return jsonify({"error": str(e)}), 500
         
+        @self.app.route('/api/audio/recordings/latest')
+        def api_latest_recording():
+            """API endpoint to download the last call recording (?format=pcm|raw)"""
+            try:
+                if not self.call_manager:
+                    return jsonify({"error": "Call manager not available"}), 503
+                
+                path = self.call_manager.get_last_call_recording_file()
+                if not path or not Path(path).exists():
+                    return jsonify({"error": "No call recording available"}), 404
+                
+                filename = Path(path).name
+                if request.args.get('format', 'pcm') == 'raw':
+                    # As stored (μ-law / IMA-ADPCM WAV)
+                    data = Path(path).read_bytes()
+                else:
+                    # Decoded to 16-bit PCM so any browser can play it
+                    data = codecs.to_pcm_wav(path)
+                
+                return Response(data, mimetype='audio/wav', headers={
+                    'Content-Disposition': f'attachment; filename={filename}'
+                })
+                
+            except Exception as e:
+                logger.error(f"Failed to serve call recording: {e}")
+                return jsonify({"error": str(e)}), 500
+        
+        @self.app.route('/api/audio/recordings/latest/play', methods=['POST'])
+        def api_play_latest_recording():
+            """API endpoint to play the last call recording on the device speaker"""
+            if not self.call_manager or not self.audio_manager or not self.main_event_loop:
+                return jsonify({"error": "Audio not available"}), 503
+            
+            path = self.call_manager.get_last_call_recording_file()
+            if not path or not Path(path).exists():
+                return jsonify({"error": "No call recording available"}), 404
+            
+            asyncio.run_coroutine_threadsafe(self.audio_manager.play_from_file(path), self.main_event_loop)
+            return jsonify({"success": True, "playing": Path(path).name})
+        
+        @self.app.route('/api/uploads')
+        def api_uploads():
+            """API endpoint for the background upload queue"""
+            return jsonify(self.uploads_payload())
+        
+        @self.app.route('/api/contacts')
+        def api_contacts():
+            """API endpoint for the local contact directory"""
+            return jsonify({"contacts": self.contact_directory.list_contacts(),
+                            "directory": self.contact_directory.get_stats()})
+        
+        @self.app.route('/api/users/search')
+        def api_user_search():
+            """API endpoint for the dialer: ranked user matches, local index first"""
+            if not self.main_event_loop:
+                return jsonify({"error": "No event loop available"}), 503
+            # The index lives on the main loop; searching it there keeps it single-threaded
+            future = asyncio.run_coroutine_threadsafe(
+                self.user_search_payload(request.args.get('q', ''),
+                                         request.args.get('limit', 10, type=int),
+                                         request.args.get('remote', '1') != '0'),
+                self.main_event_loop
+            )
+            try:
+                payload = future.result(timeout=6.0)
+            except Exception as e:
+                return jsonify({"error": f"User search failed: {e}"}), 500
+            if payload is None:
+                return jsonify({"error": "User manager not available"}), 503
+            return jsonify(payload)
+        
+        @self.app.route('/api/recordings')
+        def api_recordings():
+            """API endpoint to list indexed call recordings"""
+            store = self.call_manager.recording_store if self.call_manager else None
+            if not store:
+                return jsonify({"error": "Recording store not available"}), 503
+            return jsonify({"recordings": store.list(), "store": store.get_status()})
+        
+        @self.app.route('/api/recordings/<recording_id>', methods=['GET', 'DELETE'])
+        def api_recording(recording_id):
+            """API endpoint to stream (HTTP Range, ?format=pcm|raw) or delete a recording"""
+            store = self.call_manager.recording_store if self.call_manager else None
+            if not store:
+                return jsonify({"error": "Recording store not available"}), 503
+            
+            path = store.get_path(recording_id)
+            if not path or not path.exists():
+                return jsonify({"error": "Recording not found"}), 404
+            
+            if request.method == 'DELETE':
+                store.delete(recording_id)
+                return jsonify({"success": True})
+            
+            try:
+                view = codecs.RecordingView(path, decode=request.args.get('format', 'pcm') != 'raw')
+            except Exception as e:
+                logger.error(f"Failed to open recording {recording_id}: {e}")
+                return jsonify({"error": str(e)}), 500
+            
+            return self._range_response(view, path.name)
+        
+        @self.app.route('/api/audio/bus')
+        def api_audio_bus():
+            """API endpoint for audio bus counters and tap overruns"""
+            if not self.audio_manager:
+                return jsonify({"error": "Audio manager not available"}), 503
+            return jsonify(self.audio_manager.get_bus_stats())
+        
+        @self.app.route('/api/audio/sounds')
+        def api_audio_sounds():
+            """API endpoint to list preloaded prompts"""
+            if not self.audio_manager:
+                return jsonify({"error": "Audio manager not available"}), 503
+            return jsonify(self.audio_manager.sound_bank.get_status())
+        
+        @self.app.route('/api/audio/sounds/<name>/play', methods=['POST'])
+        def api_play_sound(name):
+            """API endpoint to play a preloaded prompt"""
+            try:
+                if not self.audio_manager or not self.main_event_loop:
+                    return jsonify({"error": "Audio manager not available"}), 503
+                
+                future = asyncio.run_coroutine_threadsafe(
+                    self.audio_manager.play_sound(name), self.main_event_loop
+                )
+                if not future.result(timeout=2):
+                    return jsonify({"error": f"Unknown prompt '{name}'"}), 404
+                return jsonify({"success": True, "playing": name})
+                
+            except Exception as e:
+                logger.error(f"Failed to play prompt: {e}")
+                return jsonify({"error": str(e)}), 500
+        
+        @self.app.route('/api/audio/sounds/stop', methods=['POST'])
+        def api_stop_sounds():
+            """API endpoint to stop all prompts"""
+            if not self.audio_manager:
+                return jsonify({"error": "Audio manager not available"}), 503
+            self.audio_manager.stop_sound()
+            return jsonify({"success": True})
+        
         @self.app.route('/api/audio/devices')
         def api_audio_devices():
             """API endpoint to get audio device information"""
@@ -469,34 +613,117 @@ class PiWebServer:
                 logger.error(f"Failed to hang up call: {e}")
                 return jsonify({"error": str(e)}), 500
         
+        @self.app.route('/api/call/network')
+        def api_call_network():
+            """API endpoint for live call network quality (latest sample, series, summary)"""
+            if not self.call_manager:
+                return jsonify({"error": "Call manager not available"}), 503
+            return jsonify(self.call_network_payload())
+        
+        @self.app.route('/api/metrics')
+        def api_metrics():
+            """API endpoint for application metrics (counters, gauges, recent events)"""
+            events = request.args.get('events', 50, type=int)
+            return jsonify(metrics.snapshot(events=events))
+        
+        @self.app.route('/api/web/cache')
+        def api_web_cache():
+            """API endpoint for static asset and page cache statistics"""
+            return jsonify({"static": self.assets.get_stats(), "pages": self.pages.get_stats()})
+        
+        @self.app.route('/api/diagnostics/http')
+        def api_http_diagnostics():
+            """API endpoint for web client connection pool, circuit breaker and request latency"""
+            payload = self.http_client_payload()
+            if payload is None:
+                return jsonify({"error": "Web client not available"}), 503
+            return jsonify(payload)
+        
+        @self.app.route('/api/diagnostics/loop')
+        def api_loop_diagnostics():
+            """API endpoint for event loop lag histogram and slow callbacks"""
+            if not self.loop_monitor:
+                return jsonify({"error": "Loop monitor not available"}), 503
+            
+            include_stacks = request.args.get('stacks', '1') != '0'
+            return jsonify(self.loop_monitor.get_stats(include_stacks=include_stacks))
+        
+        @self.app.route('/api/diagnostics/loop/reset', methods=['POST'])
+        def api_loop_diagnostics_reset():
+            """API endpoint to reset event loop statistics"""
+            if not self.loop_monitor:
+                return jsonify({"error": "Loop monitor not available"}), 503
+            
+            self.loop_monitor.reset()
+            return jsonify({"success": True})
+        
+        @self.app.route('/api/diagnostics/flight-recorder')
+        def api_flight_recorder():
+            """API endpoint to download the audio flight recorder ring
+
+            ?format=binary (default) returns a .epfr dump, ?format=timeline
+            returns the decoded timeline of the last `limit` events as JSON.
+            """
+            if not self.audio_manager:
+                return jsonify({"error": "Audio manager not available"}), 503
+            
+            recorder = self.audio_manager.flight_recorder
+            data = recorder.to_bytes()
+            
+            if request.args.get('format') == 'timeline':
+                limit = request.args.get('limit', 500, type=int)
+                dump = flight_recorder.load_dump(data)
+                return jsonify({
+                    "summary": recorder.get_summary(),
+                    "timeline": flight_recorder.timeline(dump, limit)
+                })
+            
+            filename = f"flight_{datetime.now().strftime('%Y%m%d_%H%M%S')}.epfr"
+            return Response(data, mimetype='application/octet-stream',
+                            headers={"Content-Disposition": f"attachment; filename={filename}"})
+        
+        @self.app.route('/api/diagnostics/flight-recorder/dump', methods=['POST'])
+        def api_flight_recorder_dump():
+            """API endpoint to write the flight recorder ring to disk"""
+            if not self.audio_manager:
+                return jsonify({"error": "Audio manager not available"}), 503
+            
+            path = self.audio_manager.flight_recorder.dump("manual")
+            if not path:
+                return jsonify({"error": "Failed to write flight recorder dump"}), 500
+            
+            return jsonify({"success": True, "path": path})
+        
         @self.app.route('/config')
         def config():
             """Configuration page"""
-            return render_template('config.html', 
-                                 settings=self.settings)
+            return self._page('config.html', 
+                              settings=self.settings)
         
         @self.app.route('/config/save', methods=['POST'])
         def save_config():
             """Save configuration changes"""
             try:
-                # Update web client URL
-                web_url = request.form.get('web_url', '').strip()
-                if web_url:
-                    self.settings.set('web_client.url', web_url)
-                
-                # Update LiveKit configuration
-                livekit_url = request.form.get('livekit_url', '').strip()
-                livekit_key = request.form.get('livekit_key', '').strip()
-                livekit_secret = request.form.get('livekit_secret', '').strip()
-                
-                if livekit_url:
-                    self.settings.set('livekit.url', livekit_url)
-                if livekit_key:
-                    self.settings.set('livekit.api_key', livekit_key)
-                if livekit_secret:
-                    self.settings.set('livekit.api_secret', livekit_secret)
-                
-                self.settings.save_settings()
+                # Apply the form as one change and one write
+                with self.settings.transaction():
+                    # Update web client URL
+                    web_url = request.form.get('web_url', '').strip()
+                    if web_url:
+                        self.settings.set('web_client.url', web_url)
+                    
+                    # Update LiveKit configuration
+                    livekit_url = request.form.get('livekit_url', '').strip()
+                    livekit_key = request.form.get('livekit_key', '').strip()
+                    livekit_secret = request.form.get('livekit_secret', '').strip()
+                    
+                    if livekit_url:
+                        self.settings.set('livekit.url', livekit_url)
+                    if livekit_key:
+                        self.settings.set('livekit.api_key', livekit_key)
+                    if livekit_secret:
+                        self.settings.set('livekit.api_secret', livekit_secret)
+                    
+                    self.settings.save_settings()
                 flash('Configuration saved successfully!', 'success')
                 
             except Exception as e:
@@ -512,74 +739,63 @@ class PiWebServer:
         def handle_connect():
             """Handle client connection"""
             logger.info("Web client connected")
-            emit('status_update', self.get_system_status())
         
         @self.socketio.on('disconnect')
         def handle_disconnect():
             """Handle client disconnection"""
+            self.live.leave(request.sid)
             logger.info("Web client disconnected")
         
         @self.socketio.on('get_status')
         def handle_get_status():
-            """Handle status request"""
-            emit('status_update', self.get_system_status())
+            """Handle status request (served from the topic cache)"""
+            emit('status_snapshot', self.live.snapshot(STATUS_TOPICS))
+        
+        @self.socketio.on('subscribe')
+        def handle_subscribe(data):
+            """Join topic rooms and send their cached values"""
+            topics = self.live.join(request.sid, (data or {}).get('topics', []))
+            for topic in topics:
+                join_room(topic)
+            emit('status_snapshot', self.live.snapshot(topics))
+        
+        @self.socketio.on('unsubscribe')
+        def handle_unsubscribe(data):
+            """Leave topic rooms"""
+            topics = self.live.valid_topics((data or {}).get('topics', []))
+            for topic in topics:
+                leave_room(topic)
+            self.live.leave(request.sid, topics)
     
-    def get_system_status(self) -> Dict:
-        """Get current system status"""
-        status = {
-            "timestamp": datetime.now().isoformat(),
-            "wifi_connected": True,  # TODO: Get actual WiFi status
-            "user_configured": self.settings.is_user_configured(),
-            "call_state": "idle",
-            "current_call": None,
-            "contacts": self.settings.get_contacts(),
-            "audio_devices": [],
-            "web_server_running": True
-        }
-        
-        # Get call manager status
-        if self.call_manager:
-            try:
-                status["call_state"] = self.call_manager.get_call_state().value
-                current_call = self.call_manager.get_current_call()
-                if current_call:
-                    status["current_call"] = {
-                        "caller_name": current_call.caller_name,
-                        "callee_name": current_call.callee_name,
-                        "state": current_call.state.value,
-                        "start_time": current_call.start_time
-                    }
-                status["web_client_connected"] = self.call_manager.is_connected_to_web_client()
-            except Exception as e:
-                logger.error(f"Error getting call manager status: {e}")
-        
-        # Get audio device status
-        if self.audio_manager:
+    def _range_response(self, view, filename: str, chunk_size: int = 256 * 1024):
+        """Stream a RecordingView, honouring a single HTTP byte range"""
+        size = view.size
+        byte_range = parse_byte_range(request.headers.get('Range', ''), size)
+        if byte_range is None:
+            view.close()
+            return Response(status=416, headers={'Content-Range': f'bytes */{size}'})
+        start, end, status = byte_range
+        
+        def generate():
             try:
-                # This would be async, so we'll skip for now or handle differently
-                pass
-            except Exception as e:
-                logger.error(f"Error getting audio status: {e}")
-        
-        # Get user info
-        if self.user_manager and self.settings.is_user_configured():
-            user_creds = self.settings.get_user_credentials()
-            status["user"] = {
-                "username": user_creds.get("username", ""),
-                "display_name": user_creds.get("display_name", ""),
-                "user_id": user_creds.get("user_id", "")
-            }
-        
-        self.system_status = status
-        return status
-    
-    def broadcast_status_update(self):
-        """Broadcast status update to all connected clients"""
-        try:
-            status = self.get_system_status()
-            self.socketio.emit('status_update', status)
-        except Exception as e:
-            logger.error(f"Failed to broadcast status update: {e}")
+                position = start
+                while position <= end:
+                    data = view.read(position, min(position + chunk_size, end + 1))
+                    if not data:
+                        break
+                    position += len(data)
+                    yield data
+            finally:
+                view.close()
+        
+        headers = {
+            'Accept-Ranges': 'bytes',
+            'Content-Length': str(end - start + 1),
+            'Content-Disposition': f'inline; filename={filename}'
+        }
+        if status == 206:
+            headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+        return Response(generate(), status=status, mimetype='audio/wav', headers=headers)
     
     def run(self, host='0.0.0.0', debug=False):
         """Run the web server"""
@@ -590,14 +806,8 @@ class PiWebServer:
         werkzeug_logger = py_logging.getLogger('werkzeug')
         werkzeug_logger.setLevel(py_logging.WARNING)
         
-        # Start status update thread
-        def status_updater():
-            while True:
-                time.sleep(5)  # Update every 5 seconds
-                self.broadcast_status_update()
-        
-        status_thread = threading.Thread(target=status_updater, daemon=True)
-        status_thread.start()
+        # Start pushing topic updates to subscribers
+        self.live.start()
         
         # Run Flask-SocketIO server
         self.socketio.run(self.app, host=host, port=self.port, debug=debug, allow_unsafe_werkzeug=True, log_output=False)
@@ -605,4 +815,5 @@ class PiWebServer:
     def stop(self):
         """Stop the web server"""
         logger.info("Stopping Pi web interface")
+        self.live.stop()
         # Flask-SocketIO doesn't have a clean stop method, we'll rely on process termination
\ No newline at end of file
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Test Upload Queue for EmmaPhone2 Pi
+
+Runs the stand-in receiver locally and checks that queued files arrive
+intact, that uploads pause while "in a call", and that an interrupted
+upload resumes from the saved offset after a restart
+"""
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+
+# Add src directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from aiohttp import web
+
+from services.web_client import WebClientAPI
+from services.upload_queue import UploadQueue
+from upload_receiver import create_app
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+PORT = 8091
+
+async def test_upload_queue():
+    """Upload a file through the queue with a pause and a restart"""
+
+    print("🧪 Testing EmmaPhone2 Pi Upload Queue")
+    print("=" * 50)
+
+    work_dir = tempfile.mkdtemp(prefix="emmaphone_upload_test_")
+    storage_dir = os.path.join(work_dir, "received")
+    source = os.path.join(work_dir, "recording.wav")
+    queue_file = os.path.join(work_dir, "queue.json")
+    with open(source, "wb") as f:
+        f.write(os.urandom(600 * 1024))
+
+    # Start the stand-in receiver
+    runner = web.AppRunner(create_app(storage_dir))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", PORT).start()
+
+    web_api = WebClientAPI(f"http://127.0.0.1:{PORT}")
+    await web_api.initialize()
+    url = f"http://127.0.0.1:{PORT}/uploads"
+
+    try:
+        # 1. Start "in a call": nothing should be sent
+        in_call = True
+        queue = UploadQueue(web_api, url, queue_file=queue_file, chunk_size_kb=64,
+                            max_kbps=4000, is_busy=lambda: in_call)
+        await queue.start()
+        await queue.enqueue(source, "recording", {"call_id": "test"})
+        await asyncio.sleep(1.5)
+        print(f"⏸️  Paused during call: {queue.paused}, offset {queue.pending[0]['offset']}")
+
+        # 2. Call ends: upload starts; stop part way through
+        in_call = False
+        while queue.pending and queue.pending[0]["offset"] < 200 * 1024:
+            await asyncio.sleep(0.05)
+        await queue.stop()
+        print(f"⏹️  Stopped at offset {queue.pending[0]['offset'] if queue.pending else 'done'}")
+
+        # 3. Restart from the persisted queue and let it finish
+        queue = UploadQueue(web_api, url, queue_file=queue_file, chunk_size_kb=64, max_kbps=4000)
+        await queue.start()
+        for _ in range(100):
+            if not queue.pending:
+                break
+            await asyncio.sleep(0.1)
+        await queue.stop()
+
+        received = os.path.join(storage_dir, "recording", "recording.wav")
+        with open(source, "rb") as a, open(received, "rb") as b:
+            intact = a.read() == b.read()
+        print(f"✅ Received intact: {intact}" if intact else "❌ Received file differs")
+
+    finally:
+        await web_api.close()
+        await runner.cleanup()
+
+if __name__ == "__main__":
+    asyncio.run(test_upload_queue())
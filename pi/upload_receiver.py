@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Local stand-in upload receiver for EmmaPhone2 Pi
+
+Implements the resumable chunk protocol used by services/upload_queue.py so
+uploads can be tested without the real backend. Received files are stored
+under the given directory once their SHA-256 matches.
+
+Usage:
+    python3 upload_receiver.py [--port 8090] [--dir /tmp/emmaphone_uploads]
+
+Then set "uploads": {"enabled": true, "url": "http://<host>:8090/uploads"}
+in ~/.emmaphone/settings.json
+"""
+import argparse
+import hashlib
+import json
+import logging
+import re
+from pathlib import Path
+
+from aiohttp import web
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+)|bytes \*/(\d+)")
+
+def create_app(storage_dir: str) -> web.Application:
+    """Build the receiver app storing uploads in storage_dir"""
+    storage = Path(storage_dir)
+    partial = storage / ".partial"
+    partial.mkdir(parents=True, exist_ok=True)
+
+    def part_path(upload_id: str) -> Path:
+        return partial / re.sub(r"[^A-Za-z0-9]", "_", upload_id)
+
+    async def status(request):
+        path = part_path(request.match_info["upload_id"])
+        if not path.exists():
+            return web.json_response({"offset": 0}, status=404)
+        return web.json_response({"offset": path.stat().st_size})
+
+    async def put_chunk(request):
+        upload_id = request.match_info["upload_id"]
+        path = part_path(upload_id)
+        offset = path.stat().st_size if path.exists() else 0
+
+        match = CONTENT_RANGE.fullmatch(request.headers.get("Content-Range", ""))
+        if not match:
+            return web.json_response({"error": "Content-Range required"}, status=400)
+
+        if match.group(4) is not None:
+            start, total = 0, int(match.group(4))
+        else:
+            start, total = int(match.group(1)), int(match.group(3))
+            if start != offset:
+                return web.json_response({"offset": offset}, status=409)
+
+        data = await request.read()
+        with open(path, "ab") as f:
+            f.write(data)
+        offset += len(data)
+
+        complete = offset >= total
+        if complete:
+            digest = hashlib.sha256(path.read_bytes()).hexdigest()
+            expected = request.headers.get("X-Upload-Sha256")
+            if expected and digest != expected:
+                path.unlink()
+                logger.error(f"Checksum mismatch for {upload_id}, discarded")
+                return web.json_response({"offset": 0}, status=409)
+
+            filename = Path(request.headers.get("X-Upload-Filename", upload_id)).name
+            kind = request.headers.get("X-Upload-Kind", "other")
+            destination = storage / kind / filename
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            path.replace(destination)
+
+            metadata = request.headers.get("X-Upload-Metadata")
+            if metadata:
+                destination.with_suffix(destination.suffix + ".json").write_text(
+                    json.dumps(json.loads(metadata), indent=2)
+                )
+            logger.info(f"✅ Received {kind}/{filename} ({total} bytes)")
+        else:
+            logger.info(f"📥 {upload_id}: {offset}/{total} bytes")
+
+        return web.json_response({"offset": offset, "complete": complete})
+
+    app = web.Application(client_max_size=16 * 1024 * 1024)
+    app.router.add_get("/uploads/{upload_id}", status)
+    app.router.add_put("/uploads/{upload_id}", put_chunk)
+    return app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="EmmaPhone2 stand-in upload receiver")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--dir", default="/tmp/emmaphone_uploads")
+    args = parser.parse_args()
+
+    logger.info(f"Receiving uploads into {args.dir} on port {args.port}")
+    web.run_app(create_app(args.dir), port=args.port)
@@ -127,6 +127,10 @@ function optionalAuth(req, res, next) {
 // Store connected users for call signaling
 const connectedUsers = new Map(); // userId -> socketId
 const activeUsers = new Map();    // socketId -> userInfo
+const pendingCalls = new Map();   // userId -> { invitation, expiresAt } until answered
+
+// How long an unanswered invitation is re-sent to a callee that reconnects
+const CALL_INVITE_TTL_MS = 30000;
 
 // Routes
 app.get('/', optionalAuth, (req, res) => {
@@ -522,14 +526,18 @@ app.post('/api/initiate-call', requireAuth, async (req, res) => {
     console.log(`Call initiated from ${fromUser} to ${toUser} in room ${roomName}`);
 
     // Send call invitation to target user
-    io.to(targetSocketId).emit('incoming-call', {
+    const invitation = {
       from: fromUser,
       fromName: req.session.user.displayName || req.session.user.username,
       roomName: roomName,
       calleeToken: calleeToken,
       callLogId: callLogId,
       wsUrl: process.env.LIVEKIT_URL || 'ws://localhost:7880'
-    });
+    };
+    io.to(targetSocketId).emit('incoming-call', invitation);
+
+    // The callee's socket may be dropping right now; keep the invitation for its reconnect
+    pendingCalls.set(toUser, { invitation, expiresAt: Date.now() + CALL_INVITE_TTL_MS });
 
     res.json({
       success: true,
@@ -672,11 +680,14 @@ try {
 }
 
 // Setup Socket.IO on HTTP server (HTTPS certs not available in dev)
+// Short heartbeats so a dead connection is noticed (and redialed) within 15s
 const io = new Server(httpServer, {
   cors: {
     origin: "*",
     methods: ["GET", "POST"]
-  }
+  },
+  pingInterval: 10000,
+  pingTimeout: 5000
 });
 
 console.log('Socket.IO server attached to HTTP server on port', PORT);
@@ -693,17 +704,40 @@ io.on('connection', (socket) => {
     
     console.log(`User ${userId} registered with socket ${socket.id}`);
     
+    let pending = pendingCalls.get(userId);
+    if (pending && pending.expiresAt < Date.now()) {
+      pendingCalls.delete(userId);
+      pending = null;
+    }
+    
     // Send list of online users (for future contact status)
     socket.emit('user-registered', { 
       success: true, 
       userId: userId,
-      onlineUsers: Array.from(connectedUsers.keys())
+      onlineUsers: Array.from(connectedUsers.keys()),
+      pendingCall: pending ? pending.invitation.callLogId : null
+    });
+    
+    // An invitation sent while this user was reconnecting may never have arrived
+    if (pending) {
+      socket.emit('incoming-call', pending.invitation);
+    }
+  });
+
+  // Pi clients answer with accept-call / reject-call
+  ['accept-call', 'reject-call'].forEach((event) => {
+    socket.on(event, () => {
+      const userInfo = activeUsers.get(socket.id);
+      if (userInfo) {
+        pendingCalls.delete(userInfo.userId);
+      }
     });
   });
 
   // Handle call responses
   socket.on('call-response', (response) => {
     const { accepted, callData } = response;
+    pendingCalls.delete(callData.to);
     
     if (accepted) {
       console.log(`Call accepted by ${callData.to}`);